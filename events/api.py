@@ -13,25 +13,33 @@ from functools import partial
 
 # django and drf
 from django.db.transaction import atomic
-from django.http import Http404, HttpResponsePermanentRedirect
+from django.http import FileResponse, Http404, HttpResponsePermanentRedirect, StreamingHttpResponse
 from django.utils import translation
 from django.core.exceptions import PermissionDenied
 from django.db.utils import IntegrityError
 from django.conf import settings
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.gdal import CoordTransform, SpatialReference
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
 from django.core.urlresolvers import NoReverseMatch
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
 from django.utils.encoding import force_text
+from django.utils.functional import cached_property
 from rest_framework import (
-    serializers, relations, viewsets, mixins, filters, generics, permissions
+    serializers, relations, viewsets, mixins, filters, generics, permissions, status
 )
+from rest_framework.decorators import action
 from rest_framework.filters import BaseFilterBackend
 from rest_framework.permissions import SAFE_METHODS
 from rest_framework.settings import api_settings
 from rest_framework.reverse import reverse
 from rest_framework.response import Response
-from rest_framework.exceptions import ParseError, PermissionDenied as DRFPermissionDenied, APIException
+from rest_framework.exceptions import (
+    ParseError, PermissionDenied as DRFPermissionDenied, APIException, NotAuthenticated
+)
 from rest_framework.views import get_view_name as original_get_view_name
 from rest_framework.routers import APIRootView
 from rest_framework.fields import DateTimeField
@@ -47,7 +55,6 @@ from munigeo.api import (
 from munigeo.models import AdministrativeDivision
 from rest_framework_bulk import BulkListSerializer, BulkModelViewSet
 import pytz
-import bleach
 import django_filters
 
 from django_orghierarchy.models import Organization
@@ -56,6 +63,7 @@ from django_orghierarchy.models import Organization
 from events import utils
 from events.api_pagination import LargeResultsSetPagination
 from events.auth import ApiKeyAuth, ApiKeyUser
+from events.docx_export import EventExport, get_export_job, get_export_locations, get_export_storage, start_export_job
 from events.custom_elasticsearch_search_backend import (
     CustomEsSearchQuerySet as SearchQuerySet
 )
@@ -66,7 +74,11 @@ from events.models import (
 )
 from events.translation import EventTranslationOptions
 from helevents.models import User
-from events.renderers import DOCXRenderer
+from events.ical import FEED_FILTERS as ICAL_FEED_FILTERS, iter_vevents
+from events.renderers import DOCXRenderer, ICalendarRenderer
+from events.renderers.ical import iter_calendar
+from events.sanitization import clean_text_fields
+from events.sql import event_time_window_where
 
 
 def get_view_name(view):
@@ -159,6 +171,70 @@ def get_authenticated_data_source_and_publisher(request):
     return data_source, publisher
 
 
+class PublisherContext(object):
+    """
+    The data source and publisher a request is authenticated for, and the organizations its user may
+    publish for. Resolved once per request and shared by the view and all the serializers of the request,
+    so that e.g. the validation of each event in a bulk update does not repeat the queries.
+    """
+    def __init__(self, request):
+        self.request = request
+        self.user = request.user
+        self._can_edit_event = {}
+
+    @cached_property
+    def authenticated_data_source_and_publisher(self):
+        return get_authenticated_data_source_and_publisher(self.request)
+
+    @property
+    def data_source(self):
+        return self.authenticated_data_source_and_publisher[0]
+
+    @property
+    def publisher(self):
+        return self.authenticated_data_source_and_publisher[1]
+
+    @cached_property
+    def owned_system_ids(self):
+        """Ids of the data sources of the publisher, whose objects the request may edit"""
+        if self.publisher is None:
+            return set()
+        return set(self.publisher.owned_systems.values_list('id', flat=True))
+
+    @cached_property
+    def admin_organizations(self):
+        """Organizations the user may set as publisher: admin organizations, their descendants and replacements"""
+        organizations = set(self.user.get_admin_organizations_and_descendants())
+        return organizations | set(organization.replaced_by for organization in organizations)
+
+    @cached_property
+    def admin_tree_ids(self):
+        if not self.user or not self.user.is_authenticated:
+            return set()
+        return self.user.get_admin_tree_ids()
+
+    @cached_property
+    def organization_ids(self):
+        """The result of get_organization_ids() of the user"""
+        return self.user.get_organization_ids()
+
+    def can_edit_event(self, publisher, publication_status):
+        key = (publisher.pk if publisher else None, publication_status)
+        if key not in self._can_edit_event:
+            self._can_edit_event[key] = self.user.can_edit_event(publisher, publication_status)
+        return self._can_edit_event[key]
+
+
+def get_publisher_context(request):
+    """
+    Return the publisher context of the request, resolving it on the first call.
+    """
+    context = getattr(request, '_publisher_context', None)
+    if context is None or context.user is not request.user:
+        context = request._publisher_context = PublisherContext(request)
+    return context
+
+
 def get_publisher_query(publisher):
     """Get query for publisher (Organization)
 
@@ -191,22 +267,6 @@ def get_publisher_query(publisher):
     return q
 
 
-def clean_text_fields(data, allowed_html_fields=[]):
-    for k, v in data.items():
-        if isinstance(v, str) and any(c in v for c in '<>&'):
-            # only specified fields may contain allowed tags
-            for field_name in allowed_html_fields:
-                # check all languages and the default translation field too
-                if k.startswith(field_name):
-                    data[k] = bleach.clean(v, settings.BLEACH_ALLOWED_TAGS)
-                    break
-            else:
-                data[k] = bleach.clean(v)
-                # for non-html data, ampersands should be bare
-                data[k] = data[k].replace('&amp;', '&')
-    return data
-
-
 class JSONLDRelatedField(relations.HyperlinkedRelatedField):
     """
     Support of showing and saving of expanded JSON nesting or just a resource
@@ -240,6 +300,9 @@ class JSONLDRelatedField(relations.HyperlinkedRelatedField):
             # To avoid infinite recursion, only include sub/super events one level at a time
             if 'include' in context:
                 context['include'] = [x for x in context['include'] if x != 'sub_events' and x != 'super_event']
+            # sparse fieldsets only apply to the top level objects
+            context.pop('only_fields', None)
+            context.pop('omit_fields', None)
             return self.related_serializer(obj, hide_ld_context=self.hide_ld_context,
                                            context=context).data
         link = super(JSONLDRelatedField, self).to_representation(obj)
@@ -485,13 +548,22 @@ class LinkedEventsSerializer(TranslatedModelSerializer, MPTTModelSerializer):
                 field.expanded = True
             # query allows additional fields to be skipped
             self.skip_fields |= context.get('skip_fields', set())
+            # sparse fieldsets only build the selected fields
+            self.only_fields = context.get('only_fields')
+            self.omit_fields = context.get('omit_fields') or set()
+            if self.only_fields is not None or self.omit_fields:
+                for field_name in list(self.fields):
+                    if not self.is_field_selected(field_name):
+                        del self.fields[field_name]
+                self.translated_fields = [f for f in self.translated_fields if self.is_field_selected(f)]
 
         self.hide_ld_context = hide_ld_context
 
         if self.method in permissions.SAFE_METHODS:
             return
         # post and put methods need further authentication
-        self.data_source, self.publisher = get_authenticated_data_source_and_publisher(self.request)
+        self.publisher_context = get_publisher_context(self.request)
+        self.data_source, self.publisher = self.publisher_context.data_source, self.publisher_context.publisher
         if not self.publisher:
             raise PermissionDenied(_("User doesn't belong to any organization"))
         if instance:
@@ -500,6 +572,9 @@ class LinkedEventsSerializer(TranslatedModelSerializer, MPTTModelSerializer):
             if not instance.is_user_editable() or not instance.can_be_edited_by(self.user):
                 raise PermissionDenied()
 
+    def is_field_selected(self, field_name):
+        return is_field_selected(field_name, getattr(self, 'only_fields', None), getattr(self, 'omit_fields', ()))
+
     def to_internal_value(self, data):
         for field in self.system_generated_fields:
             if field in data:
@@ -558,7 +633,7 @@ class LinkedEventsSerializer(TranslatedModelSerializer, MPTTModelSerializer):
             if value != self.data_source:
                 # the event might be from another data source by the same organization, and we are only editing it
                 if self.instance:
-                    if self.publisher.owned_systems.filter(id=value).exists():
+                    if value.pk in self.publisher_context.owned_system_ids:
                         return value
                 raise serializers.ValidationError(
                     {'data_source': _(
@@ -570,9 +645,7 @@ class LinkedEventsSerializer(TranslatedModelSerializer, MPTTModelSerializer):
 
     def validate_publisher(self, value):
         if value:
-            if value not in (set(self.user.get_admin_organizations_and_descendants())
-                             | set(map(lambda x: getattr(x, 'replaced_by'),
-                                   self.user.get_admin_organizations_and_descendants()))):
+            if value not in self.publisher_context.admin_organizations:
                 raise serializers.ValidationError(
                     {'publisher': _(
                         "Setting publisher to %(given)s " +
@@ -673,25 +746,84 @@ def _text_qset_by_translated_field(field, val):
     return qset
 
 
+def parse_sparse_fieldsets(params):
+    """
+    Parse the fields and omit parameters selecting the fields to serialize.
+
+    :return: tuple of the set of fields to include, or None for all fields, and the set of fields to omit
+    """
+    only_fields = params.get('fields')
+    if only_fields is not None:
+        # the id is needed for the @id link
+        only_fields = {x.strip() for x in only_fields.split(',') if x.strip()} | {'id'}
+    omit_fields = {x.strip() for x in params.get('omit', '').split(',') if x.strip()} - {'id'}
+    return only_fields, omit_fields
+
+
+def is_field_selected(field_name, only_fields=None, omit_fields=()):
+    if only_fields is not None and field_name not in only_fields:
+        return False
+    return field_name not in omit_fields
+
+
 class JSONAPIViewMixin(object):
+    # model fields that are always loaded, even if their serializer fields are not selected
+    sparse_loaded_fields = ('lft', 'rght', 'tree_id', 'level')
+    # related objects the view prefetches, by serializer field name
+    sparse_prefetches = {}
+
     def initial(self, request, *args, **kwargs):
         ret = super().initial(request, *args, **kwargs)
         self.srs = srid_to_srs(self.request.query_params.get('srid', None))
+        if request.method in SAFE_METHODS:
+            self.only_fields, self.omit_fields = parse_sparse_fieldsets(self.request.query_params)
+        else:
+            self.only_fields, self.omit_fields = None, set()
         return ret
 
+    def is_field_selected(self, field_name):
+        return is_field_selected(field_name, getattr(self, 'only_fields', None), getattr(self, 'omit_fields', ()))
+
+    def apply_sparse_fieldsets(self, queryset):
+        """
+        Defer the columns and skip the prefetches of the serializer fields that are not selected.
+        """
+        if getattr(self, 'only_fields', None) is None and not getattr(self, 'omit_fields', None):
+            return queryset
+        model = queryset.model
+        # translation fields (e.g. description_fi) are selected by the translated field (description)
+        translated = {}
+        try:
+            for field_name, translation_fields in translator.get_options_for_model(model).fields.items():
+                translated.update((field.name, field_name) for field in translation_fields)
+        except NotRegistered:
+            pass
+        deferred = []
+        for field in model._meta.concrete_fields:
+            # foreign keys are needed for select_related and are cheap to load
+            if field.primary_key or field.is_relation or field.name in self.sparse_loaded_fields:
+                continue
+            if not self.is_field_selected(translated.get(field.name, field.name)):
+                deferred.append(field.name)
+        if self.sparse_prefetches:
+            queryset = queryset.prefetch_related(None)
+            for field_name, lookups in self.sparse_prefetches.items():
+                if self.is_field_selected(field_name):
+                    queryset = queryset.prefetch_related(*lookups)
+        return queryset.defer(*deferred)
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         # user admin ids must be injected to the context for nested serializers, to avoid duplicating work
         user = context['request'].user
-        admin_tree_ids = set()
-        if user and user.is_authenticated:
-            admin_tree_ids = user.get_admin_tree_ids()
         context['user'] = user
-        context['admin_tree_ids'] = admin_tree_ids
+        context['admin_tree_ids'] = get_publisher_context(context['request']).admin_tree_ids
         include = self.request.query_params.get('include', '')
         context['include'] = [x.strip() for x in include.split(',') if x]
         context['srs'] = self.srs
         context.setdefault('skip_fields', set()).add('origin_id')
+        context['only_fields'] = getattr(self, 'only_fields', None)
+        context['omit_fields'] = getattr(self, 'omit_fields', set())
         return context
 
 
@@ -752,7 +884,7 @@ class KeywordListViewSet(JSONAPIViewMixin, mixins.ListModelMixin, viewsets.Gener
             if u'\x00' in val:
                 raise ParseError("A string literal cannot contain NUL (0x00) characters.")
             queryset = queryset.filter(_text_qset_by_translated_field('name', val))
-        return queryset
+        return self.apply_sparse_fieldsets(queryset)
 
 
 register_view(KeywordRetrieveViewSet, 'keyword')
@@ -821,8 +953,7 @@ def filter_division(queryset, name, value):
 
     """
 
-    ocd_ids = []
-    names = []
+    keys = []
     for item in value:
         if ':' in item:
             # we have a munigeo division
@@ -834,19 +965,16 @@ def filter_division(queryset, name, value):
                             item = settings.MUNIGEO_MUNI + '/' + item
                         item = settings.MUNIGEO_COUNTRY + '/' + item
                     item = 'ocd-division/' + item
-            ocd_ids.append(item)
+            keys.append(item)
         else:
-            # we assume human name
-            names.append(item.title())
+            # we assume human name, matched in any language
+            keys.append(item.lower())
+    # name refers to the division keys of places (see Place.division_keys), an array in the database
+    # and a multi-valued field in the search index
     if hasattr(queryset, 'distinct'):
-        return (queryset.filter(**{name + '__ocd_id__in': ocd_ids}) |
-                queryset.filter(**{name + '__name__in': names})).distinct()
+        return queryset.filter(**{name + '__overlap': keys})
     else:
-        # Haystack SearchQuerySet does not support distinct, so we only support one type of search at a time:
-        if ocd_ids:
-            return queryset.filter(**{name + '__ocd_id__in': ocd_ids})
-        else:
-            return queryset.filter(**{name + '__name__in': names})
+        return queryset.filter(**{name + '__in': keys})
 
 
 class PlaceSerializer(LinkedEventsSerializer, GeoModelSerializer):
@@ -857,11 +985,65 @@ class PlaceSerializer(LinkedEventsSerializer, GeoModelSerializer):
 
     class Meta:
         model = Place
-        exclude = ('n_events_changed',)
+        exclude = ('n_events_changed', 'division_keys')
+
+
+def parse_dwithin_origin(val, srs=None):
+    """
+    Parse a point given as "x,y" in the given spatial reference system (WGS84 by default)
+    and return it in the projection used for storing positions.
+    """
+    try:
+        x, y = [float(coord) for coord in val.split(',')]
+    except ValueError:
+        raise ParseError(_('dwithin_origin must be given as two comma-separated coordinates.'))
+    srs = srs or srid_to_srs(None)
+    origin = Point(x, y, srid=srs.srid)
+    if srs.srid != settings.PROJECTION_SRID:
+        origin.transform(CoordTransform(srs, SpatialReference(settings.PROJECTION_SRID)))
+    return origin
+
+
+def filter_dwithin(queryset, params, position_field, srs=None):
+    """
+    Filter queryset by distance of position_field from the dwithin_origin parameter. The lookup is a spatial
+    join that can use the GiST index of the position column.
+    """
+    origin = params.get('dwithin_origin', None)
+    metres = params.get('dwithin_metres', None)
+    if not origin and not metres:
+        return queryset
+    if not origin or not metres:
+        raise ParseError(_('dwithin_origin and dwithin_metres must be given together.'))
+    try:
+        metres = float(metres)
+    except ValueError:
+        raise ParseError(_('dwithin_metres must be a number.'))
+    if metres <= 0:
+        raise ParseError(_('dwithin_metres must be positive.'))
+    origin = parse_dwithin_origin(origin, srs)
+    return queryset.filter(**{'%s__dwithin' % position_field: (origin, D(m=metres))})
+
+
+class DistanceOrderingFilter(filters.OrderingFilter):
+    """
+    Allows ordering by the distance of position_field from the point given in dwithin_origin.
+    """
+    position_field = 'position'
+
+    def filter_queryset(self, request, queryset, view):
+        ordering = self.get_ordering(request, queryset, view) or []
+        if 'distance' in ordering or '-distance' in ordering:
+            origin = request.query_params.get('dwithin_origin', None)
+            if not origin:
+                raise ParseError(_('Ordering by distance requires dwithin_origin.'))
+            origin = parse_dwithin_origin(origin, getattr(view, 'srs', None))
+            queryset = queryset.annotate(distance=Distance(self.position_field, origin))
+        return super().filter_queryset(request, queryset, view)
 
 
 class PlaceFilter(django_filters.rest_framework.FilterSet):
-    division = django_filters.Filter(name='divisions', lookup_expr='in',
+    division = django_filters.Filter(name='division_keys',
                                      widget=django_filters.widgets.CSVWidget(),
                                      method='filter_division')
 
@@ -900,10 +1082,11 @@ class PlaceListViewSet(JSONAPIViewMixin, GeoModelAPIView,
     queryset = Place.objects.all()
     queryset = queryset.select_related('publisher')
     serializer_class = PlaceSerializer
-    filter_backends = (django_filters.rest_framework.DjangoFilterBackend, filters.OrderingFilter)
+    filter_backends = (django_filters.rest_framework.DjangoFilterBackend, DistanceOrderingFilter)
     filter_class = PlaceFilter
-    ordering_fields = ('n_events', 'id', 'name', 'data_source', 'street_address', 'postal_code')
+    ordering_fields = ('n_events', 'id', 'name', 'data_source', 'street_address', 'postal_code', 'distance')
     ordering = ('-n_events', '-data_source', 'name')  # we want to display tprek before osoite etc.
+    sparse_prefetches = {'divisions': ('divisions__type', 'divisions__municipality')}
 
     def get_queryset(self):
         """
@@ -918,6 +1101,7 @@ class PlaceListViewSet(JSONAPIViewMixin, GeoModelAPIView,
         filter (only places containing the specified string are included)
         show_all_places (places without events are included)
         show_deleted (deleted places are included)
+        dwithin_origin, dwithin_metres (only places within the given distance of the given point are included)
         """
         queryset = Place.objects.prefetch_related('divisions__type', 'divisions__municipality')
         data_source = self.request.query_params.get('data_source')
@@ -939,7 +1123,9 @@ class PlaceListViewSet(JSONAPIViewMixin, GeoModelAPIView,
                 raise ParseError("A string literal cannot contain NUL (0x00) characters.")
             qset = _text_qset_by_translated_field('name', val) | _text_qset_by_translated_field('street_address', val)
             queryset = queryset.filter(qset)
-        return queryset
+
+        queryset = filter_dwithin(queryset, self.request.query_params, 'position', self.srs)
+        return self.apply_sparse_fieldsets(queryset)
 
 
 register_view(PlaceRetrieveViewSet, 'place')
@@ -1110,7 +1296,7 @@ class ImageViewSet(JSONAPIViewMixin, viewsets.ModelViewSet):
 
     def perform_destroy(self, instance):
         # ensure image can only be deleted within the organization
-        data_source, organization = get_authenticated_data_source_and_publisher(self.request)
+        organization = get_publisher_context(self.request).publisher
         if not organization == instance.publisher:
             raise PermissionDenied()
         super().perform_destroy(instance)
@@ -1165,7 +1351,9 @@ class EventSerializer(LinkedEventsSerializer, GeoModelAPIView):
 
         if self.context:
             for ext in self.context.get('extensions', ()):
-                self.fields['extension_{}'.format(ext.identifier)] = ext.get_extension_serializer()
+                field_name = 'extension_{}'.format(ext.identifier)
+                if self.is_field_selected(field_name):
+                    self.fields[field_name] = ext.get_extension_serializer()
 
     def parse_datetimes(self, data):
         # here, we also set has_start_time and has_end_time accordingly
@@ -1198,7 +1386,7 @@ class EventSerializer(LinkedEventsSerializer, GeoModelAPIView):
             if not id_data_source_prefix == self.data_source.id:
                 # the event might be from another data source by the same organization, and we are only editing it
                 if self.instance:
-                    if self.publisher.owned_systems.filter(id=id_data_source_prefix).exists():
+                    if id_data_source_prefix in self.publisher_context.owned_system_ids:
                         return value
                 raise serializers.ValidationError(
                     {'id': _(
@@ -1402,18 +1590,18 @@ class EventSerializer(LinkedEventsSerializer, GeoModelAPIView):
             ret['start_time_obj'] = obj.start_time
             ret['location'] = obj.location
 
-        if obj.start_time and not obj.has_start_time:
+        if obj.start_time and not obj.has_start_time and 'start_time' in ret:
             # Return only the date part
             ret['start_time'] = obj.start_time.astimezone(LOCAL_TZ).strftime('%Y-%m-%d')
-        if obj.end_time and not obj.has_end_time:
+        if obj.end_time and not obj.has_end_time and 'end_time' in ret:
             # If we're storing only the date part, do not pretend we have the exact time.
             # Timestamp is of the form %Y-%m-%dT00:00:00, so we report the previous date.
             ret['end_time'] = (obj.end_time - timedelta(days=1)).astimezone(LOCAL_TZ).strftime('%Y-%m-%d')
             # Unless the event is short, then no need for end time
             if obj.start_time and obj.end_time - obj.start_time <= timedelta(days=1):
                 ret['end_time'] = None
-        del ret['has_start_time']
-        del ret['has_end_time']
+        ret.pop('has_start_time', None)
+        ret.pop('has_end_time', None)
         if hasattr(obj, 'days_left'):
             ret['days_left'] = int(obj.days_left)
         if self.skip_empties:
@@ -1428,12 +1616,12 @@ class EventSerializer(LinkedEventsSerializer, GeoModelAPIView):
         request = self.context.get('request')
         if request:
             if not request.user.is_authenticated:
-                del ret['publication_status']
+                ret.pop('publication_status', None)
         return ret
 
     class Meta:
         model = Event
-        exclude = ['deleted']
+        exclude = ['deleted', 'duration', 'in_language_ids', 'translation_languages']
         list_serializer_class = BulkListSerializer
 
 
@@ -1463,15 +1651,8 @@ class LinkedEventsOrderingFilter(filters.OrderingFilter):
     ordering_param = 'sort'
 
 
-class EventOrderingFilter(LinkedEventsOrderingFilter):
-    def filter_queryset(self, request, queryset, view):
-        queryset = super(EventOrderingFilter, self).filter_queryset(request, queryset, view)
-        ordering = self.get_ordering(request, queryset, view)
-        if not ordering:
-            ordering = []
-        if 'duration' in ordering:
-            queryset = queryset.extra(select={'duration': 'end_time - start_time'})
-        return queryset
+class EventOrderingFilter(LinkedEventsOrderingFilter, DistanceOrderingFilter):
+    position_field = 'location__position'
 
 
 def parse_duration_string(duration):
@@ -1500,10 +1681,43 @@ def parse_duration_string(duration):
     return int(val) * mul
 
 
-def _filter_event_queryset(queryset, params, srs=None):
+def _filter_event_keywords(queryset, name, keyword_ids, exclude=False):
+    """
+    Filter events having any of the given keywords or audiences, or with exclude, none of them.
+    Uses EXISTS subqueries, so no DISTINCT is needed.
+    """
+    has_keyword = Exists(Event.keywords.through.objects.filter(event=OuterRef('pk'), keyword__in=keyword_ids))
+    has_audience = Exists(Event.audience.through.objects.filter(event=OuterRef('pk'), keyword__in=keyword_ids))
+    keyword_name, audience_name = 'has_%s_keywords' % name, 'has_%s_audience' % name
+    queryset = queryset.annotate(**{keyword_name: has_keyword, audience_name: has_audience})
+    if exclude:
+        return queryset.filter(**{keyword_name: False, audience_name: False})
+    return queryset.filter(Q(**{keyword_name: True}) | Q(**{audience_name: True}))
+
+
+def _filter_event_time_window(queryset, start, end, public=False):
+    """
+    Filter events happening between start and end, either of which may be None.
+    If public is set, the queryset only contains public events.
+    """
+    if not start and not end:
+        return queryset
+    if public and start and not end:
+        # the most common listing, served by the partial indexes of public events
+        return queryset.upcoming(start)
+    if start and end and start >= end:
+        # an empty or inverted window is not a valid range, so compare the times separately
+        return queryset.filter(Q(end_time__gt=start) | Q(start_time__gte=start)).filter(
+            Q(end_time__lt=end) | Q(start_time__lte=end))
+    where, where_params = event_time_window_where(start, end)
+    return queryset.extra(where=[where], params=where_params)
+
+
+def _filter_event_queryset(queryset, params, srs=None, public=False):
     """
     Filter events queryset by params
     (e.g. self.request.query_params in EventViewSet)
+    Set public if the queryset only contains public events.
     """
     # Filter by string (case insensitive). This searches from all fields
     # which are marked translatable in translation.py
@@ -1549,18 +1763,17 @@ def _filter_event_queryset(queryset, params, srs=None):
         end = (today + timedelta(days=days)).isoformat()
 
     if start:
-        dt = utils.parse_time(start, is_start=True)[0]
-        queryset = queryset.filter(Q(end_time__gt=dt) | Q(start_time__gte=dt))
-
+        start = utils.parse_time(start, is_start=True)[0]
     if end:
-        dt = utils.parse_time(end, is_start=False)[0]
-        queryset = queryset.filter(Q(end_time__lt=dt) | Q(start_time__lte=dt))
+        end = utils.parse_time(end, is_start=False)[0]
+    queryset = _filter_event_time_window(queryset, start, end, public=public)
 
     val = params.get('bbox', None)
     if val:
-        bbox_filter = build_bbox_filter(srs, val, 'position')
-        places = Place.geo_objects.filter(**bbox_filter)
-        queryset = queryset.filter(location__in=places)
+        bbox_filter = build_bbox_filter(srs, val, 'location__position')
+        queryset = queryset.filter(**bbox_filter)
+
+    queryset = filter_dwithin(queryset, params, 'location__position', srs)
 
     # Filter by data source, multiple sources separated by comma
     val = params.get('data_source', None)
@@ -1584,7 +1797,19 @@ def _filter_event_queryset(queryset, params, srs=None):
     val = params.get('keyword', None)
     if val:
         val = val.split(',')
-        queryset = queryset.filter(Q(keywords__pk__in=val) | Q(audience__pk__in=val)).distinct()
+        queryset = _filter_event_keywords(queryset, 'keyword', val)
+
+    # Filter by keyword ids, all of which the event must have
+    val = params.get('keyword_AND', None)
+    if val:
+        for i, keyword_id in enumerate(val.split(',')):
+            queryset = _filter_event_keywords(queryset, 'keyword_and_%d' % i, [keyword_id])
+
+    # Negative filter by keyword id, multiple ids separated by comma
+    val = params.get('keyword!', None)
+    if val:
+        val = val.split(',')
+        queryset = _filter_event_keywords(queryset, 'keyword_not', val, exclude=True)
 
     # filter only super or non-super events. to be deprecated?
     val = params.get('recurring', None)
@@ -1602,14 +1827,12 @@ def _filter_event_queryset(queryset, params, srs=None):
     val = params.get('max_duration', None)
     if val:
         dur = parse_duration_string(val)
-        cond = 'end_time - start_time <= %s :: interval'
-        queryset = queryset.extra(where=[cond], params=[str(dur)])
+        queryset = queryset.filter(duration__lte=timedelta(seconds=dur))
 
     val = params.get('min_duration', None)
     if val:
         dur = parse_duration_string(val)
-        cond = 'end_time - start_time >= %s :: interval'
-        queryset = queryset.extra(where=[cond], params=[str(dur)])
+        queryset = queryset.filter(duration__gte=timedelta(seconds=dur))
 
     # Filter by publisher, multiple sources separated by comma
     val = params.get('publisher', None)
@@ -1629,43 +1852,20 @@ def _filter_event_queryset(queryset, params, srs=None):
     val = params.get('language', None)
     if val:
         val = val.split(',')
-        q = Q()
-        for lang in val:
-            if lang in utils.get_fixed_lang_codes():
-                # check string content if language has translations available
-                name_arg = {'name_' + lang + '__isnull': False}
-                desc_arg = {'description_' + lang + '__isnull': False}
-                short_desc_arg = {'short_description_' + lang + '__isnull': False}
-                q = q | Q(in_language__id=lang) | Q(**name_arg) | Q(**desc_arg) | Q(**short_desc_arg)
-            else:
-                q = q | Q(in_language__id=lang)
-        queryset = queryset.filter(q)
+        queryset = queryset.filter(Q(in_language_ids__overlap=val) | Q(translation_languages__overlap=val))
 
     # Filter by in_language field only
     val = params.get('in_language', None)
     if val:
         val = val.split(',')
-        q = Q()
-        for lang in val:
-            q = q | Q(in_language__id=lang)
-        queryset = queryset.filter(q)
+        queryset = queryset.filter(in_language_ids__overlap=val)
 
     # Filter by translation only
     val = params.get('translation', None)
     if val:
+        # languages without translations simply match no events
         val = val.split(',')
-        q = Q()
-        for lang in val:
-            if lang in utils.get_fixed_lang_codes():
-                # check string content if language has translations available
-                name_arg = {'name_' + lang + '__isnull': False}
-                desc_arg = {'description_' + lang + '__isnull': False}
-                short_desc_arg = {'short_description_' + lang + '__isnull': False}
-                q = q | Q(**name_arg) | Q(**desc_arg) | Q(**short_desc_arg)
-            else:
-                # language has no translations, matching condition must be false
-                q = q | Q(pk__in=[])
-        queryset = queryset.filter(q)
+        queryset = queryset.filter(translation_languages__overlap=val)
 
     # Filter by audience min age
     val = params.get('audience_min_age', None)
@@ -1715,7 +1915,7 @@ def in_or_null_filter(field_name, queryset, name, value):
 
 
 class EventFilter(django_filters.rest_framework.FilterSet):
-    division = django_filters.Filter(name='location__divisions',
+    division = django_filters.Filter(name='location__division_keys',
                                      widget=django_filters.widgets.CSVWidget(),
                                      method=filter_division)
     super_event_type = django_filters.Filter(name='super_event_type',
@@ -1748,18 +1948,32 @@ class EventViewSet(JSONAPIViewMixin, BulkModelViewSet, viewsets.ReadOnlyModelVie
     filter_backends = (EventOrderingFilter, django_filters.rest_framework.DjangoFilterBackend,
                        EventExtensionFilterBackend)
     filter_class = EventFilter
-    ordering_fields = ('start_time', 'end_time', 'duration', 'last_modified_time', 'name')
+    ordering_fields = ('start_time', 'end_time', 'duration', 'last_modified_time', 'name', 'distance')
     ordering = ('-last_modified_time',)
-    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [DOCXRenderer]
+    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES + [DOCXRenderer, ICalendarRenderer]
+    # needed by EventSerializer.to_representation regardless of the selected fields
+    sparse_loaded_fields = JSONAPIViewMixin.sparse_loaded_fields + (
+        'start_time', 'end_time', 'has_start_time', 'has_end_time')
+    sparse_prefetches = {
+        'offers': ('offers',),
+        'keywords': ('keywords',),
+        'audience': ('audience',),
+        'images': ('images', 'images__publisher'),
+        'external_links': ('external_links',),
+        'sub_events': ('sub_events',),
+        'in_language': ('in_language',),
+    }
 
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.publisher_context = None
         self.data_source = None
         self.organization = None
 
     def initial(self, request, *args, **kwargs):
         super().initial(request, *args, **kwargs)
-        self.data_source, self.organization = get_authenticated_data_source_and_publisher(request)
+        self.publisher_context = get_publisher_context(request)
+        self.data_source, self.organization = self.publisher_context.data_source, self.publisher_context.publisher
 
     @staticmethod
     def get_serializer_class_for_version(version):
@@ -1779,11 +1993,15 @@ class EventViewSet(JSONAPIViewMixin, BulkModelViewSet, viewsets.ReadOnlyModelVie
         return context
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = self.apply_sparse_fieldsets(super().get_queryset())
+        if not self.is_field_selected('location'):
+            queryset = queryset.select_related(None).select_related('publisher')
         context = self.get_serializer_context()
         # prefetch extra if the user want them included
         if 'include' in context:
             for included in context['include']:
+                if not self.is_field_selected(included):
+                    continue
                 if included == 'location':
                     queryset = queryset.prefetch_related('location__divisions',
                                                          'location__divisions__type',
@@ -1821,26 +2039,30 @@ class EventViewSet(JSONAPIViewMixin, BulkModelViewSet, viewsets.ReadOnlyModelVie
         original_queryset = super(EventViewSet, self).filter_queryset(queryset)
 
         if self.request.method in SAFE_METHODS:
-            # we cannot use distinct for performance reasons
-            public_queryset = original_queryset.filter(publication_status=PublicationStatus.PUBLIC)
-            editable_queryset = original_queryset.none()
-            if self.request.user.is_authenticated:
-                editable_queryset = self.request.user.get_editable_events(original_queryset)
             # by default, only public events are shown in the event list
-            queryset = public_queryset
+            queryset = original_queryset.public()
+            public = True
             # however, certain query parameters allow customizing the listing for authenticated users
-            if 'show_all' in self.request.query_params:
-                # displays all editable events, including drafts, and public non-editable events
-                queryset = editable_queryset | public_queryset
+            user = self.request.user
             if 'admin_user' in self.request.query_params:
                 # displays all editable events, including drafts, but no other public events
-                queryset = editable_queryset
+                if user.is_authenticated:
+                    queryset = user.get_editable_events(original_queryset, self.publisher_context.organization_ids)
+                else:
+                    queryset = original_queryset.none()
+                public = False
+            elif 'show_all' in self.request.query_params and user.is_authenticated:
+                # displays all editable events, including drafts, and public non-editable events
+                queryset = user.get_visible_events(original_queryset, self.publisher_context.organization_ids)
+                public = False
         else:
             # prevent changing events user does not have write permissions (for bulk operations)
-            queryset = self.request.user.get_editable_events(original_queryset)
+            queryset = self.request.user.get_editable_events(original_queryset,
+                                                             self.publisher_context.organization_ids)
+            public = False
 
         queryset = _filter_event_queryset(queryset, self.request.query_params,
-                                          srs=self.srs)
+                                          srs=self.srs, public=public)
         return queryset.filter()
 
     def allow_bulk_destroy(self, qs, filtered):
@@ -1866,7 +2088,7 @@ class EventViewSet(JSONAPIViewMixin, BulkModelViewSet, viewsets.ReadOnlyModelVie
             org = self.organization
             if hasattr(event_data, 'publisher'):
                 org = event_data['publisher']
-            if not self.request.user.can_edit_event(org, event_data['publication_status']):
+            if not self.publisher_context.can_edit_event(org, event_data['publication_status']):
                 raise DRFPermissionDenied()
 
         super().perform_update(serializer)
@@ -1889,7 +2111,7 @@ class EventViewSet(JSONAPIViewMixin, BulkModelViewSet, viewsets.ReadOnlyModelVie
             org = self.organization
             if hasattr(event_data, 'publisher'):
                 org = event_data['publisher']
-            if not self.request.user.can_edit_event(org, event_data['publication_status']):
+            if not self.publisher_context.can_edit_event(org, event_data['publication_status']):
                 raise DRFPermissionDenied()
 
         super().perform_create(serializer)
@@ -1903,26 +2125,77 @@ class EventViewSet(JSONAPIViewMixin, BulkModelViewSet, viewsets.ReadOnlyModelVie
             raise DRFPermissionDenied()
         instance.soft_delete()
 
+    @staticmethod
+    def get_calendar_language():
+        # the language parameter filters events, so calendars are in the language of the request
+        languages = utils.get_fixed_lang_codes()
+        language = (translation.get_language() or '')[:2]
+        return language if language in languages else languages[0]
+
+    def retrieve(self, request, *args, **kwargs):
+        if request.accepted_renderer.format == 'ics':
+            event = self.get_object()
+            return Response(iter_vevents(Event.objects.filter(pk=event.pk), self.get_calendar_language()))
+        return super().retrieve(request, *args, **kwargs)
+
     def list(self, request, *args, **kwargs):
+        # calendars of large listings are streamed, serializing only the events not cached
+        if request.accepted_renderer.format == 'ics':
+            if not any(request.query_params.get(param) for param in ICAL_FEED_FILTERS):
+                raise ParseError({'detail': _('Must specify a location, keyword or publisher when fetching a '
+                                              'calendar.')})
+            queryset = self.filter_queryset(self.get_queryset())
+            vevents = iter_vevents(queryset, self.get_calendar_language())
+            return StreamingHttpResponse(iter_calendar(vevents), content_type='text/calendar; charset=utf-8')
         # docx renderer has additional requirements for listing events
         if request.accepted_renderer.format == 'docx':
             if not request.query_params.get('location'):
                 raise ParseError(
                     {'detail': _('Must specify a location when fetching DOCX file.')})
             queryset = self.filter_queryset(self.get_queryset())
-            if queryset.count() == 0:
+            events, locations, location_id = get_export_locations(queryset)
+            if events == 0:
                 raise ParseError({'detail': _('No events.')})
-            if len(set([event.location for event in queryset])) > 1:
+            if locations > 1:
                 raise ParseError({'detail': _('Only one location allowed.')})
-            serializer = self.get_serializer(queryset, many=True)
-            return Response(serializer.data)
+            export = EventExport(queryset, Place.objects.get(pk=location_id))
+            if request.query_params.get('background'):
+                # the result is only available to the user who started the job
+                if not request.user.is_authenticated:
+                    raise NotAuthenticated()
+                job_id = start_export_job(request.user.pk, export, request.query_params.get('start'),
+                                          request.query_params.get('end'))
+                url = reverse('event-docx-export', kwargs={'job_id': job_id}, request=request)
+                return Response({'status': 'pending', 'url': url}, status=status.HTTP_202_ACCEPTED)
+            return Response(export)
         return super().list(request, *args, **kwargs)
 
+    @action(detail=False, url_path=r'docx_export/(?P<job_id>[0-9a-f]{32})', url_name='docx-export',
+            renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES)
+    def docx_export(self, request, job_id=None, *args, **kwargs):
+        job = get_export_job(job_id, request.user.pk)
+        if job is None:
+            raise Http404("Export does not exist")
+        data = {'status': job['status']}
+        if job['status'] == 'done':
+            data['url'] = reverse('event-docx-export-file', kwargs={'job_id': job_id}, request=request)
+        return Response(data, status=status.HTTP_202_ACCEPTED if job['status'] == 'pending' else status.HTTP_200_OK)
+
+    @action(detail=False, url_path=r'docx_export/(?P<job_id>[0-9a-f]{32})/file', url_name='docx-export-file',
+            renderer_classes=api_settings.DEFAULT_RENDERER_CLASSES)
+    def docx_export_file(self, request, job_id=None, *args, **kwargs):
+        job = get_export_job(job_id, request.user.pk)
+        if job is None or job['status'] != 'done':
+            raise Http404("Export does not exist")
+        response = FileResponse(get_export_storage().open(job['file']), content_type=DOCXRenderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename=%s' % job['file'].split('/')[-1]
+        return response
+
     def finalize_response(self, request, response, *args, **kwargs):
         # Switch to normal renderer for docx errors.
         response = super().finalize_response(request, response, *args, **kwargs)
-        # Prevent rendering errors as DOCX files
-        if response.status_code != 200 and request.accepted_renderer.format == 'docx':
+        # Prevent rendering errors and background export jobs as DOCX files or calendars
+        if response.status_code != 200 and request.accepted_renderer.format in ('docx', 'ics'):
             first_renderer = self.renderer_classes[0]()
             response.accepted_renderer = first_renderer
             response.accepted_media_type = first_renderer.media_type
@@ -2009,7 +2282,7 @@ class SearchViewSet(JSONAPIViewMixin, GeoModelAPIView, viewsets.ViewSetMixin, ge
         if len(models) == 1 and Event in models:
             division = params.get('division', None)
             if division:
-                queryset = filter_division(queryset, 'location__divisions', division)
+                queryset = filter_division(queryset, 'divisions', division.split(','))
 
             start = params.get('start', None)
             if start:
@@ -2037,7 +2310,7 @@ class SearchViewSet(JSONAPIViewMixin, GeoModelAPIView, viewsets.ViewSetMixin, ge
         if len(models) == 1 and Place in models:
             division = params.get('division', None)
             if division:
-                queryset = filter_division(queryset, 'divisions', division)
+                queryset = filter_division(queryset, 'divisions', division.split(','))
 
         if len(models) > 0:
             queryset = queryset.models(*list(models))
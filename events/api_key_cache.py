@@ -0,0 +1,58 @@
+"""
+Short-lived, process-local cache of the data sources and users authenticated by API keys, so that
+requests with API keys do not need to query them.
+
+The keys are stored hashed. Entries expire after API_KEY_CACHE_TIMEOUT seconds, and are invalidated
+in all processes by incrementing a generation in the cache shared by them (see CACHE_URL) whenever a data
+source, an API key user or an organization owning data sources changes. Each authentication reads the
+generation from the shared cache.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+API_KEY_GENERATION_KEY = 'api-key-generation'
+
+# hashed API key: (expiry time, generation, data source, user)
+_entries = {}
+
+
+def hash_api_key(api_key):
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+def get_generation():
+    return cache.get_or_set(API_KEY_GENERATION_KEY, 1, None)
+
+
+def get_cached_credentials(api_key, generation):
+    """
+    Return the cached data source and user of the API key, or None if they are not cached.
+    """
+    entry = _entries.get(hash_api_key(api_key))
+    if entry is None:
+        return None
+    expires, entry_generation, data_source, user = entry
+    if expires < time.monotonic() or entry_generation != generation:
+        return None
+    return data_source, user
+
+
+def cache_credentials(api_key, generation, data_source, user):
+    _entries[hash_api_key(api_key)] = (time.monotonic() + settings.API_KEY_CACHE_TIMEOUT, generation,
+                                       data_source, user)
+
+
+def invalidate_api_keys():
+    """
+    Invalidate the cached credentials, called whenever a data source, an API key user or an organization
+    is written.
+    """
+    _entries.clear()
+    try:
+        cache.incr(API_KEY_GENERATION_KEY)
+    except ValueError:
+        # a new generation, even if the previous one was evicted
+        cache.set(API_KEY_GENERATION_KEY, int(time.time()), None)
@@ -1,6 +1,109 @@
+import hashlib
+import json
+from functools import partial
+
 from rest_framework.response import Response
 from collections import OrderedDict
 from rest_framework import pagination
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator
+from django.db import connections, transaction
+from django.db.models.query import QuerySet
+from django.utils.functional import cached_property
+
+# exact: COUNT(*) of the filtered queryset
+# cached: exact counts cached by request signature until the next write or the timeout
+# estimate: planner estimates for large results, exact counts for small ones
+COUNT_STRATEGIES = ('exact', 'cached', 'estimate')
+COUNT_GENERATION_KEY = 'pagination-count-generation'
+# query parameters that do not change the count
+UNCOUNTED_PARAMS = {'page', 'page_size', 'sort', 'include', 'format', 'count', 'compact_links'}
+
+
+def invalidate_cached_counts():
+    """
+    Invalidate all cached counts, called whenever event data is written.
+    """
+    try:
+        cache.incr(COUNT_GENERATION_KEY)
+    except ValueError:
+        cache.set(COUNT_GENERATION_KEY, 1, None)
+
+
+def invalidate_cached_counts_on_commit():
+    """
+    Invalidate all cached counts when the current transaction commits, once however much it writes.
+    """
+    connection = transaction.get_connection()
+    # a rolled back transaction discards its callbacks, so a later write registers the callback again
+    if not any(func is invalidate_cached_counts for savepoints, func in connection.run_on_commit):
+        transaction.on_commit(invalidate_cached_counts)
+
+
+def get_count_signature(request):
+    """
+    Normalize the request to the filters determining the count: the path, the filter parameters in a
+    canonical order and the user, who may see drafts in addition to public data.
+    """
+    params = sorted((key, sorted(values)) for key, values in request.query_params.lists()
+                    if key not in UNCOUNTED_PARAMS)
+    user = request.user.pk if request.user and request.user.is_authenticated else None
+    signature = json.dumps([request.path, params, user])
+    return hashlib.sha1(signature.encode('utf-8')).hexdigest()
+
+
+def estimate_count(queryset):
+    """
+    Return the number of rows the database planner estimates the queryset to return.
+    """
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class CountStrategyPaginator(Paginator):
+    """
+    Paginator counting the objects with the given strategy. approximate_count tells whether the count is
+    an estimate.
+    """
+    def __init__(self, object_list, per_page, strategy='exact', signature=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.strategy = strategy
+        self.signature = signature
+        self.approximate_count = False
+
+    def exact_count(self):
+        try:
+            return self.object_list.count()
+        except (AttributeError, TypeError):
+            return len(self.object_list)
+
+    @cached_property
+    def count(self):
+        if self.strategy == 'cached' and self.signature:
+            generation = cache.get_or_set(COUNT_GENERATION_KEY, 1, None)
+            key = 'pagination-count:%s:%s' % (generation, self.signature)
+            count = cache.get(key)
+            if count is None:
+                count = self.exact_count()
+                cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+            return count
+        if self.strategy == 'estimate' and isinstance(self.object_list, QuerySet):
+            # estimates are only worth their inaccuracy when counting would be expensive
+            estimate = estimate_count(self.object_list)
+            if estimate >= settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD:
+                self.approximate_count = True
+                return estimate
+        return self.exact_count()
 
 
 # This needs to be in its own file because of circular
@@ -8,6 +111,23 @@ from rest_framework import pagination
 class CustomPagination(pagination.PageNumberPagination):
     max_page_size = 100
     page_size_query_param = 'page_size'
+    # clients may pick the count strategy, the default is set in settings
+    count_strategy_query_param = 'count'
+
+    def get_count_strategy(self, request):
+        strategy = request.query_params.get(self.count_strategy_query_param)
+        # writes only invalidate cached counts when they are the configured strategy
+        if strategy == 'cached' and settings.PAGINATION_COUNT_STRATEGY != 'cached':
+            return 'exact'
+        if strategy in COUNT_STRATEGIES:
+            return strategy
+        return settings.PAGINATION_COUNT_STRATEGY
+
+    def paginate_queryset(self, queryset, request, view=None):
+        strategy = self.get_count_strategy(request)
+        signature = get_count_signature(request) if strategy == 'cached' else None
+        self.django_paginator_class = partial(CountStrategyPaginator, strategy=strategy, signature=signature)
+        return super().paginate_queryset(queryset, request, view)
 
     def get_paginated_response(self, data):
         meta = OrderedDict([
@@ -15,6 +135,8 @@ class CustomPagination(pagination.PageNumberPagination):
             ('next', self.get_next_link()),
             ('previous', self.get_previous_link()),
         ])
+        if self.page.paginator.approximate_count:
+            meta['count_approximate'] = True
 
         return Response(OrderedDict([('meta', meta), ('data', data)]))
 
@@ -1,7 +1,9 @@
 from django.apps import AppConfig
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 
-from .signals import organization_post_save
+from .signals import (
+    invalidate_api_keys_on_write, invalidate_counts_on_write, organization_post_save, stick_to_primary_on_write
+)
 
 
 class EventsConfig(AppConfig):
@@ -13,3 +15,10 @@ class EventsConfig(AppConfig):
             sender="django_orghierarchy.Organization",
             dispatch_uid='organization_post_save',
         )
+        for signal in (post_save, post_delete, m2m_changed):
+            signal.connect(invalidate_counts_on_write, dispatch_uid='invalidate_counts_on_write')
+            signal.connect(stick_to_primary_on_write, dispatch_uid='stick_to_primary_on_write')
+        for sender in ('events.DataSource', 'events.ApiKeyUser', 'django_orghierarchy.Organization'):
+            for signal in (post_save, post_delete):
+                signal.connect(invalidate_api_keys_on_write, sender=sender,
+                               dispatch_uid='invalidate_api_keys_on_write_%s' % sender)
@@ -1,5 +1,10 @@
+import copy
+
+from helusers import jwt
 from rest_framework import authentication
 from rest_framework import exceptions
+from events.api_key_cache import cache_credentials, get_cached_credentials, get_generation
+from events.db_router import use_primary
 from events.models import DataSource
 from django_orghierarchy.models import Organization
 from django.utils.translation import ugettext_lazy as _
@@ -15,9 +20,11 @@ class ApiKeyAuthentication(authentication.BaseAuthentication):
         api_key = request.META.get('apikey') or request.META.get('HTTP_APIKEY')
         if not api_key:
             return None
-        data_source = self.get_data_source(api_key=api_key)
-        user = ApiKeyUser.objects.get_or_create(data_source=data_source)[0]
-        return user, ApiKeyAuth(data_source)
+        # the user may be created here, so it is looked up where it is written
+        with use_primary():
+            data_source, user = self.get_credentials(api_key)
+        # each request gets its own user instance, so that attributes set during a request are not shared
+        return copy.copy(user), ApiKeyAuth(data_source)
 
     def authenticate_header(self, request):
         """
@@ -27,10 +34,23 @@ class ApiKeyAuthentication(authentication.BaseAuthentication):
         """
         return "Api key authentication failed."
 
+    @classmethod
+    def get_credentials(cls, api_key):
+        generation = get_generation()
+        credentials = get_cached_credentials(api_key, generation)
+        if credentials is None:
+            data_source = cls.get_data_source(api_key)
+            user = ApiKeyUser.objects.get_or_create(data_source=data_source)[0]
+            # the user refers to the data source with its owner
+            user.data_source = data_source
+            credentials = (data_source, user)
+            cache_credentials(api_key, generation, *credentials)
+        return credentials
+
     @staticmethod
     def get_data_source(api_key):
         try:
-            data_source = DataSource.objects.get(api_key=api_key)
+            data_source = DataSource.objects.select_related('owner').get(api_key=api_key)
         except DataSource.DoesNotExist:
             raise exceptions.AuthenticationFailed(_(
                 "Provided API key does not match any organization on record. "
@@ -39,6 +59,13 @@ class ApiKeyAuthentication(authentication.BaseAuthentication):
         return data_source
 
 
+class JWTAuthentication(jwt.JWTAuthentication):
+    def authenticate(self, request):
+        # the user of the token may be created or updated here, so it is looked up where it is written
+        with use_primary():
+            return super().authenticate(request)
+
+
 class ApiKeyUser(get_user_model(), UserModelPermissionMixin):
     data_source = models.OneToOneField(DataSource, primary_key=True)
 
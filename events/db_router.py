@@ -0,0 +1,174 @@
+"""
+Routing of reads to the read replicas listed in settings.READ_REPLICAS.
+
+ReplicaMiddleware lets the reads of safe API requests go to the replicas, unless the client has written
+recently, and ReplicaRouter sends them to a replica that is not lagging behind. The same replica is used
+for the whole request, until the request writes something, after which it reads from the primary too.
+Writes, all reads of unsafe requests and authentication (see use_primary()) go to the primary. Exports and
+other reads outside requests may use the replicas with use_replicas().
+
+Whether a client has written recently is kept in the cache shared by all processes, which must not be a
+local memory cache when replicas are used.
+"""
+import hashlib
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+# replication lag in seconds, 0 for a replica that has replayed everything it has received and for
+# a database that is not a standby at all
+REPLICA_LAG_SQL = (
+    "SELECT CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END;"
+)
+
+_state = threading.local()
+# replica alias: (time checked, lag in seconds or None if the replica is unavailable)
+_replica_lags = {}
+
+
+def get_replica_lag(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(REPLICA_LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+def is_replica_available(alias):
+    """
+    Check whether the replica is reachable and within READ_REPLICA_MAX_LAG of the primary. The lag of each
+    replica is checked at most every READ_REPLICA_LAG_CHECK_INTERVAL seconds in each process.
+    """
+    now = time.monotonic()
+    checked = _replica_lags.get(alias)
+    if checked is None or now - checked[0] > settings.READ_REPLICA_LAG_CHECK_INTERVAL:
+        try:
+            lag = get_replica_lag(alias)
+        except DatabaseError as e:
+            logger.warning("Read replica %s is unavailable: %s" % (alias, e))
+            lag = None
+        if lag is not None and lag > settings.READ_REPLICA_MAX_LAG:
+            logger.warning("Read replica %s is lagging %.1f seconds behind" % (alias, lag))
+        checked = _replica_lags[alias] = (now, lag)
+    lag = checked[1]
+    return lag is not None and lag <= settings.READ_REPLICA_MAX_LAG
+
+
+def get_replica():
+    """
+    Return a random available replica, or the primary if none is available.
+    """
+    replicas = [alias for alias in settings.READ_REPLICAS if is_replica_available(alias)]
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_replicas():
+    """
+    Read from the replicas in the current thread, e.g. in exports.
+    """
+    previous = (getattr(_state, 'use_replicas', False), getattr(_state, 'replica', None))
+    _state.use_replicas, _state.replica = True, None
+    try:
+        yield
+    finally:
+        _state.use_replicas, _state.replica = previous
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary in the current thread, e.g. to look up and create the user of a request.
+    """
+    previous = getattr(_state, 'use_replicas', False)
+    _state.use_replicas = False
+    try:
+        yield
+    finally:
+        _state.use_replicas = previous
+
+
+def stick_to_primary():
+    """
+    Send the rest of the reads of a request that wrote something to the primary, and pin its client to the
+    primary.
+    """
+    if getattr(_state, 'use_replicas', False):
+        _state.replica = DEFAULT_DB_ALIAS
+        _state.wrote = True
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        # the database cache (see CACHE_URL) must be read where it is written
+        if not getattr(_state, 'use_replicas', False) or model._meta.app_label == 'django_cache':
+            return DEFAULT_DB_ALIAS
+        if getattr(_state, 'replica', None) is None:
+            _state.replica = get_replica()
+        return _state.replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas contain the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replicas are migrated by replication
+        return db == DEFAULT_DB_ALIAS
+
+
+def get_primary_pin_key(request):
+    """
+    Return the cache key pinning the client of the request to the primary, or None for anonymous clients.
+    """
+    credentials = (request.META.get('apikey') or request.META.get('HTTP_APIKEY') or
+                   request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    if not credentials:
+        return None
+    return 'db-primary-pin:%s' % hashlib.sha256(credentials.encode('utf-8')).hexdigest()
+
+
+class ReplicaMiddleware(MiddlewareMixin):
+    """
+    Sends the reads of safe API requests to the replicas. After a request that wrote something, the requests of
+    the same client stick to the primary for READ_REPLICA_PRIMARY_PIN_TIMEOUT seconds, so that the client reads
+    its writes.
+    """
+    def process_request(self, request):
+        _state.replica = None
+        _state.use_replicas = False
+        _state.wrote = False
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        from rest_framework.views import APIView
+
+        # other views, e.g. logins, may depend on their writes in ways the pinning does not cover
+        view_class = getattr(view_func, 'cls', None)
+        if not settings.READ_REPLICAS or request.method not in SAFE_METHODS or \
+                not (isinstance(view_class, type) and issubclass(view_class, APIView)):
+            return None
+        key = get_primary_pin_key(request)
+        _state.use_replicas = key is None or not cache.get(key)
+        return None
+
+    def process_response(self, request, response):
+        if settings.READ_REPLICAS and (request.method not in SAFE_METHODS or getattr(_state, 'wrote', False)):
+            key = get_primary_pin_key(request)
+            if key is not None:
+                cache.set(key, True, settings.READ_REPLICA_PRIMARY_PIN_TIMEOUT)
+        # streamed responses read while they are sent, and the next request resets the state anyway
+        if not response.streaming:
+            _state.use_replicas = False
+            _state.replica = None
+        return response
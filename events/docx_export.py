@@ -0,0 +1,174 @@
+"""
+DOCX export of the events of a location. The events are fetched in chunks with only the fields the document
+needs and added to the document as they are fetched. Large exports may run as background jobs of
+authenticated users. Their results are saved to a storage in settings.DOCX_EXPORT_ROOT, which is not served
+publicly, and only the user who started a job may download its result through the API. The status of a job
+is kept in the cache shared by all processes, so that any of them can report it. Jobs expire after
+EXPORT_JOB_TIMEOUT, and the files of expired jobs are deleted when the next job finishes.
+"""
+import io
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connections
+from django.db.models import Count, Min
+from docx import Document
+
+from events import utils
+from events.db_router import use_replicas
+from events.models import Offer
+from events.renderers.docx import build_document
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_JOB_TIMEOUT = 24 * 60 * 60
+# pending jobs older than this have died with their process, e.g. a recycled web worker
+EXPORT_JOB_MAX_DURATION = 60 * 60
+# the translated fields EventParser.parse_event uses
+EXPORT_TEXT_FIELDS = ('name', 'short_description', 'description')
+
+logger = logging.getLogger(__name__)
+
+
+def get_export_locations(queryset):
+    """
+    Return the number of events in the queryset, the number of their locations and the id of one of the
+    locations, in one aggregate query.
+    """
+    stats = queryset.order_by().aggregate(
+        events=Count('id'), locations=Count('location', distinct=True), location=Min('location'))
+    return stats['events'], stats['locations'], stats['location']
+
+
+def get_translations(values, field_name, lang_codes):
+    """
+    Return the translations of the field as the serializers represent them, or None if there are none.
+    """
+    translations = {}
+    for lang in lang_codes:
+        value = values['%s_%s' % (field_name, lang)]
+        if value is not None:
+            translations[lang] = value
+    return translations or None
+
+
+class EventExport:
+    """
+    The events of the queryset as the raw events EventParser.parse_event takes, in start time order.
+    """
+    def __init__(self, queryset, location, chunk_size=EXPORT_CHUNK_SIZE):
+        self.queryset = queryset
+        self.location = location
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        lang_codes = utils.get_fixed_lang_codes()
+        text_fields = ['%s_%s' % (field_name, lang) for field_name in EXPORT_TEXT_FIELDS for lang in lang_codes]
+        price_fields = ['price_%s' % lang for lang in lang_codes]
+
+        rows = self.queryset.prefetch_related(None).order_by('start_time', 'id').values(
+            'id', 'start_time', 'end_time', *text_fields).iterator()
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return
+
+            # the first offer of each event
+            prices = {}
+            offers = Offer.objects.filter(event__in=[row['id'] for row in chunk]).order_by('event', 'id')
+            for offer in offers.values('event', *price_fields):
+                if offer['event'] not in prices:
+                    prices[offer['event']] = get_translations(offer, 'price', lang_codes)
+
+            for row in chunk:
+                raw_event = {field_name: get_translations(row, field_name, lang_codes)
+                             for field_name in EXPORT_TEXT_FIELDS}
+                raw_event.update({
+                    'location': self.location,
+                    'start_time_obj': row['start_time'],
+                    'end_time_obj': row['end_time'],
+                    'offers': [{'price': prices[row['id']]}] if row['id'] in prices else [],
+                })
+                yield raw_event
+
+
+def get_export_storage():
+    return FileSystemStorage(location=settings.DOCX_EXPORT_ROOT)
+
+
+def get_job_key(job_id):
+    return 'docx-export:%s' % job_id
+
+
+def get_export_job(job_id, owner):
+    """
+    Return the status of the export job and, once it is done, the name of the file in the export storage, or None
+    if the job does not exist, has expired or was started by another user than owner.
+    """
+    job = cache.get(get_job_key(job_id))
+    if job is None or job['owner'] != owner:
+        return None
+    if job['status'] == 'pending' and time.time() - job['started'] > EXPORT_JOB_MAX_DURATION:
+        return dict(job, status='failed')
+    return job
+
+
+def delete_expired_exports():
+    """
+    Delete the files of the jobs that have expired, which cannot be downloaded anymore.
+    """
+    storage = get_export_storage()
+    if not storage.exists(''):
+        return
+    for job_id in storage.listdir('')[0]:
+        # the directory of a job is modified when its file is saved
+        path = storage.path(job_id)
+        if os.path.getmtime(path) < time.time() - EXPORT_JOB_TIMEOUT:
+            # another thread may be deleting it too
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def run_export_job(job_id, owner, export, start=None, end=None):
+    job = {'status': 'failed', 'owner': owner}
+    try:
+        document = Document()
+        filename = build_document(document, export.location, export, start, end)
+        output = io.BytesIO()
+        document.save(output)
+        job['file'] = get_export_storage().save('%s/%s' % (job_id, filename), ContentFile(output.getvalue()))
+        job['status'] = 'done'
+    except Exception:
+        logger.exception('DOCX export %s failed' % job_id)
+    cache.set(get_job_key(job_id), job, EXPORT_JOB_TIMEOUT)
+
+
+def _run_export_thread(*args):
+    try:
+        # the thread is outside the request, which read from the replicas
+        with use_replicas():
+            run_export_job(*args)
+        delete_expired_exports()
+    finally:
+        # the thread has its own database connections
+        connections.close_all()
+
+
+def start_export_job(owner, export, start=None, end=None):
+    """
+    Start exporting in a background thread and return the id of the job. Only owner, the id of the user
+    starting the job, may read the job.
+    """
+    job_id = uuid.uuid4().hex
+    cache.set(get_job_key(job_id), {'status': 'pending', 'owner': owner, 'started': time.time()},
+              EXPORT_JOB_TIMEOUT)
+    thread = threading.Thread(target=_run_export_thread, args=(job_id, owner, export, start, end), daemon=True)
+    thread.start()
+    return job_id
@@ -2,16 +2,23 @@
 import json
 import re
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.management import CommandError
+from django.db.models import Exists, OuterRef
 import pytz
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from events.exporter.base import register_exporter, Exporter
-from events.models import Event, ExportInfo, Keyword, Place
+from events.models import BaseModel, Event, ExportInfo, Keyword, Place
+from events.renderers.ical import get_calendar
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.serializers.json import DjangoJSONEncoder
-from icalendar import Calendar, Event as CalendarEvent
+from icalendar import Event as CalendarEvent
 from httmock import all_requests, HTTMock, response
 
 BASE_API_URL = settings.CITYSDK_API_SETTINGS['CITYSDK_URL']
@@ -61,6 +68,22 @@ def jsonize(from_dict):
     return json.dumps(from_dict, cls=DjangoJSONEncoder)
 
 
+def chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def dry_run_mock():
+    """
+    Mock all requests for the duration of the context in dry run mode. The mock patches requests globally,
+    so it also covers the requests sent by the worker threads.
+    """
+    stack = ExitStack()
+    if DRY_RUN_MODE:
+        stack.enter_context(HTTMock(citysdk_mock))
+    return stack
+
+
 def generate_icalendar_element(event):
     icalendar_event = CalendarEvent()
     if event.start_time:
@@ -70,9 +93,7 @@ def generate_icalendar_element(event):
     if event.name_en:
         icalendar_event.add('summary', event.name_en)
 
-    cal = Calendar()
-    cal.add('version', '2.0')
-    cal.add('prodid', '-//events.hel.fi//NONSGML Feeder//EN')
+    cal = get_calendar()
     cal.add_component(icalendar_event)
 
     term = None
@@ -96,11 +117,26 @@ def generate_icalendar_element(event):
 @register_exporter
 class CitySDKExporter(Exporter):
     name = 'CitySDK'
-    session_cookies = None
     response_headers = {'content-type': 'application/json'}
+    # number of concurrent requests, and of objects loaded and their export infos written at a time
+    max_workers = 8
+    chunk_size = 200
+    # retries of failed connections and of unavailable responses to idempotent requests. POST updates an
+    # object by its id and DELETE deletes it, but PUT creates a new one, so a PUT the target processed
+    # before failing would create a duplicate without an export info.
+    max_retries = Retry(total=3, backoff_factor=0.5, status_forcelist=(502, 503, 504),
+                        method_whitelist=frozenset(['GET', 'POST', 'DELETE']))
 
     def setup(self):
-        self.authenticate()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, max_retries=self.max_retries)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.auth_lock = threading.Lock()
+        # target ids of the exported categories and places, referred to by the exported events
+        self.target_ids = {}
+        with dry_run_mock():
+            self.authenticate()
 
     def authenticate(self):
         """
@@ -108,11 +144,11 @@ class CitySDKExporter(Exporter):
         """
         username = settings.CITYSDK_API_SETTINGS['USERNAME']
         password = settings.CITYSDK_API_SETTINGS['PASSWORD']
-        session_response = requests.get(
+        session_response = self.session.get(
             '%sauth?username=%s&password=%s' %
             (BASE_API_URL, username, password))
         if session_response.status_code == 200:
-            self.session_cookies = session_response.cookies
+            # the session keeps the cookies
             print("Authentication successful with response: %s"
                   % session_response.text)
         else:
@@ -127,23 +163,14 @@ class CitySDKExporter(Exporter):
         # fetch category ID from exported categories
         citysdk_event['category'] = []
         for category in event.keywords.all():
-            exported_category = ExportInfo.objects.filter(
-                content_type=ContentType.objects.get_for_model(Keyword),
-                object_id=category.id,
-                target_system=self.name).first()
             citysdk_event['category'].append(
-                {"id": exported_category.target_id})
+                {"id": self.target_ids[Keyword][category.id]})
 
         if event.location:
-            exported_poi = ExportInfo.objects.filter(
-                content_type=ContentType.objects.get_for_model(Place),
-                object_id=event.location.id,
-                target_system=self.name).first()
-
             citysdk_event['location'] = {
                 "relationship": [
                     {
-                        "targetPOI": exported_poi.target_id,
+                        "targetPOI": self.target_ids[Place][event.location.id],
                         "term": "equal",
                         "base": POIS_URL
                     }
@@ -252,8 +279,39 @@ class CitySDKExporter(Exporter):
         self._export_places()
         self._export_events()
 
+    def _get_modified(self, klass, model_type):
+        """
+        Return the pks, export info ids and target ids of the exported objects modified after their
+        export, in one joined query.
+        """
+        table = klass._meta.db_table
+        export_table = ExportInfo._meta.db_table
+        modified = klass.objects.extra(
+            select={'export_info_id': '%s.id' % export_table, 'export_target_id': '%s.target_id' % export_table},
+            tables=[export_table],
+            where=['%s.object_id = %s.%s' % (export_table, table, klass._meta.pk.column),
+                   '%s.content_type_id = %%s' % export_table,
+                   '%s.target_system = %%s' % export_table,
+                   '%s.last_modified_time > %s.last_exported_time' % (table, export_table)],
+            params=[model_type.pk, self.name],
+        )
+        return list(modified.values_list('pk', 'export_info_id', 'export_target_id'))
+
+    def _get_target_ids(self, klass):
+        model_type = ContentType.objects.get_for_model(klass)
+        return dict(ExportInfo.objects.filter(content_type=model_type, target_system=self.name)
+                    .values_list('object_id', 'target_id'))
+
+    def _load_chunks(self, klass, pks, related):
+        """
+        Yield the objects with the given pks in chunks, with their related objects
+        """
+        for chunk in chunks(pks, self.chunk_size):
+            objects = klass.objects.filter(pk__in=chunk).prefetch_related(*related).in_bulk()
+            yield [objects[pk] for pk in chunk if pk in objects]
+
     def _export_models(self, klass, generate, url, json_wrapper,
-                       extra_filters=None):
+                       extra_filters=None, related=()):
         model_type = ContentType.objects.get_for_model(klass)
 
         # get all exported
@@ -265,81 +323,90 @@ class CitySDKExporter(Exporter):
         delete_count = 0
         new_count = 0
 
-        # deleted or modified
-        for export_info in export_infos:
-            try:
-                model = klass.objects.get(pk=export_info.object_id)
-                if model.last_modified_time > export_info.last_exported_time:
-                    citysdk_model = generate(model)
-                    citysdk_model['id'] = export_info.target_id
-                    if model_name == 'Keyword':
-                        data = {
-                            'list': 'event',
-                            'category': citysdk_model
-                        }
-                    else:
-                        data = {json_wrapper: citysdk_model}
-                    modify_response = self._do_req('post', url, data)
-                    if modify_response.status_code == 200:
-                        export_info.save()  # refresh last export date
-                        print("%s updated (original id: %s, target id: %s)" %
-                              (model_name, model.pk, export_info.target_id))
-                        modify_count += 1
-
-            except ObjectDoesNotExist:
+        def wrap(citysdk_model):
+            if model_name == 'Keyword':
+                return {
+                    'list': 'event',
+                    'category': citysdk_model
+                }
+            return {json_wrapper: citysdk_model}
+
+        # modified
+        modified = self._get_modified(klass, model_type)
+        export_info_ids = {pk: (export_info_id, target_id) for pk, export_info_id, target_id in modified}
+        for models in self._load_chunks(klass, [pk for pk, _, _ in modified], related):
+            reqs = []
+            for model in models:
+                citysdk_model = generate(model)
+                citysdk_model['id'] = export_info_ids[model.pk][1]
+                reqs.append(('post', url, wrap(citysdk_model)))
+            updated = []
+            for model, modify_response in zip(models, self._do_reqs(reqs)):
+                if modify_response is not None and modify_response.status_code == 200:
+                    updated.append(export_info_ids[model.pk][0])
+                    print("%s updated (original id: %s, target id: %s)" %
+                          (model_name, model.pk, export_info_ids[model.pk][1]))
+            # refresh last export dates
+            ExportInfo.objects.filter(pk__in=updated).update(last_exported_time=BaseModel.now())
+            modify_count += len(updated)
+
+        # deleted
+        deleted = list(export_infos.annotate(
+            object_exists=Exists(klass.objects.filter(pk=OuterRef('object_id')))
+        ).filter(object_exists=False))
+        for export_info_chunk in chunks(deleted, self.chunk_size):
+            reqs = []
+            for export_info in export_info_chunk:
                 if model_name == 'Keyword':
-                    delete_response = self._do_req(
-                        'delete', url,
-                        data={"id": export_info.target_id}
-                    )
+                    reqs.append(('delete', url, {"id": export_info.target_id}))
                 else:
-                    delete_response = self._do_req(
-                        'delete', url + export_info.target_id)
-                if delete_response.status_code == 200:
-                    export_info.delete()
-                    print("%s removed (original id: %d, target id: %s) "
+                    reqs.append(('delete', url + export_info.target_id, None))
+            removed = []
+            for export_info, delete_response in zip(export_info_chunk, self._do_reqs(reqs)):
+                if delete_response is not None and delete_response.status_code == 200:
+                    removed.append(export_info.pk)
+                    print("%s removed (original id: %s, target id: %s) "
                           "from target system" %
                           (model_name, export_info.object_id,
                            export_info.target_id))
-                    delete_count += 1
+            ExportInfo.objects.filter(pk__in=removed).delete()
+            delete_count += len(removed)
 
         # new
-        imported = {'id__in': export_infos.values("object_id")}
+        qs = klass.objects.annotate(
+            exported=Exists(export_infos.filter(object_id=OuterRef('pk')))
+        ).filter(exported=False)
         if extra_filters:
-            qs = klass.objects.exclude(
-                **imported).filter(**extra_filters).distinct()
-        else:
-            qs = klass.objects.exclude(**imported)
-        for model in qs:
-            citysdk_model = generate(model)
-            citysdk_model['created'] = datetime.datetime.utcnow().replace(
-                tzinfo=pytz.utc)
-            if model_name == 'Keyword':
-                data = {
-                    'list': 'event',
-                    'category': citysdk_model
-                }
-            else:
-                data = {json_wrapper: citysdk_model}
-            new_response = self._do_req('put', url, data)
-            if new_response.status_code == 200:
-                new = new_response.json()
-                if isinstance(new, dict) and 'id' in new:
-                    new_id = new['id']
+            qs = qs.filter(**extra_filters).distinct()
+        new_pks = list(qs.values_list('pk', flat=True))
+        for models in self._load_chunks(klass, new_pks, related):
+            reqs = []
+            for model in models:
+                citysdk_model = generate(model)
+                citysdk_model['created'] = datetime.datetime.utcnow().replace(
+                    tzinfo=pytz.utc)
+                reqs.append(('put', url, wrap(citysdk_model)))
+            new_export_infos = []
+            for model, new_response in zip(models, self._do_reqs(reqs)):
+                if new_response is not None and new_response.status_code == 200:
+                    new = new_response.json()
+                    if isinstance(new, dict) and 'id' in new:
+                        new_id = new['id']
+                    else:
+                        new_id = new
+                    if VERBOSE:
+                        print("%s exported (original id: %s, target id: %s)" %
+                              (model_name, model.pk, new_id))
+                    new_export_infos.append(ExportInfo(content_type=model_type,
+                                                       object_id=model.pk,
+                                                       target_id=new_id,
+                                                       target_system=self.name,
+                                                       last_exported_time=BaseModel.now()))
                 else:
-                    new_id = new
-                if VERBOSE:
-                    print("%s exported (original id: %d, target id: %s)" %
-                          (model_name, model.pk, new_id))
-                new_export_info = ExportInfo(content_object=model,
-                                             content_type=model_type,
-                                             target_id=new_id,
-                                             target_system=self.name)
-                new_export_info.save()
-                new_count += 1
-            else:
-                print("%s export failed (original id: %s)" %
-                      (model_name, model.pk))
+                    print("%s export failed (original id: %s)" %
+                          (model_name, model.pk))
+            ExportInfo.objects.bulk_create(new_export_infos)
+            new_count += len(new_export_infos)
 
         print(model_name + " items added: " + str(new_count))
         print(model_name + " items modified: " + str(modify_count))
@@ -348,22 +415,33 @@ class CitySDKExporter(Exporter):
     def _do_req(self, method, url, data=None):
         kwargs = {
             'headers': self.response_headers,
-            'cookies': self.session_cookies
         }
         if data:
             kwargs['data'] = jsonize(data)
 
-        if DRY_RUN_MODE:
-            with HTTMock(citysdk_mock):
-                return requests.request(method, url, **kwargs)
-        else:
-            resp = requests.request(method, url, **kwargs)
-            # if session dies while doing exporting
-            if resp.status_code == 401:
+        resp = self.session.request(method, url, **kwargs)
+        # if session dies while doing exporting
+        if resp.status_code == 401 and not DRY_RUN_MODE:
+            with self.auth_lock:
                 self.authenticate()
-                return requests.request(method, url, **kwargs)
-            assert resp.status_code == 200
-            return resp
+            resp = self.session.request(method, url, **kwargs)
+        return resp
+
+    def _do_req_or_none(self, req):
+        method, url, data = req
+        try:
+            return self._do_req(method, url, data)
+        except requests.RequestException as e:
+            print("%s %s failed: %s" % (method.upper(), url, e))
+            return None
+
+    def _do_reqs(self, reqs):
+        """
+        Send the requests concurrently. Returns the responses in the order of the requests, None for
+        the requests that failed after retries.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(self._do_req_or_none, reqs))
 
     def _export_categories(self):
         filters = {'event__in': Event.objects.all()}
@@ -376,8 +454,9 @@ class CitySDKExporter(Exporter):
                             POIS_URL, 'poi', extra_filters=filters)
 
     def _export_events(self):
+        self.target_ids = {klass: self._get_target_ids(klass) for klass in (Keyword, Place)}
         self._export_models(Event, self._generate_exportable_event,
-                            EVENTS_URL, 'event')
+                            EVENTS_URL, 'event', related=('keywords', 'location'))
 
     def __delete_resource(self, resource, url):
         response = self._do_req('delete', '%s/%s' % (
@@ -424,10 +503,11 @@ class CitySDKExporter(Exporter):
 
     def export_events(self, is_delete=False):
 
-        if is_delete:
-            self._delete_exported_from_target()
-        else:
-            self._export_new()
+        with dry_run_mock():
+            if is_delete:
+                self._delete_exported_from_target()
+            else:
+                self._export_new()
 
 
 # For dry run request mocking
@@ -0,0 +1,229 @@
+"""
+Snapshot of the public events, places and keywords as gzip-compressed NDJSON files, one object per line in
+the shape of the API serializers.
+
+The objects of each resource are split into primary key ranges, which are exported in parallel processes
+and streamed from server-side cursors. The manifest lists the ranges and the completed files with their
+object counts and checksums, so that an interrupted export can be resumed.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import islice
+from urllib.parse import urlsplit
+
+from django.core.management import CommandError
+from django.db import connections
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from rest_framework.reverse import reverse
+from rest_framework.test import APIRequestFactory
+from rest_framework.utils.encoders import JSONEncoder
+
+from events.api import EventViewSet, KeywordListViewSet, PlaceListViewSet
+from events.db_router import use_replicas
+from events.exporter.base import Exporter, register_exporter
+from events.models import PublicationStatus
+
+API_VERSION = 'v1'
+MANIFEST_NAME = 'manifest.json'
+DEFAULT_CHUNK_SIZE = 50000
+# number of objects serialized, and their related objects prefetched, at a time
+BATCH_SIZE = 500
+
+# resource name: list view and the query parameters listing all of its public objects
+RESOURCES = OrderedDict([
+    ('event', (EventViewSet, {})),
+    ('place', (PlaceListViewSet, {'show_all_places': 'true'})),
+    ('keyword', (KeywordListViewSet, {'show_all_keywords': 'true', 'show_deprecated': 'true'})),
+])
+
+
+def get_list_view(resource, base_url):
+    """
+    Return the list view of the resource for an anonymous request of the public API, to get the same
+    queryset and serializer context as the API.
+    """
+    viewset_class, params = RESOURCES[resource]
+    scheme, host = urlsplit(base_url)[:2]
+    path = reverse('%s-list' % resource, kwargs={'version': API_VERSION})
+    django_request = APIRequestFactory().get(path, params, HTTP_HOST=host, secure=scheme == 'https')
+    view = viewset_class(action_map={'get': 'list'}, action='list')
+    view.args = ()
+    view.kwargs = {'version': API_VERSION}
+    view.format_kwarg = None
+    view.headers = {}
+    view.request = view.initialize_request(django_request, version=API_VERSION)
+    view.initial(view.request, version=API_VERSION)
+    return view
+
+
+def get_queryset(view):
+    queryset = view.get_queryset()
+    if isinstance(view, EventViewSet):
+        queryset = queryset.filter(publication_status=PublicationStatus.PUBLIC)
+    return queryset.order_by('pk')
+
+
+def get_pk_ranges(queryset, chunk_size):
+    """
+    Split the table of the queryset into primary key ranges of chunk_size rows, of which the queryset may
+    include fewer. The last range is open ended, so that objects added during the export are included.
+    """
+    table = queryset.model._meta.db_table
+    pk = queryset.model._meta.pk.column
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            'SELECT {pk} FROM (SELECT {pk}, row_number() OVER (ORDER BY {pk}) AS n FROM {table}) t '
+            'WHERE n %% %s = 1 ORDER BY {pk};'.format(pk=pk, table=table), [chunk_size])
+        starts = [row[0] for row in cursor.fetchall()]
+    if not starts:
+        return [[None, None]]
+    # the first range is open ended too, for objects sorting before the current ones
+    starts[0] = None
+    return [[start, end] for start, end in zip(starts, starts[1:] + [None])]
+
+
+def get_checksum(path):
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            checksum.update(block)
+    return checksum.hexdigest()
+
+
+def export_range(resource, base_url, start, end, path):
+    """
+    Write the objects of the resource within the primary key range to the file, reading from the replicas.
+    Returns the file entry of the manifest.
+    """
+    with use_replicas():
+        return _export_range(resource, base_url, start, end, path)
+
+
+def _export_range(resource, base_url, start, end, path):
+    view = get_list_view(resource, base_url)
+    queryset = get_queryset(view)
+    if start is not None:
+        queryset = queryset.filter(pk__gte=start)
+    if end is not None:
+        queryset = queryset.filter(pk__lt=end)
+    prefetches = queryset._prefetch_related_lookups
+    encoder = JSONEncoder(ensure_ascii=False)
+
+    count = 0
+    tmp_path = path + '.tmp'
+    # without a timestamp in the gzip header, the checksums of unchanged data stay the same
+    with open(tmp_path, 'wb') as raw, \
+            gzip.GzipFile(os.path.basename(path), 'wb', fileobj=raw, mtime=0) as compressed, \
+            io.TextIOWrapper(compressed, encoding='utf-8') as f:
+        # iterator() streams the rows from a server-side cursor, but does not prefetch
+        objects = queryset.iterator()
+        while True:
+            batch = list(islice(objects, BATCH_SIZE))
+            if not batch:
+                break
+            prefetch_related_objects(batch, *prefetches)
+            for data in view.get_serializer(batch, many=True).data:
+                f.write(encoder.encode(data))
+                f.write('\n')
+            count += len(batch)
+    os.replace(tmp_path, path)
+    return {'resource': resource, 'start': start, 'end': end, 'count': count, 'bytes': os.path.getsize(path),
+            'sha256': get_checksum(path)}
+
+
+@register_exporter
+class SnapshotExporter(Exporter):
+    name = 'snapshot'
+
+    def setup(self):
+        options = self.options or {}
+        self.output = options.get('output') or 'snapshot'
+        self.base_url = options.get('base_url') or 'http://localhost'
+        self.workers = options.get('workers') or 1
+        self.chunk_size = options.get('chunk_size') or DEFAULT_CHUNK_SIZE
+        self.resume = options.get('resume', False)
+        self.manifest_path = os.path.join(self.output, MANIFEST_NAME)
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            raise CommandError("No snapshot to resume in %s" % self.output)
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        # files that were not completed, or were changed afterwards, are exported again
+        files = manifest['files']
+        for name, entry in list(files.items()):
+            path = os.path.join(self.output, name)
+            if not os.path.exists(path) or get_checksum(path) != entry['sha256']:
+                self.logger.warning("Exporting %s again" % name)
+                del files[name]
+        return manifest
+
+    def create_manifest(self):
+        if os.path.exists(self.manifest_path):
+            raise CommandError("A snapshot already exists in %s, resume it with --resume" % self.output)
+        manifest = OrderedDict([
+            ('created_time', timezone.now().isoformat()),
+            ('completed_time', None),
+            ('base_url', self.base_url),
+            ('api_version', API_VERSION),
+            ('ranges', OrderedDict()),
+            ('files', OrderedDict()),
+        ])
+        with use_replicas():
+            for resource in RESOURCES:
+                queryset = get_queryset(get_list_view(resource, self.base_url))
+                manifest['ranges'][resource] = get_pk_ranges(queryset, self.chunk_size)
+        return manifest
+
+    def save_manifest(self, manifest):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def export_events(self, is_delete=False):
+        if is_delete:
+            raise CommandError("Snapshot exporter does not delete exported items")
+        os.makedirs(self.output, exist_ok=True)
+        manifest = self.load_manifest() if self.resume else self.create_manifest()
+        # the ranges are kept when resuming, so that the completed files stay valid
+        self.save_manifest(manifest)
+
+        pending = []
+        for resource, ranges in manifest['ranges'].items():
+            os.makedirs(os.path.join(self.output, resource), exist_ok=True)
+            for i, (start, end) in enumerate(ranges):
+                name = '%s/%s-%05d.ndjson.gz' % (resource, resource, i)
+                if name not in manifest['files']:
+                    pending.append((name, (resource, manifest['base_url'], start, end,
+                                           os.path.join(self.output, name))))
+
+        if self.workers > 1:
+            # the forked workers must not share the connection of this process
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                futures = {executor.submit(export_range, *args): name for name, args in pending}
+                for future in as_completed(futures):
+                    self.complete_file(manifest, futures[future], future.result())
+        else:
+            for name, args in pending:
+                self.complete_file(manifest, name, export_range(*args))
+
+        manifest['files'] = OrderedDict(sorted(manifest['files'].items()))
+        manifest['counts'] = {resource: sum(entry['count'] for entry in manifest['files'].values()
+                                            if entry['resource'] == resource)
+                              for resource in manifest['ranges']}
+        manifest['completed_time'] = timezone.now().isoformat()
+        self.save_manifest(manifest)
+        self.logger.info("Snapshot completed in %s: %s" % (self.output, manifest['counts']))
+
+    def complete_file(self, manifest, name, entry):
+        manifest['files'][name] = entry
+        self.save_manifest(manifest)
+        self.logger.info("Exported %d %ss to %s" % (entry['count'], entry['resource'], name))
@@ -0,0 +1,98 @@
+"""
+iCalendar feeds of events. Feeds are polled constantly by calendar clients, so the VEVENT of each event
+version is serialized only once and cached in the "ical" cache by the event id and the last modification
+times of the event and its location, whose name is included. A feed only needs to look up the versions of
+its events, and to load the events whose versions are not cached. Feeds are lists filtered by at least one of
+FEED_FILTERS, never all the events in the database.
+
+The "ical" cache must not count its entries on every write, as database and file caches do, so it is a local
+memory cache by default, and memcached or another cache server in larger installations.
+"""
+from itertools import islice
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.html import strip_tags
+from django.utils.timezone import localtime
+from icalendar import Event as CalendarEvent
+
+from events.models import Event
+
+VEVENT_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+BATCH_SIZE = 500
+# the query parameters that select the events of a feed, by place, keyword or organization
+FEED_FILTERS = ('location', 'keyword', 'keyword_AND', 'publisher')
+
+
+def get_translation(obj, field_name, language):
+    """
+    Return the translation of the field in the language, or in any language if it is missing.
+    """
+    languages = [language] + [code for code, name in settings.LANGUAGES if code != language]
+    for code in languages:
+        value = getattr(obj, '%s_%s' % (field_name, code), None)
+        if value:
+            return value
+    return ''
+
+
+def generate_vevent(event, language):
+    vevent = CalendarEvent()
+    vevent.add('uid', event.id)
+    vevent.add('dtstamp', event.last_modified_time or event.created_time)
+    if event.created_time:
+        vevent.add('created', event.created_time)
+    if event.last_modified_time:
+        vevent.add('last-modified', event.last_modified_time)
+    # events without times are all day events, and their end times are already exclusive midnights
+    if event.start_time:
+        vevent.add('dtstart', event.start_time if event.has_start_time else localtime(event.start_time).date())
+    if event.end_time:
+        vevent.add('dtend', event.end_time if event.has_end_time else localtime(event.end_time).date())
+    vevent.add('summary', get_translation(event, 'name', language))
+    description = get_translation(event, 'short_description', language) or \
+        get_translation(event, 'description', language)
+    if description:
+        vevent.add('description', strip_tags(description))
+    if event.location:
+        vevent.add('location', get_translation(event.location, 'name', language))
+    url = get_translation(event, 'info_url', language)
+    if url:
+        vevent.add('url', url)
+    if event.event_status == Event.Status.CANCELLED:
+        vevent.add('status', 'CANCELLED')
+    return vevent
+
+
+def get_vevent_key(event_id, last_modified_time, location_modified_time, language):
+    times = (last_modified_time, location_modified_time)
+    timestamps = ':'.join(str(time.timestamp()) if time else '' for time in times)
+    return 'ical-vevent:%s:%s:%s' % (event_id, timestamps, language)
+
+
+def iter_vevents(queryset, language):
+    """
+    Yield the serialized VEVENTs of the events of the queryset, in its order. Only the ids and
+    modification times of the events and their locations are fetched, and the events themselves only
+    for new versions.
+    """
+    cache = caches['ical']
+    rows = queryset.prefetch_related(None).values_list(
+        'id', 'last_modified_time', 'location__last_modified_time').iterator()
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            return
+        keys = [get_vevent_key(*row, language) for row in batch]
+        vevents = cache.get_many(keys)
+        missing = {row[0]: key for row, key in zip(batch, keys) if key not in vevents}
+        if missing:
+            new_vevents = {}
+            for event in Event.objects.filter(pk__in=missing).select_related('location'):
+                new_vevents[missing[event.id]] = generate_vevent(event, language).to_ical()
+            cache.set_many(new_vevents, VEVENT_CACHE_TIMEOUT)
+            vevents.update(new_vevents)
+        for key in keys:
+            # events deleted after their version was fetched are left out
+            if key in vevents:
+                yield vevents[key]
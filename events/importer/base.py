@@ -13,7 +13,9 @@ from django.contrib.gis.geos import Point, Polygon
 from django.contrib.gis.gdal import SpatialReference, CoordTransform
 
 from events.importer.sync import ModelSyncher
-from .util import separate_scripts, clean_text
+from .profiling import get_profiler, timed
+from .sharding import get_process_count, process_sharded
+from .util import detect_paragraph_languages, separate_scripts, clean_text
 
 from modeltranslation.translator import translator
 
@@ -35,6 +37,10 @@ def recur_dict():
 
 
 class Importer(object):
+    # Names of the importers whose data must be present before this importer can run,
+    # used when scheduling several importers at once
+    dependencies = ()
+
     def __init__(self, options):
         super(Importer, self).__init__()
         self.options = options
@@ -69,6 +75,32 @@ class Importer(object):
     def setup(self):
         pass
 
+    def process_sharded(self, records, process_func, shard_key, syncher_attr=None):
+        """
+        Runs process_func for every record, partitioned by shard_key into as many worker processes
+        as the processes option allows. See events.importer.sharding.
+
+        :param records: List of parsed source records
+        :param process_func: Callable converting and saving a single record
+        :param shard_key: Callable returning the stable partition key of a record
+        :param syncher_attr: Name of the attribute containing the ModelSyncher process_func marks objects in
+        :return:
+        """
+        process_sharded(self, records, process_func, shard_key, syncher_attr=syncher_attr,
+                        processes=self.options.get('processes', 1))
+
+    def detect_languages(self, texts):
+        """
+        Detects the languages of all the paragraphs of the texts in one batch, in as many worker processes as
+        the processes option allows. Importers may call this with the texts of a run up front, so that setting
+        their multiscript fields later only hits the detector cache.
+
+        :param texts: Iterable of plain text or html strings, empty ones are skipped.
+        :return:
+        """
+        processes = get_process_count(self.options.get('processes', 1))
+        detect_paragraph_languages((text for text in texts if text), processes=processes)
+
     @staticmethod
     def _set_multiscript_field(string, event, languages, field):
         """
@@ -104,6 +136,7 @@ class Importer(object):
             obj._changed = True
             obj._changed_fields.append('image')
 
+    @timed('m2m')
     def set_images(self, obj, images_data):
         image_syncher = ModelSyncher(obj.images.all(),
                                      lambda image: image.url,
@@ -161,6 +194,7 @@ class Importer(object):
 
         return image
 
+    @timed('save')
     def _update_image(self, image, image_data):
         if not hasattr(image, '_changed'):
             image._changed = False
@@ -173,7 +207,7 @@ class Importer(object):
                 self._set_field(image, field, image_data.get(field))
 
         if image._changed:
-            image.save()
+            image.save_changed()
 
         return image
 
@@ -282,13 +316,15 @@ class Importer(object):
                 continue
             self._set_field(obj, field_name, info[field_name])
 
+    @timed('save', queries='event')
     def save_event(self, info):
         info = info.copy()
 
         args = dict(data_source=info['data_source'], origin_id=info['origin_id'])
         obj_id = "%s:%s" % (info['data_source'].id, info['origin_id'])
         try:
-            obj = Event.objects.get(**args)
+            with get_profiler().phase('match'):
+                obj = Event.objects.get(**args)
             obj._created = False
             assert obj.id == obj_id
         except Event.DoesNotExist:
@@ -342,13 +378,31 @@ class Importer(object):
 
         self._set_field(obj, 'deleted', False)
 
+        # only the changed columns are written
+        saved = False
         if obj._created or obj._changed:
             try:
-                obj.save()
+                saved = obj.save_changed()
             except ValidationError as error:
                 logger.error('Event {} could not be saved: {}'.format(obj, error))
                 raise
 
+        self._sync_event_relations(obj, info)
+
+        if obj._changed or obj._created:
+            if not saved:
+                # only related objects changed, update last_modified_time
+                obj.save_changed(touch=True)
+            if obj._created:
+                verb = "created"
+            else:
+                verb = "changed (fields: %s)" % ', '.join(obj._changed_fields)
+            logger.debug("{} {}".format(obj, verb))
+
+        return obj
+
+    @timed('m2m')
+    def _sync_event_relations(self, obj, info):
         # many-to-many fields
 
         if 'images' in info:
@@ -380,7 +434,7 @@ class Importer(object):
                 obj._changed = True
         in_language = info.get('in_language', [])
         new_languages = set([lang.id for lang in in_language])
-        old_languages = set(obj.in_language.values_list('id', flat=True))
+        old_languages = set(obj.in_language_ids)
         if new_languages != old_languages:
             if obj.is_user_edited():
                 # this prevents overwriting manually added languages
@@ -462,26 +516,13 @@ class Importer(object):
                 if course_changed:
                     obj._changed = True
 
-        if obj._changed or obj._created:
-            # save again after adding related fields to update last_modified_time!
-            try:
-                obj.save()
-            except ValidationError as error:
-                print('Event ' + str(obj) + ' could not be saved: ' + str(error))
-                raise
-            if obj._created:
-                verb = "created"
-            else:
-                verb = "changed (fields: %s)" % ', '.join(obj._changed_fields)
-            logger.debug("{} {}".format(obj, verb))
-
-        return obj
-
+    @timed('save', queries='place')
     def save_place(self, info):
         args = dict(data_source=info['data_source'], origin_id=info['origin_id'])
         obj_id = "%s:%s" % (info['data_source'].id, info['origin_id'])
         try:
-            obj = Place.objects.get(**args)
+            with get_profiler().phase('match'):
+                obj = Place.objects.get(**args)
             obj._created = False
             assert obj.id == obj_id
         except Place.DoesNotExist:
@@ -528,7 +569,7 @@ class Importer(object):
             else:
                 verb = "changed"
             logger.debug("%s %s" % (obj, verb))
-            obj.save()
+            obj.save_changed()
 
         return obj
 
@@ -6,7 +6,6 @@ from datetime import datetime, timedelta
 
 import requests
 
-import bleach
 import dateutil.parser
 import pytz
 import requests_cache
@@ -20,6 +19,7 @@ from events.models import (
 from django_orghierarchy.models import Organization
 from pytz import timezone
 
+from events.sanitization import get_sanitizer
 from .base import Importer, recur_dict, register_importer
 from .yso import KEYWORDS_TO_ADD_TO_AUDIENCE
 from .sync import ModelSyncher
@@ -233,6 +233,7 @@ class APIBrokenError(Exception):
 @register_importer
 class EspooImporter(Importer):
     name = "espoo"
+    dependencies = ('tprek', 'yso')
     supported_languages = ['fi', 'sv', 'en']
     keyword_cache = {}
     location_cache = {}
@@ -497,7 +498,7 @@ class EspooImporter(Importer):
         if ext_props.get('EventDescription', ''):
             desc = ext_props['EventDescription']
             ok_tags = ('u', 'b', 'h2', 'h3', 'em', 'ul', 'li', 'strong', 'br', 'p', 'a')
-            desc = bleach.clean(desc, tags=ok_tags, strip=True)
+            desc = get_sanitizer(ok_tags, strip=True)(desc)
             event['description'][lang] = clean_text(desc)
             del ext_props['EventDescription']
 
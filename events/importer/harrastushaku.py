@@ -57,6 +57,7 @@ class HarrastushakuException(Exception):
 @register_importer
 class HarrastushakuImporter(Importer):
     name = 'harrastushaku'
+    dependencies = ('tprek',)
     supported_languages = ['fi']
 
     def setup(self):
@@ -169,18 +170,11 @@ class HarrastushakuImporter(Importer):
             event_delete,
         )
 
-        num_of_activities = len(activities)
-        logger.debug('Handling {} activities...'.format(num_of_activities))
+        logger.debug('Handling {} activities...'.format(len(activities)))
 
-        for i, activity in enumerate(activities, 1):
-            try:
-                self.handle_activity(activity)
-            except Exception as e:  # noqa
-                message = e if isinstance(e, HarrastushakuException) else traceback.format_exc()
-                logger.error('Error handling activity {}: {}'.format(activity.get('id'), message))
-
-            if not i % 10:
-                logger.debug('{} / {} activities handled.'.format(i, num_of_activities))
+        # a recurring activity is saved as a super event and its sub events, so the activity is the shard key
+        self.process_sharded(activities, self.handle_activity_safely, lambda activity: activity.get('id'),
+                             syncher_attr='event_syncher')
 
         self.event_syncher.finish(force=True)
         logger.info('Course import finished.')
@@ -207,6 +201,13 @@ class HarrastushakuImporter(Importer):
             logger.error('Cannot fetch courses: {}'.format(e))
         return []
 
+    def handle_activity_safely(self, activity):
+        try:
+            self.handle_activity(activity)
+        except Exception as e:  # noqa
+            message = e if isinstance(e, HarrastushakuException) else traceback.format_exc()
+            logger.error('Error handling activity {}: {}'.format(activity.get('id'), message))
+
     @transaction.atomic
     def handle_location(self, location_data):
         tprek_id = location_data.get('tpr_id')
@@ -386,7 +387,7 @@ class HarrastushakuImporter(Importer):
         def delete_sub_event(obj):
             logger.debug('{} deleted'.format(obj))
             obj.deleted = True
-            obj.save()
+            obj.save_changed()
 
         sub_event_syncher = ModelSyncher(
             super_event.sub_events.filter(deleted=False), lambda o: o.id, delete_func=delete_sub_event)
@@ -412,7 +413,7 @@ class HarrastushakuImporter(Importer):
             super_event._changed = True
 
         if super_event._changed:
-            super_event.save()
+            super_event.save_changed(touch=True)
 
     def create_sub_event_origin_id_suffix(self, sub_event_time_range):
         start, end = sub_event_time_range
@@ -11,10 +11,10 @@ from django.utils.html import strip_tags
 from .base import Importer, register_importer, recur_dict
 from .yso import KEYWORDS_TO_ADD_TO_AUDIENCE
 from events.models import Event, Keyword, DataSource, Place
+from events.sanitization import get_sanitizer
 from django_orghierarchy.models import Organization
 from pytz import timezone
 import pytz
-import bleach
 from django.conf import settings
 from .util import clean_text
 
@@ -168,6 +168,7 @@ class APIBrokenError(Exception):
 @register_importer
 class HelmetImporter(Importer):
     name = "helmet"
+    dependencies = ('tprek', 'yso')
     supported_languages = ['fi', 'sv', 'en', 'ru']
     current_tick_index = 0
     kwcache = {}
@@ -274,7 +275,7 @@ class HelmetImporter(Importer):
         if ext_props.get('Description', ''):
             desc = ext_props['Description']
             ok_tags = ('u', 'b', 'h2', 'h3', 'em', 'ul', 'li', 'strong', 'br', 'p', 'a')
-            desc = bleach.clean(desc, tags=ok_tags, strip=True)
+            desc = get_sanitizer(ok_tags, strip=True)(desc)
             # long description is html formatted, so we don't want plain text whitespaces
             desc = clean_text(desc, True)
             Importer._set_multiscript_field(desc, event, [lang]+LANGUAGES_TO_DETECT, 'description')
@@ -348,11 +349,11 @@ class HelmetImporter(Importer):
                 current_name = getattr(keyword_orig, name_key)
                 if not current_name:  # is None or empty
                     setattr(keyword_orig, name_key, name)
-                    keyword_orig.save()
+                    keyword_orig.save_changed()
 
             if keyword_orig.publisher_id != self.organization.id:
                 keyword_orig.publisher = self.organization
-                keyword_orig.save()
+                keyword_orig.save_changed()
 
             event_keywords.add(keyword_orig)
             # Saving original keyword ends
@@ -477,9 +478,12 @@ class HelmetImporter(Importer):
 
         self.syncher = ModelSyncher(qs, lambda obj: obj.origin_id, delete_func=mark_deleted)
 
-        for event in event_list:
-            obj = self.save_event(event)
-            self.syncher.mark(obj)
+        self.process_sharded(event_list, self._save_and_mark_event, lambda event: event['origin_id'],
+                             syncher_attr='syncher')
 
         self.syncher.finish(force=self.options['force'])
         logger.info("%d events processed" % len(events.values()))
+
+    def _save_and_mark_event(self, event):
+        obj = self.save_event(event)
+        self.syncher.mark(obj)
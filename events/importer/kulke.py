@@ -182,6 +182,7 @@ def get_event_name(event):
 @register_importer
 class KulkeImporter(Importer):
     name = "kulke"
+    dependencies = ('tprek', 'yso')
     supported_languages = ['fi', 'sv', 'en']
     languages_to_detect = []
 
@@ -323,63 +324,79 @@ class KulkeImporter(Importer):
             formatted_paragraphs.append(formatted_paragraph)
         return ''.join(formatted_paragraphs)
 
+    @staticmethod
+    def _get_text_content(event_el, t):
+        text = unicodetext(event_el.find('event' + t))
+        if text is None:
+            return None
+        return text.strip() or None
+
+    def _should_import(self, event_el, is_course=False):
+        if self._get_text_content(event_el, 'servicecode') != 'Pelkkä ilmoitus' and not is_course:
+            # Skip courses when importing events
+            return False
+
+        if self.options['single']:
+            if str(int(event_el.attrib['id'])) != self.options['single']:
+                return False
+        return True
+
+    def _get_multiscript_texts(self, event_el):
+        """
+        Return the name, caption, description and provider of the event, which may contain paragraphs in
+        any of the supported languages.
+        """
+        title = self._get_text_content(event_el, 'title')
+        subtitle = self._get_text_content(event_el, 'subtitle')
+        name = make_event_name(title, subtitle)
+
+        caption = self._get_text_content(event_el, 'caption')
+        # body text should not be cleaned, as we want to html format the whole shebang
+        bodytext = event_el.find('eventbodytext')
+        if bodytext is not None:
+            bodytext = bodytext.text
+        description = ''
+        if caption:
+            description += caption
+        if caption and bodytext:
+            description += "\n\n"
+        if bodytext:
+            description += bodytext
+        if description:
+            description = self._html_format(description)
+
+        provider = self._get_text_content(event_el, 'organizer')
+        return name, caption, description, provider
+
     def _import_event(self, lang, event_el, events, is_course=False):
         def text(t):
             return unicodetext(event_el.find('event' + t))
 
-        def clean(t):
-            if t is None:
-                return None
-            t = t.strip()
-            if not t:
-                return None
-            return t
-
         def text_content(k):
-            return clean(text(k))
-
-        eid = int(event_el.attrib['id'])
+            return self._get_text_content(event_el, k)
 
-        if text_content('servicecode') != 'Pelkkä ilmoitus' and not is_course:
-            # Skip courses when importing events
+        if not self._should_import(event_el, is_course):
             return False
 
-        if self.options['single']:
-            if str(eid) != self.options['single']:
-                return False
-
+        eid = int(event_el.attrib['id'])
         event = events[eid]
         event['data_source'] = self.data_source
         event['publisher'] = self.organization
         event['origin_id'] = eid
 
-        title = text_content('title')
-        subtitle = text_content('subtitle')
-        event['headline'][lang] = title
-        event['secondary_headline'][lang] = subtitle
-        name = make_event_name(title, subtitle)
+        event['headline'][lang] = text_content('title')
+        event['secondary_headline'][lang] = text_content('subtitle')
+        name, caption, description, provider = self._get_multiscript_texts(event_el)
         # kulke strings may be in other supported languages
         if name:
             Importer._set_multiscript_field(name, event, [lang] + self.languages_to_detect, 'name')
 
-        caption = text_content('caption')
-        # body text should not be cleaned, as we want to html format the whole shebang
-        bodytext = event_el.find('eventbodytext')
-        if bodytext is not None:
-            bodytext = bodytext.text
-        description = ''
         if caption:
-            description += caption
             # kulke strings may be in other supported languages
             Importer._set_multiscript_field(caption, event, [lang]+self.languages_to_detect, 'short_description')
         else:
             event['short_description'][lang] = None
-        if caption and bodytext:
-            description += "\n\n"
-        if bodytext:
-            description += bodytext
         if description:
-            description = self._html_format(description)
             # kulke strings may be in other supported languages
             Importer._set_multiscript_field(description, event, [lang]+self.languages_to_detect, 'description')
         else:
@@ -423,7 +440,6 @@ class KulkeImporter(Importer):
                             print('Cannot create an image, "event_only" License missing.')
                     break
 
-        provider = text_content('organizer')
         if provider:
             Importer._set_multiscript_field(provider, event, [lang]+self.languages_to_detect, 'provider')
 
@@ -642,7 +658,7 @@ class KulkeImporter(Importer):
         for k in common_audience:
             super_event.audience.add(k)
 
-        super_event.save()
+        super_event.save_changed(touch=True)
 
     def _save_recurring_superevents(self, recurring_groups):
         groups = map(frozenset, recurring_groups.values())
@@ -703,7 +719,7 @@ class KulkeImporter(Importer):
                             pass
             for event in events:
                 event.super_event = aggregate.super_event
-                event.save()
+                event.save_changed()
             aggregates.add(aggregate)
         return aggregates
 
@@ -723,7 +739,11 @@ class KulkeImporter(Importer):
             events_file = os.path.join(
                 settings.IMPORT_FILE_PATH, 'kulke', 'events-%s.xml' % lang)
             root = etree.parse(events_file)
-            for event_el in root.xpath('/eventdata/event'):
+            event_els = [event_el for event_el in root.xpath('/eventdata/event')
+                         if self._should_import(event_el, importing_courses)]
+            # detect the languages of all the texts at once, possibly in parallel
+            self.detect_languages(text for event_el in event_els for text in self._get_multiscript_texts(event_el))
+            for event_el in event_els:
                 success = self._import_event(lang, event_el, events, importing_courses)
                 if success:
                     self._gather_recurring_events(lang, event_el, events, recurring_groups)
@@ -753,10 +773,10 @@ class KulkeImporter(Importer):
                 word = Keyword.objects.get(id=make_kulke_id(kid))
                 if word.name != value['text']:
                     word.name = value['text']
-                    word.save()
+                    word.save_changed()
                 if word.publisher_id != self.organization.id:
                     word.publisher = self.organization
-                    word.save()
+                    word.save_changed()
             except ObjectDoesNotExist:
                 # if the keyword does not exist, save it for future use
                 Keyword.objects.create(
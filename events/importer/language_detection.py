@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Shared language detection for importers.
+
+langdetect creates a new detector for every `detect` call. Importers run
+detection on every paragraph of every description in every language, and
+the same paragraphs (e.g. in recurring events) are seen over and over again.
+This module keeps a single pre-loaded detector factory and memoizes the
+results by a hash of the paragraph, optionally running cache misses in a
+process pool.
+"""
+import hashlib
+import logging
+from multiprocessing import Pool
+
+from langdetect.detector_factory import DetectorFactory, PROFILES_DIRECTORY
+from langdetect.lang_detect_exception import LangDetectException
+
+# Per module logger
+logger = logging.getLogger(__name__)
+
+# Do not bother spinning up worker processes for small batches
+MIN_POOL_BATCH_SIZE = 200
+
+_factory = None
+
+
+def get_detector_factory():
+    """
+    Return the process-wide detector factory, loading the language profiles on first use.
+    """
+    global _factory
+    if _factory is None:
+        factory = DetectorFactory()
+        factory.load_profile(PROFILES_DIRECTORY)
+        _factory = factory
+    return _factory
+
+
+def detect_language(text):
+    """
+    Detect the language of a single paragraph without caching.
+
+    :param text: The paragraph to detect the language of
+    :return: langdetect language code, or None if no language could be detected
+    """
+    detector = get_detector_factory().create()
+    detector.append(text)
+    try:
+        return detector.detect()
+    except LangDetectException:
+        return None
+
+
+def _init_worker():
+    # load the profiles once per worker process instead of once per task
+    get_detector_factory()
+
+
+class LanguageDetector(object):
+    """
+    Memoizing language detector.
+
+    Results are stored by the SHA-1 digest of the paragraph, so long descriptions
+    do not have to be kept in memory as keys. The cache is simply dropped when it
+    grows past max_size.
+    """
+    def __init__(self, max_size=100000, processes=None):
+        self.max_size = max_size
+        self.processes = processes
+        self._cache = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(text):
+        return hashlib.sha1(text.encode('utf-8')).digest()
+
+    def _store(self, key, language):
+        if len(self._cache) >= self.max_size:
+            logger.debug('language detection cache full, clearing %d entries' % len(self._cache))
+            self._cache.clear()
+        self._cache[key] = language
+
+    def detect(self, text):
+        """
+        Detect the language of a single paragraph.
+
+        :param text: The paragraph to detect the language of
+        :return: langdetect language code, or None if no language could be detected
+        """
+        key = self._key(text)
+        try:
+            language = self._cache[key]
+        except KeyError:
+            self.misses += 1
+            language = detect_language(text)
+            self._store(key, language)
+        else:
+            self.hits += 1
+        return language
+
+    def detect_many(self, texts, processes=None):
+        """
+        Detect the languages of a batch of paragraphs.
+
+        Paragraphs missing from the cache are detected in a process pool if
+        processes (or the detector default) is set and the batch is large enough.
+
+        :param texts: Iterable of paragraphs
+        :param processes: Number of worker processes to use for cache misses
+        :return: List of language codes (or None) in the order of texts
+        """
+        texts = list(texts)
+        keys = [self._key(text) for text in texts]
+        found = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key in found or key in missing:
+                continue
+            if key in self._cache:
+                found[key] = self._cache[key]
+            else:
+                missing[key] = text
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+
+        if missing:
+            if processes is None:
+                processes = self.processes
+            missing_keys = list(missing.keys())
+            missing_texts = [missing[key] for key in missing_keys]
+            if processes and processes > 1 and len(missing_texts) >= MIN_POOL_BATCH_SIZE:
+                with Pool(processes, initializer=_init_worker) as pool:
+                    languages = pool.map(detect_language, missing_texts, chunksize=50)
+            else:
+                languages = [detect_language(text) for text in missing_texts]
+            for key, language in zip(missing_keys, languages):
+                found[key] = language
+                self._store(key, language)
+
+        return [found[key] for key in keys]
+
+    def clear(self):
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+_detector = None
+
+
+def get_language_detector():
+    """
+    Return the shared memoizing detector used by the importers.
+    """
+    global _detector
+    if _detector is None:
+        _detector = LanguageDetector()
+    return _detector
@@ -3,7 +3,6 @@ import codecs
 import csv
 import pytz
 import re
-import bleach
 import requests
 import logging
 from os.path import commonprefix
@@ -14,6 +13,7 @@ from django.core.exceptions import ImproperlyConfigured, ValidationError
 from django.utils.html import strip_tags
 from django_orghierarchy.models import Organization
 from events.models import DataSource, Event, Keyword, Place, License
+from events.sanitization import get_sanitizer
 from .base import Importer, recur_dict, register_importer
 from .sync import ModelSyncher
 from .util import clean_text
@@ -123,7 +123,7 @@ def replace_html_breaks_with_whitespace(text):
 
 def clean_description(text):
     ok_tags = ('u', 'b', 'h2', 'h3', 'em', 'ul', 'li', 'strong', 'br', 'p', 'a')
-    text = bleach.clean(text, tags=ok_tags, strip=True)
+    text = get_sanitizer(ok_tags, strip=True)(text)
     text = text.replace('<br><br>', '</p><p>').replace('<b>', '<strong>').replace('</b>', '</strong>')
     # enclosing paragraphs seem to be missing
     if text and not text.startswith('<p>'):
@@ -152,6 +152,7 @@ def get_namespaced_event_serie_id(event_serie_id):
 @register_importer
 class LippupisteImporter(Importer):
     name = 'lippupiste'
+    dependencies = ('tprek', 'yso')
     supported_languages = ['fi']
     languages_to_detect = []
 
@@ -372,6 +373,17 @@ class LippupisteImporter(Importer):
             return place_id
         return None
 
+    @staticmethod
+    def _get_multiscript_texts(source_event):
+        """
+        Return the provider, name, description, short description and venue of the event, which may contain
+        paragraphs in any of the supported languages.
+        """
+        # the uppercase names are so last century
+        return (source_event['EventPromoterName'], source_event['EventName'].lower().title(),
+                clean_description(source_event['EventSerieText']),
+                clean_short_description(source_event['EventSerieText']), source_event['EventVenue'])
+
     def _update_event_data(self, event, source_event):
         lang = 'fi'
         event_source_id = source_event['EventId']
@@ -386,17 +398,14 @@ class LippupisteImporter(Importer):
         # we would prefer to retain the local timezone, so as to better communicate it to base importer
         # event_datetime = event_datetime.astimezone(pytz.utc)
         event['start_time'] = event_datetime
-        provider = source_event['EventPromoterName']
+        provider, name, description, short_description, location_extra_info = \
+            self._get_multiscript_texts(source_event)
         if provider:
             Importer._set_multiscript_field(provider, event, [lang]+self.languages_to_detect, 'provider')
-        # the uppercase names are so last century
-        name = source_event['EventName'].lower().title()
         if name:
             Importer._set_multiscript_field(name, event, [lang] + self.languages_to_detect, 'name')
-        description = clean_description(source_event['EventSerieText'])
         if description:
             Importer._set_multiscript_field(description, event, [lang] + self.languages_to_detect, 'description')
-        short_description = clean_short_description(source_event['EventSerieText'])
         if short_description:
             Importer._set_multiscript_field(short_description,
                                             event,
@@ -423,7 +432,6 @@ class LippupisteImporter(Importer):
             logger.warning("No match found for place '%s' (event %s)" % (source_event['EventVenue'],
                                                                          event['name'][lang]))
         # regardless of match, venue might have some extra info not found in tprek
-        location_extra_info = source_event['EventVenue']
         if location_extra_info:
             Importer._set_multiscript_field(location_extra_info,
                                             event,
@@ -480,7 +488,7 @@ class LippupisteImporter(Importer):
         last_event = events.order_by('-end_time').first()
         super_event.end_time = last_event.end_time
         super_event.has_end_time = last_event.has_end_time
-        super_event.save()
+        super_event.save_changed()
 
     def _synch_events(self, events):
         event_list = sorted(events.values(), key=lambda x: x['start_time'])
@@ -492,15 +500,20 @@ class LippupisteImporter(Importer):
                                     delete_func=mark_deleted,
                                     check_deleted_func=check_deleted)
 
-        for event in event_list:
-            obj = self.save_event(event)
-            if 'super_event_id' in event:
-                obj.super_event_id = event['super_event_id']
-                obj.save()
-            self.syncher.mark(obj)
+        # sub events of the same super event are kept in the same shard
+        self.process_sharded(event_list, self._save_and_mark_event,
+                             lambda event: event.get('super_event_id') or event['origin_id'],
+                             syncher_attr='syncher')
 
         self.syncher.finish(force=self.options['force'])
 
+    def _save_and_mark_event(self, event):
+        obj = self.save_event(event)
+        if 'super_event_id' in event:
+            obj.super_event_id = event['super_event_id']
+            obj.save_changed()
+        self.syncher.mark(obj)
+
     def import_events(self):
         if not LIPPUPISTE_EVENT_API_URL:
             raise ImproperlyConfigured("LIPPUPISTE_EVENT_API_URL must be set in local_settings")
@@ -510,6 +523,7 @@ class LippupisteImporter(Importer):
         if not event_source_data:
             raise ValidationError("Lippupiste API didn't return data, giving up")
 
+        imported_source_data = []
         for source_event in event_source_data:
             # check if the postal code matches
             for range in POSTAL_CODE_RANGES:
@@ -557,7 +571,13 @@ class LippupisteImporter(Importer):
                         break
                 else:
                     # not ignored
-                    self._import_event(source_event, events)
+                    imported_source_data.append(source_event)
+
+        # detect the languages of all the texts at once, possibly in parallel
+        self.detect_languages(text for source_event in imported_source_data
+                              for text in self._get_multiscript_texts(source_event))
+        for source_event in imported_source_data:
+            self._import_event(source_event, events)
         self._synch_events(events)
 
         # Because super events must exist to be linked, do this after synch. We also need to resynch.
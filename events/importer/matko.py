@@ -109,6 +109,7 @@ def zipcode_and_muni(text):
 @register_importer
 class MatkoImporter(Importer):
     name = "matko"
+    dependencies = ('tprek',)
     supported_languages = ['fi', 'sv', 'en']
 
     def __init__(self, *args, **kwargs):
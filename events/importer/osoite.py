@@ -148,7 +148,7 @@ class OsoiteImporter(Importer):
             else:
                 verb = "changed (fields: %s)" % ', '.join(obj._changed_fields)
             logger.info("%s %s" % (obj, verb))
-            obj.save()
+            obj.save_changed()
 
         syncher.mark(obj)
 
@@ -0,0 +1,283 @@
+"""
+Instrumentation of importer runs.
+
+While a profiler is active, the importer base class records the time spent in each phase of the run,
+the number of created, changed and unchanged objects, and the number of database queries it takes to
+save each object. Phases are timed exclusively: time spent in a nested phase (e.g. saving the place an
+event parser creates) is not counted in the enclosing phase, so the phase times add up to at most the
+wall clock time of the run. Time outside any phase is reported as unattributed.
+
+Phases:
+
+    fetch   HTTP requests to the source system (cache hits are not counted)
+    parse   converting source records to importer dicts
+    detect  detecting the languages of paragraphs in multilingual texts
+    match   looking up existing objects for imported records
+    save    saving events, places and images
+    m2m     syncing the related objects of events (keywords, offers, links, images...)
+    delete  deleting or marking deleted the objects missing from the source
+
+The hits and misses of the shared language detector cache are reported as the detect hits and detect
+misses counters. When no profiler is active, the instrumentation does nothing.
+"""
+import json
+import time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.db import connection
+
+# Importer methods converting a single source record, timed as the parse phase
+PARSE_METHODS = ('_import_event', '_import_event_from_feed', '_import_unit', 'get_event_data')
+
+PHASES = ('fetch', 'parse', 'detect', 'match', 'save', 'm2m', 'delete')
+
+
+def get_detector_counts():
+    from .language_detection import get_language_detector
+
+    detector = get_language_detector()
+    return Counter({'detect hits': detector.hits, 'detect misses': detector.misses})
+
+
+class _NullContext(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullProfiler(object):
+    """
+    Used when no profiler is active.
+    """
+    active = False
+    _null_context = _NullContext()
+
+    def phase(self, name):
+        return self._null_context
+
+    def count_queries(self, name):
+        return self._null_context
+
+    def count(self, name, n=1):
+        pass
+
+    def count_object(self, obj):
+        pass
+
+
+class ImportProfiler(object):
+    active = True
+
+    def __init__(self):
+        self.reset()
+        self._patched = []
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.stopped = None
+        self.phases = defaultdict(lambda: {'calls': 0, 'seconds': 0.0})
+        self.counters = Counter()
+        self.objects = defaultdict(Counter)
+        self.queries = defaultdict(lambda: {'count': 0, 'total': 0, 'max': 0})
+        self._stack = []
+        self._mark = None
+        self._detector_counts = get_detector_counts()
+
+    def _enter(self, name):
+        now = time.perf_counter()
+        if self._stack:
+            self.phases[self._stack[-1]]['seconds'] += now - self._mark
+        self._stack.append(name)
+        self.phases[name]['calls'] += 1
+        self._mark = now
+
+    def _exit(self):
+        now = time.perf_counter()
+        self.phases[self._stack.pop()]['seconds'] += now - self._mark
+        self._mark = now
+
+    @contextmanager
+    def phase(self, name):
+        self._enter(name)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    @contextmanager
+    def count_queries(self, name):
+        """
+        Count the database queries run in the block, e.g. to save a single object.
+        """
+        # the log is a bounded deque, so count from an empty log instead of subtracting lengths
+        connection.queries_log.clear()
+        try:
+            yield
+        finally:
+            n = len(connection.queries_log)
+            stats = self.queries[name]
+            stats['count'] += 1
+            stats['total'] += n
+            stats['max'] = max(stats['max'], n)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def count_object(self, obj):
+        if getattr(obj, '_created', False):
+            state = 'created'
+        elif getattr(obj, '_changed', False):
+            state = 'changed'
+        else:
+            state = 'unchanged'
+        self.objects[obj._meta.model_name][state] += 1
+
+    def start(self):
+        """
+        Start recording: log the queries of the default database connection and time HTTP requests.
+        """
+        from requests.adapters import HTTPAdapter
+
+        self.reset()
+        self._force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        self._patch(HTTPAdapter, 'send', 'fetch')
+
+    def stop(self):
+        self.stopped = time.perf_counter()
+        connection.force_debug_cursor = self._force_debug_cursor
+        connection.queries_log.clear()
+        for owner, attr, original in reversed(self._patched):
+            if original is None:
+                delattr(owner, attr)
+            else:
+                setattr(owner, attr, original)
+        self._patched = []
+
+    def _patch(self, owner, attr, phase):
+        # instance attributes are removed instead of restored when stopping
+        original = owner.__dict__.get(attr) if isinstance(owner, type) else None
+        self._patched.append((owner, attr, original))
+        setattr(owner, attr, timed(phase)(getattr(owner, attr)))
+
+    def instrument_importer(self, importer):
+        """
+        Time the record parsing methods of the given importer instance.
+        """
+        for name in PARSE_METHODS:
+            if hasattr(importer, name):
+                self._patch(importer, name, 'parse')
+
+    def as_dict(self):
+        seconds = (self.stopped or time.perf_counter()) - self.started
+        phases = OrderedDict()
+        for name in PHASES + tuple(sorted(set(self.phases) - set(PHASES))):
+            if name in self.phases:
+                phases[name] = {'calls': self.phases[name]['calls'],
+                                'seconds': round(self.phases[name]['seconds'], 3)}
+        queries = {}
+        for name, stats in self.queries.items():
+            queries[name] = dict(stats, mean=round(stats['total'] / stats['count'], 1) if stats['count'] else 0)
+        return {
+            'seconds': round(seconds, 3),
+            'phases': phases,
+            'unattributed_seconds': round(max(seconds - sum(p['seconds'] for p in self.phases.values()), 0), 3),
+            'objects': {model: {state: counts[state] for state in ('created', 'changed', 'unchanged')}
+                        for model, counts in self.objects.items()},
+            'queries': queries,
+            'counters': dict(self.counters + (get_detector_counts() - self._detector_counts)),
+        }
+
+    def merge(self, data):
+        """
+        Add the phases and counts recorded by a worker process, as returned by as_dict().
+        The phase times of parallel workers add up, so they may exceed the wall clock time of the run.
+        """
+        for name, stats in data['phases'].items():
+            self.phases[name]['calls'] += stats['calls']
+            self.phases[name]['seconds'] += stats['seconds']
+        for model, counts in data['objects'].items():
+            self.objects[model].update(counts)
+        for name, stats in data['queries'].items():
+            own = self.queries[name]
+            own['count'] += stats['count']
+            own['total'] += stats['total']
+            own['max'] = max(own['max'], stats['max'])
+        self.counters.update(data['counters'])
+
+    def format_text(self):
+        data = self.as_dict()
+        lines = ["Import profile, %.1fs in total" % data['seconds'],
+                 "%-14s %8s %10s" % ('phase', 'calls', 'seconds')]
+        for name, stats in data['phases'].items():
+            lines.append("%-14s %8d %10.3f" % (name, stats['calls'], stats['seconds']))
+        lines.append("%-14s %8s %10.3f" % ('unattributed', '', data['unattributed_seconds']))
+        if data['objects']:
+            lines.append("%-14s %8s %10s %10s" % ('objects', 'created', 'changed', 'unchanged'))
+            for model, counts in sorted(data['objects'].items()):
+                lines.append("%-14s %8d %10d %10d" % (model, counts['created'], counts['changed'],
+                                                      counts['unchanged']))
+        for name, stats in sorted(data['queries'].items()):
+            lines.append("queries per %s: mean %.1f, max %d (%d saves, %d queries)" % (
+                name, stats['mean'], stats['max'], stats['count'], stats['total']))
+        for name, value in sorted(data['counters'].items()):
+            lines.append("%s: %d" % (name, value))
+        return '\n'.join(lines)
+
+    def format_json(self):
+        return json.dumps(self.as_dict(), indent=2)
+
+
+_null_profiler = NullProfiler()
+_profiler = _null_profiler
+
+
+def get_profiler():
+    return _profiler
+
+
+@contextmanager
+def profile_import(importer=None):
+    """
+    Activate a new ImportProfiler for the duration of the block, yielding it.
+    """
+    global _profiler
+    profiler = ImportProfiler()
+    profiler.start()
+    if importer is not None:
+        profiler.instrument_importer(importer)
+    _profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _profiler = _null_profiler
+        profiler.stop()
+
+
+def timed(phase, queries=None):
+    """
+    Decorator timing the function as the given phase of an active profiler.
+
+    :param phase: Name of the phase
+    :param queries: If given, also count the queries run by the function under this name and count
+                    the object it returns as created, changed or unchanged
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _profiler
+            if not profiler.active:
+                return func(*args, **kwargs)
+            if queries is None:
+                with profiler.phase(phase):
+                    return func(*args, **kwargs)
+            with profiler.phase(phase), profiler.count_queries(queries):
+                obj = func(*args, **kwargs)
+            profiler.count_object(obj)
+            return obj
+        return wrapper
+    return decorator
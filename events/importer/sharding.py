@@ -0,0 +1,211 @@
+"""
+Sharded parallel processing of importer source records.
+
+The parsed source records of an import run are partitioned by a stable key (e.g. the super event or
+origin id) and each partition is converted and saved in a worker process. Workers are forked from the
+importer process, so they share the importer state at the time of the fork without pickling it, and each
+worker opens its own database connection.
+
+Workers do not delete anything through the ModelSyncher of the importer. The objects a worker marks are
+reported back to the importer process, which marks them in the real ModelSyncher, so that
+ModelSyncher.finish (including its deletion safety checks) and any linking of super events happen in a
+single process over the whole run. Objects synced with a syncher of their own within a single record are
+the exception: e.g. the Harrastushaku importer finishes the sub event syncher of each recurring event in
+the worker, deleting the sub events that are gone. The shard key keeps all the sub events of a super event
+in the same worker, so that this is safe.
+
+Each worker has its own copy of the caches of the importer from the time of the fork. Workers may thus
+create the same new image in different shards, so the images created for the same URL during a run are
+merged into one afterwards. Keywords are created with get_or_create on their unique ids, so concurrent
+workers end up with the same keyword.
+
+Concurrent workers cannot maintain the MPTT fields of events: a new root event takes the largest tree_id
+plus one, so two workers could give their new events the same tree. MPTT updates are thus disabled while
+the workers run, and the event tree is rebuilt once they are done.
+"""
+import logging
+import multiprocessing
+import os
+import zlib
+
+from django.db import connections
+from django.db.models import Max
+from django.db.utils import OperationalError
+
+from events.models import Event, Image
+
+from .profiling import get_profiler
+
+# Per module logger
+logger = logging.getLogger(__name__)
+
+# Forking workers does not pay off for small runs
+MIN_RECORDS_PER_PROCESS = 50
+# Use more shards than processes to even out the work between workers
+SHARDS_PER_PROCESS = 4
+
+# State shared with the forked workers
+_shard_state = {}
+
+
+def stable_shard(key, n_shards):
+    """
+    Return the shard of the given key. Unlike hash(), this does not change between processes or runs.
+    """
+    return zlib.crc32(str(key).encode('utf-8')) % n_shards
+
+
+def partition(records, shard_key, n_shards):
+    """
+    Partition records by their shard key, preserving the order of records within each shard.
+    """
+    shards = [[] for _ in range(n_shards)]
+    for record in records:
+        shards[stable_shard(shard_key(record), n_shards)].append(record)
+    return shards
+
+
+def get_process_count(processes):
+    if processes == 0:
+        return os.cpu_count() or 1
+    return processes or 1
+
+
+class SyncherShard(object):
+    """
+    Stands in for a ModelSyncher in a worker process. Marked objects are only recorded by id,
+    to be marked in the real syncher by the importer process.
+    """
+    def __init__(self, syncher):
+        self.syncher = syncher
+        self.marked = []
+
+    def mark(self, obj):
+        self.marked.append(self.syncher.generate_obj_id(obj))
+
+    def get(self, obj_id):
+        return self.syncher.get(obj_id)
+
+    def finish(self, force=False):
+        raise Exception("ModelSyncher.finish must be called by the importer process, not by a shard worker")
+
+
+def _process_record(process_func, record):
+    try:
+        process_func(record)
+    except OperationalError as error:
+        # workers updating the same keywords or places concurrently may deadlock, so try once more
+        if 'deadlock' not in str(error):
+            raise
+        logger.warning('Deadlock detected, retrying record: %s' % error)
+        process_func(record)
+
+
+def _process_shard(index):
+    importer = _shard_state['importer']
+    syncher_attr = _shard_state['syncher_attr']
+    shard_syncher = None
+    profiler = get_profiler()
+    if profiler.active:
+        # report only what this worker records
+        profiler.reset()
+    if syncher_attr:
+        # pool workers process several shards, so always wrap the real syncher, not the shard of the previous one
+        shard_syncher = SyncherShard(_shard_state['syncher'])
+        setattr(importer, syncher_attr, shard_syncher)
+    try:
+        for record in _shard_state['shards'][index]:
+            _process_record(_shard_state['process_func'], record)
+    finally:
+        if syncher_attr:
+            setattr(importer, syncher_attr, _shard_state['syncher'])
+        connections.close_all()
+    marked = shard_syncher.marked if shard_syncher else []
+    return marked, profiler.as_dict() if profiler.active else None
+
+
+def process_sharded(importer, records, process_func, shard_key, syncher_attr=None, processes=None):
+    """
+    Run process_func for every record, in parallel worker processes if processes is other than 1.
+
+    :param importer: The importer running the records
+    :param records: List of parsed source records
+    :param process_func: Callable converting and saving a single record, usually a method of the importer
+    :param shard_key: Callable returning the stable partition key of a record. Records that must be processed
+                      in the same process (e.g. the sub events of a super event) must have the same key.
+    :param syncher_attr: Name of the importer attribute containing the ModelSyncher process_func marks objects in
+    :param processes: Number of worker processes, 0 for one per CPU core
+    :return:
+    """
+    records = list(records)
+    processes = min(get_process_count(processes), len(records) // MIN_RECORDS_PER_PROCESS)
+    if processes <= 1:
+        for record in records:
+            process_func(record)
+        return
+
+    n_shards = processes * SHARDS_PER_PROCESS
+    shards = partition(records, shard_key, n_shards)
+    syncher = getattr(importer, syncher_attr) if syncher_attr else None
+    logger.info('Processing %d records in %d shards with %d processes' % (len(records), n_shards, processes))
+
+    last_image_id = Image.objects.aggregate(Max('id'))['id__max'] or 0
+    _shard_state.update(importer=importer, shards=shards, process_func=process_func, syncher_attr=syncher_attr,
+                        syncher=syncher)
+    # forked workers must not share the database connections of this process
+    connections.close_all()
+    try:
+        # the workers inherit the disabled MPTT updates
+        with Event._tree_manager.disable_mptt_updates():
+            with multiprocessing.get_context('fork').Pool(processes) as pool:
+                results = pool.map(_process_shard, range(n_shards), chunksize=1)
+    finally:
+        _shard_state.clear()
+        Event._tree_manager.rebuild()
+
+    profiler = get_profiler()
+    for marked, profile in results:
+        if profile is not None:
+            profiler.merge(profile)
+        if syncher is not None:
+            for obj_id in marked:
+                syncher.mark_id(obj_id)
+    merge_new_images(importer, last_image_id)
+
+
+def merge_new_images(importer, last_image_id):
+    """
+    Merge the images of the importer created for the same URL by different workers into the first one created,
+    and update the image cache of the importer.
+
+    :param importer: The importer running the records
+    :param last_image_id: The id of the last image created before the workers were started
+    :return:
+    """
+    images = Image.objects.filter(id__gt=last_image_id, publisher=importer.organization,
+                                  data_source=importer.data_source).exclude(url=None).order_by('id')
+    kept = {}
+    duplicates = {}
+    for image_id, url in images.values_list('id', 'url'):
+        if url in kept:
+            duplicates[image_id] = kept[url]
+        else:
+            kept[url] = image_id
+    if not duplicates:
+        return
+
+    logger.info('Merging %d images created by several workers' % len(duplicates))
+    for rel in Image._meta.related_objects:
+        if rel.many_to_many:
+            model, field_name = rel.through, rel.field.m2m_reverse_field_name()
+        else:
+            model, field_name = rel.related_model, rel.field.name
+        for duplicate_id, image_id in duplicates.items():
+            if rel.many_to_many:
+                # objects linking both images keep their link to the kept image only
+                source_name = rel.field.m2m_field_name()
+                linked = model.objects.filter(**{field_name: image_id}).values(source_name)
+                model.objects.filter(**{field_name: duplicate_id, source_name + '__in': linked}).delete()
+            model.objects.filter(**{field_name: duplicate_id}).update(**{field_name: image_id})
+    Image.objects.filter(id__in=duplicates).delete()
+    importer._images.update((image.url, image) for image in Image.objects.filter(id__in=kept.values()))
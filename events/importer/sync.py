@@ -1,5 +1,7 @@
 import logging
 
+from .profiling import get_profiler, timed
+
 # Per module logger
 logger = logging.getLogger(__name__)
 
@@ -32,9 +34,20 @@ class ModelSyncher(object):
             obj = self.obj_dict[obj_id]
         obj._found = True
 
+    def mark_id(self, obj_id):
+        # used when the object itself was handled in another process
+        obj = self.obj_dict.get(obj_id, None)
+        if obj is None:
+            # new objects are never candidates for deletion
+            return
+        if getattr(obj, '_found', False):
+            raise Exception("Object %s already marked" % obj)
+        obj._found = True
+
     def get(self, obj_id):
         return self.obj_dict.get(obj_id, None)
 
+    @timed('delete')
     def finish(self, force=False):
         delete_list = []
         for obj_id, obj in self.obj_dict.items():
@@ -61,4 +74,5 @@ class ModelSyncher(object):
                 obj.delete()
                 deleted = True
             if deleted:
+                get_profiler().count('deleted %s' % type(obj).__name__.lower())
                 logger.info("Deleting object %s" % obj)
@@ -2,11 +2,11 @@
 
 import re
 import logging
-from langdetect import detect
-from langdetect.lang_detect_exception import LangDetectException
 from django.utils.translation.trans_real import activate, deactivate
 
 from events.models import Place
+from .language_detection import get_language_detector
+from .profiling import timed
 
 # Per module logger
 logger = logging.getLogger(__name__)
@@ -23,7 +23,44 @@ def clean_text(text, strip_newlines=False):
     return re.sub(r'\s\s+', ' ', text, re.U).strip()
 
 
-def separate_scripts(text, scripts):
+PARAGRAPH_BREAKS = (r'</p><p>', r'</p>' r'\n', r'<p>', r'<br><br><br>')
+
+
+def split_paragraphs(text):
+    """
+    Splits html or plain text into paragraphs and the delimiters between them.
+    """
+    # separate the text by paragraphs, matching to select html and plain text delimiters in data
+    return re.split(r'(</p><p>|\n|</p>|<p>| – |<br><br><br>)+', text)
+
+
+def strip_paragraph(paragraph):
+    # replace any misleading tags left
+    return re.sub(r'(<(/)?strong>)|(<br>)+|&amp;|<a href=.*">|</a>', ' ', paragraph)
+
+
+@timed('detect')
+def detect_paragraph_languages(texts, detector=None, processes=None):
+    """
+    Runs language detection on all the paragraphs of the given texts in one batch. Importers call this
+    with all the texts of a run up front (see Importer.detect_languages), so that separate_scripts only hits
+    the detector cache later.
+
+    :param texts: Iterable of plain text or html strings.
+    :param detector: LanguageDetector to use, the shared importer detector by default.
+    :param processes: Number of worker processes to detect uncached paragraphs with.
+    :return: List of the detected language codes (or None) of the paragraphs, in order.
+    """
+    detector = detector or get_language_detector()
+    paragraphs = []
+    for text in texts:
+        paragraphs.extend(strip_paragraph(paragraph) for paragraph in split_paragraphs(text)
+                          if paragraph not in PARAGRAPH_BREAKS)
+    return detector.detect_many(paragraphs, processes=processes)
+
+
+@timed('detect')
+def separate_scripts(text, scripts, detector=None):
     """
     Takes in a string and an iterable of language tags and returns an array of string paragraphs
     separated by language. The first language in scripts is the default. The paragraphs may be either
@@ -31,26 +68,26 @@ def separate_scripts(text, scripts):
 
     :param text: The plain text or html to separate paragraphs in by language.
     :param scripts: Iterable of allowed languages.
+    :param detector: LanguageDetector to use, the shared importer detector by default.
     :return:
     """
-    # separate the text by paragraphs, matching to select html and plain text delimiters in data
-    paragraphs = re.split(r'(</p><p>|\n|</p>|<p>| – |<br><br><br>)+', text)
+    paragraphs = split_paragraphs(text)
+    # detect all the paragraphs of the text in one batch
+    detected = iter((detector or get_language_detector()).detect_many(
+        strip_paragraph(paragraph) for paragraph in paragraphs if paragraph not in PARAGRAPH_BREAKS))
     separated = {script: '' for script in scripts}
     # the first language given is the default one
     last_language = scripts[0]
     last_paragraph = ''
     for paragraph in paragraphs:
-        if paragraph in (r'</p><p>', r'</p>' r'\n', r'<p>', r'<br><br><br>'):
+        if paragraph in PARAGRAPH_BREAKS:
             # skip paragraph breaks to prevent misdetection
             separated[last_language] += paragraph
             last_paragraph = paragraph
             continue
-        # replace any misleading tags left
-        paragraph_stripped = re.sub(r'(<(/)?strong>)|(<br>)+|&amp;|<a href=.*">|</a>', ' ', paragraph)
-        try:
-            language = detect(paragraph_stripped)
-        except LangDetectException:
-            # an exception means no language could be detected
+        language = next(detected)
+        if language is None:
+            # no language could be detected
             language = last_language
         # langdetect maps "Simplified Chinese" to "zh-cn"
         # However, we store it as "zh_hans"
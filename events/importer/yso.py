@@ -287,7 +287,7 @@ class YsoImporter(Importer):
             keyword.publisher = self.organization
             keyword._changed = True
         if keyword._changed:
-            keyword.save()
+            keyword.save_changed()
 
         alt_labels = keyword_labels.get(get_yso_id(subject), [])
         keyword.alt_labels.add(*alt_labels)
@@ -0,0 +1,76 @@
+import random
+from datetime import timedelta
+
+from django.core.management import BaseCommand
+from django.db import connection, transaction
+from django_orghierarchy.models import Organization
+
+from events.models import DataSource, Event, PublicationStatus
+from events.sql import event_time_window_where
+
+
+class Command(BaseCommand):
+    help = ("Compare the query plans of the default public event listing before and after the partial indexes "
+            "of public events, on generated data that is rolled back afterwards")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', action='store', dest='events', type=int, default=200000,
+                            help='Number of events to generate (default: 200000)')
+        parser.add_argument('--seed', action='store', dest='seed', type=int, default=0,
+                            help='Random seed for the generated data')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            now = self.generate_events(options['events'], random.Random(options['seed']))
+            self.benchmark(now)
+            transaction.set_rollback(True)
+
+    def generate_events(self, n, rnd, batch_size=5000):
+        """
+        Generate events resembling the production data: a few years of mostly ended events, a small
+        share of drafts and deleted events, and some long-running exhibitions.
+        """
+        data_source = DataSource.objects.create(id='benchmark', name='benchmark')
+        publisher = Organization.objects.create(name='benchmark', origin_id='benchmark', data_source=data_source)
+        now = Event.now()
+        batch = []
+        for i in range(n):
+            start = now + timedelta(days=rnd.uniform(-4 * 365, 180))
+            if rnd.random() < 0.05:
+                end = start + timedelta(days=rnd.uniform(7, 120))
+            else:
+                end = start + timedelta(hours=rnd.uniform(1, 4))
+            status = PublicationStatus.DRAFT if rnd.random() < 0.05 else PublicationStatus.PUBLIC
+            batch.append(Event(
+                id='benchmark:%d' % i, name_fi='event %d' % i, data_source=data_source, publisher=publisher,
+                start_time=start, end_time=end, duration=end - start, publication_status=status,
+                deleted=rnd.random() < 0.1, lft=1, rght=2, tree_id=i, level=0,
+            ))
+            if len(batch) >= batch_size:
+                Event.objects.bulk_create(batch)
+                batch = []
+        Event.objects.bulk_create(batch)
+        with connection.cursor() as cursor:
+            # events are modified around the time they are published
+            cursor.execute("UPDATE events_event SET last_modified_time = start_time - random() * interval '60 days' "
+                           "WHERE data_source_id = 'benchmark';")
+            cursor.execute("ANALYZE events_event;")
+        self.stdout.write("Generated %d events" % n)
+        return now
+
+    def benchmark(self, now):
+        # the default listing of upcoming events as it was built before, and as it is built now
+        where, params = event_time_window_where(now, None)
+        before = Event.objects.filter(deleted=False, publication_status=PublicationStatus.PUBLIC).extra(
+            where=[where], params=params)
+        after = Event.objects.upcoming(now)
+        for name, queryset in (('before', before), ('after', after)):
+            self.explain('%s: count' % name, queryset.values('id').order_by())
+            self.explain('%s: first page' % name, queryset.order_by('-last_modified_time')[:20])
+
+    def explain(self, name, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql, params)
+            plan = [row[0] for row in cursor.fetchall()]
+        self.stdout.write('\n%s\n%s' % (name, '\n'.join(plan)))
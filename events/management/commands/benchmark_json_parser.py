@@ -0,0 +1,93 @@
+import io
+import json
+import re
+import timeit
+from unittest.mock import MagicMock
+
+from django.core.management import BaseCommand
+
+from events.parsers import CamelCaseJSONParser
+
+
+def legacy_convert_from_camelcase(s):
+    return re.sub(r'(^|[a-z])([A-Z])',
+                  lambda m: '_'.join([i.lower() for i in m.groups() if i]), s)
+
+
+def legacy_rename_fields(dataz):
+    if isinstance(dataz, dict):
+        new_data = dict()
+        for key, value in dataz.items():
+            newkey = legacy_convert_from_camelcase(key)
+            if isinstance(value, (dict, list)):
+                new_data[newkey] = legacy_rename_fields(value)
+            else:
+                new_data[newkey] = value
+        return new_data
+    elif isinstance(dataz, (list, tuple)):
+        new_data = []
+        for value in dataz:
+            if isinstance(value, (dict, list, tuple)):
+                new_data.append(legacy_rename_fields(value))
+            else:
+                new_data.append(value)
+        return new_data
+
+
+def legacy_parse(body):
+    """
+    CamelCaseJSONParser.parse before key conversion was cached and done while decoding
+    """
+    return legacy_rename_fields(json.loads(body.decode('utf-8')))
+
+
+def make_event(i):
+    languages = ('fi', 'sv', 'en')
+    return {
+        'id': 'helsinki:benchmark-%d' % i,
+        'name': {lang: 'Event %d (%s)' % (i, lang) for lang in languages},
+        'shortDescription': {lang: 'Short description %d' % i for lang in languages},
+        'description': {lang: '<p>Description of event %d</p>' % i * 5 for lang in languages},
+        'location': {'@id': 'https://api.hel.fi/linkedevents/v1/place/tprek:%d/' % (i % 500)},
+        'keywords': [{'@id': 'https://api.hel.fi/linkedevents/v1/keyword/yso:p%d/' % (i % 50 + k)}
+                     for k in range(5)],
+        'audience': [{'@id': 'https://api.hel.fi/linkedevents/v1/keyword/yso:p4354/'}],
+        'inLanguage': [{'@id': 'https://api.hel.fi/linkedevents/v1/language/fi/'}],
+        'offers': [{'isFree': False, 'price': {'fi': '10 e'}, 'infoUrl': {'fi': 'https://example.com/'},
+                    'description': None}],
+        'externalLinks': [{'name': 'extlink_facebook', 'link': 'https://facebook.com/', 'language': 'fi'}],
+        'startTime': '2020-02-01T12:00:00Z',
+        'endTime': '2020-02-01T14:00:00Z',
+        'publicationStatus': 'public',
+        'eventStatus': 'EventScheduled',
+        'superEvent': None,
+        'superEventType': None,
+        'locationExtraInfo': {'fi': 'Sali %d' % (i % 3)},
+        'provider': None,
+        'customData': {'sourceSystemId': str(i)},
+        'audienceMinAge': None,
+        'audienceMaxAge': None,
+    }
+
+
+class Command(BaseCommand):
+    help = "Compare the speed of CamelCaseJSONParser with its previous implementation on bulk event payloads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', action='store', dest='events', type=int, nargs='+',
+                            default=[10, 100, 1000], help='Bulk payload sizes (default: 10 100 1000)')
+        parser.add_argument('--repeat', action='store', dest='repeat', type=int, default=5,
+                            help='Number of timed runs, the best of which is reported (default: 5)')
+
+    def handle(self, *args, **options):
+        parser = CamelCaseJSONParser()
+        context = {'request': MagicMock(query_params={}), 'encoding': 'utf-8'}
+        self.stdout.write("%8s %10s %12s %12s %8s" % ('events', 'bytes', 'legacy ms', 'parser ms', 'speedup'))
+        for n in options['events']:
+            body = json.dumps([make_event(i) for i in range(n)]).encode('utf-8')
+            assert parser.parse(io.BytesIO(body), parser_context=context) == legacy_parse(body)
+            legacy = min(timeit.repeat(lambda: legacy_parse(body), number=1, repeat=options['repeat']))
+            current = min(timeit.repeat(lambda: parser.parse(io.BytesIO(body), parser_context=context),
+                                        number=1, repeat=options['repeat']))
+            self.stdout.write("%8d %10d %12.2f %12.2f %7.1fx" % (n, len(body), legacy * 1000, current * 1000,
+                                                                 legacy / current))
@@ -22,6 +22,15 @@ class Command(BaseCommand):
                             help='Export entities added after last export date')
         parser.add_argument('--delete', action='store_true', dest='delete',
                             help='Delete exported items from target system')
+        parser.add_argument('--output', dest='output', help='Output directory (snapshot exporter)')
+        parser.add_argument('--base-url', dest='base_url',
+                            help='Base URL of the API links, e.g. https://api.hel.fi (snapshot exporter)')
+        parser.add_argument('--workers', dest='workers', type=int, default=1,
+                            help='Number of parallel export processes (snapshot exporter)')
+        parser.add_argument('--chunk-size', dest='chunk_size', type=int,
+                            help='Number of objects in each exported file (snapshot exporter)')
+        parser.add_argument('--resume', action='store_true', dest='resume',
+                            help='Resume an interrupted export (snapshot exporter)')
         for exp in self.exporter_types:
             parser.add_argument('--%s' % exp, dest=exp, action='store_true', help='export %s' % exp)
 
@@ -31,7 +40,7 @@ class Command(BaseCommand):
             raise CommandError("Exporter %s not found. Valid exporters: %s" % (module, self.exp_list))
         exp_class = self.exporters[module]
 
-        exporter = exp_class()
+        exporter = exp_class(options)
 
         # Activate the default language for the duration of the export
         # to make sure translated fields are populated correctly.
@@ -1,9 +1,13 @@
+import cProfile
 import os
+from contextlib import ExitStack
+
 from django.conf import settings
 from django.core.management.base import BaseCommand, CommandError
 from django.utils.translation import activate, get_language
 
 from events.importer.base import get_importers
+from events.importer.profiling import profile_import
 
 
 class Command(BaseCommand):
@@ -29,6 +33,17 @@ class Command(BaseCommand):
                             help='Remap all deleted entities to new ones')
         parser.add_argument('--force', action='store_true', dest='force',
                             help='Allow deleting any number of entities if necessary')
+        parser.add_argument('--processes', action='store', dest='processes', type=int, default=1,
+                            help='Number of processes to save events and detect languages in, if supported '
+                                 'by the importer (0 for one per CPU core)')
+        parser.add_argument('--profile', action='store', dest='profile', nargs='?', const='text',
+                            choices=['text', 'json'],
+                            help='Report the time spent in each import phase, object counts and queries per '
+                                 'saved object, as text (default) or JSON')
+        parser.add_argument('--profile-output', action='store', dest='profile_output',
+                            help='Write the profile report to the given file instead of standard output')
+        parser.add_argument('--cprofile', action='store', dest='cprofile',
+                            help='Dump cProfile statistics of the import to the given file')
 
         for imp in self.importer_types:
             parser.add_argument('--%s' % imp, dest=imp, action='store_true', help='import %s' % imp)
@@ -43,18 +58,42 @@ class Command(BaseCommand):
             root_dir = settings.PROJECT_ROOT
         else:
             root_dir = settings.BASE_DIR
-        importer = imp_class({'data_path': os.path.join(root_dir, 'data'),
-                              'verbosity': int(options['verbosity']),
-                              'cached': options['cached'],
-                              'single': options['single'],
-                              'remap': options['remap'],
-                              'force': options['force']})
-
-        # Activate the default language for the duration of the import
-        # to make sure translated fields are populated correctly.
-        old_lang = get_language()
-        activate(settings.LANGUAGES[0][0])
+        importer_options = {'data_path': os.path.join(root_dir, 'data'),
+                            'verbosity': int(options['verbosity']),
+                            'cached': options['cached'],
+                            'single': options['single'],
+                            'remap': options['remap'],
+                            'force': options['force'],
+                            'processes': options['processes']}
+
+        with ExitStack() as stack:
+            # profile the importer setup as well, it usually fetches some data
+            profiler = None
+            if options['profile']:
+                profiler = stack.enter_context(profile_import())
+            if options['cprofile']:
+                cprofiler = cProfile.Profile()
+                cprofiler.enable()
+                stack.callback(cprofiler.dump_stats, options['cprofile'])
+                stack.callback(cprofiler.disable)
+
+            importer = imp_class(importer_options)
+            if profiler is not None:
+                profiler.instrument_importer(importer)
+
+            # Activate the default language for the duration of the import
+            # to make sure translated fields are populated correctly.
+            old_lang = get_language()
+            activate(settings.LANGUAGES[0][0])
+
+            self.run_importer(importer, options)
 
+            activate(old_lang)
+
+        if profiler is not None:
+            self.write_profile(profiler, options)
+
+    def run_importer(self, importer, options):
         for imp_type in self.importer_types:
             name = "import_%s" % imp_type
             method = getattr(importer, name, None)
@@ -70,4 +109,13 @@ class Command(BaseCommand):
             if method:
                 method()
 
-        activate(old_lang)
+    def write_profile(self, profiler, options):
+        if options['profile'] == 'json':
+            report = profiler.format_json()
+        else:
+            report = profiler.format_text()
+        if options['profile_output']:
+            with open(options['profile_output'], 'w') as f:
+                f.write(report + '\n')
+        else:
+            self.stdout.write(report)
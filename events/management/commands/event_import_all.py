@@ -0,0 +1,229 @@
+import json
+import os
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from django.utils.translation import activate
+
+from events.importer.base import get_importers
+from events.models import Event, Keyword, Place
+
+from .event_import import Command as ImportCommand
+
+# Node types other importers' events and courses are gated on
+PREREQUISITE_TYPES = ('places', 'keywords')
+
+
+def node_name(module, imp_type):
+    return '%s:%s' % (module, imp_type)
+
+
+def build_import_graph(importers, requested):
+    """
+    Build the dependency graph of the import run.
+
+    Every (importer, import type) pair is a node. Events and courses depend on all places and keywords nodes in
+    the run, a node depends on the earlier import types of the same importer, and all nodes of an importer
+    depend on the importers listed in its `dependencies`.
+
+    :param importers: dict of importer name to importer class, as returned by get_importers()
+    :param requested: dict of importer name to list of import types to run
+    :return: dict of node name to set of node names it depends on
+    """
+    graph = {}
+    for module, imp_types in requested.items():
+        for imp_type in imp_types:
+            graph[node_name(module, imp_type)] = set()
+
+    for module, imp_types in requested.items():
+        for imp_type in imp_types:
+            deps = graph[node_name(module, imp_type)]
+            for dep_module in getattr(importers[module], 'dependencies', ()):
+                deps.update(node_name(dep_module, t) for t in requested.get(dep_module, ()))
+            earlier_types = ImportCommand.importer_types[:ImportCommand.importer_types.index(imp_type)]
+            deps.update(node_name(module, t) for t in imp_types if t in earlier_types)
+            if imp_type not in PREREQUISITE_TYPES:
+                for other_module, other_types in requested.items():
+                    deps.update(node_name(other_module, t) for t in other_types if t in PREREQUISITE_TYPES)
+            deps.discard(node_name(module, imp_type))
+
+    # refuse to start a run that can never finish
+    remaining = {node: set(deps) for node, deps in graph.items()}
+    while remaining:
+        ready = [node for node, deps in remaining.items() if not deps]
+        if not ready:
+            raise CommandError("Importer dependency cycle between %s" % ', '.join(sorted(remaining)))
+        for node in ready:
+            del remaining[node]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return graph
+
+
+def count_changes(data_source, since):
+    counts = {}
+    for model in (Place, Keyword, Event):
+        qs = model.objects.filter(data_source=data_source)
+        counts[model._meta.model_name] = {
+            'created': qs.filter(created_time__gte=since).count(),
+            'changed': qs.filter(last_modified_time__gte=since).exclude(created_time__gte=since).count(),
+        }
+    return counts
+
+
+def run_import_node(module, imp_type, importer_options):
+    """
+    Run a single import type of a single importer. Executed in a worker process, which opens its own
+    database connection on first use.
+    """
+    activate(settings.LANGUAGES[0][0])
+    result = {'node': node_name(module, imp_type), 'pid': os.getpid()}
+    started = time.monotonic()
+    since = timezone.now()
+    try:
+        importer = get_importers()[module](importer_options)
+        result['setup_seconds'] = round(time.monotonic() - started, 3)
+        getattr(importer, 'import_%s' % imp_type)()
+        result['seconds'] = round(time.monotonic() - started, 3)
+        data_source = getattr(importer, 'data_source', None)
+        if data_source is not None:
+            result['rows'] = count_changes(data_source, since)
+        result['status'] = 'ok'
+    except Exception:
+        result['seconds'] = round(time.monotonic() - started, 3)
+        result['status'] = 'failed'
+        result['error'] = traceback.format_exc()
+    finally:
+        connections.close_all()
+    return result
+
+
+class Command(BaseCommand):
+    help = "Run several event data importers in parallel, respecting their dependencies"
+
+    def __init__(self):
+        super().__init__()
+        self.importers = get_importers()
+        self.imp_list = ', '.join(sorted(self.importers.keys()))
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*',
+                            help='Importers to run, optionally limited to import types, e.g. "tprek" '
+                                 'or "kulke:keywords,events". Valid importers: %s' % self.imp_list)
+        parser.add_argument('--all', action='store_true', dest='all',
+                            help='Run all registered importers')
+        parser.add_argument('--processes', action='store', dest='processes', type=int, default=None,
+                            help='Maximum number of importers to run at the same time (default: CPU count)')
+        parser.add_argument('--summary', action='store', dest='summary',
+                            help='Write the run summary as JSON to the given file')
+        parser.add_argument('--cached', action='store_true', dest='cached',
+                            help='Cache requests (if possible)')
+        parser.add_argument('--force', action='store_true', dest='force',
+                            help='Allow deleting any number of entities if necessary')
+
+    def get_requested(self, options):
+        specs = options['modules'] or []
+        if options['all']:
+            specs = sorted(self.importers.keys())
+        if not specs:
+            raise CommandError("Enter the names of the importers to run or --all. Valid importers: %s" %
+                               self.imp_list)
+        requested = {}
+        for spec in specs:
+            module, _, types = spec.partition(':')
+            if module not in self.importers:
+                raise CommandError("Importer %s not found. Valid importers: %s" % (module, self.imp_list))
+            imp_class = self.importers[module]
+            if types:
+                imp_types = types.split(',')
+                for imp_type in imp_types:
+                    if not hasattr(imp_class, 'import_%s' % imp_type):
+                        raise CommandError("Importer {} does not support importing {}".format(module, imp_type))
+            else:
+                imp_types = [t for t in ImportCommand.importer_types if hasattr(imp_class, 'import_%s' % t)]
+            if 'courses' in imp_types and 'extension_course' not in settings.INSTALLED_APPS:
+                if types:
+                    raise CommandError("Course extension must be installed when importing courses.")
+                imp_types.remove('courses')
+            requested.setdefault(module, [])
+            requested[module] += [t for t in imp_types if t not in requested[module]]
+        return requested
+
+    def handle(self, *args, **options):
+        requested = self.get_requested(options)
+        graph = build_import_graph(self.importers, requested)
+
+        if hasattr(settings, 'PROJECT_ROOT'):
+            root_dir = settings.PROJECT_ROOT
+        else:
+            root_dir = settings.BASE_DIR
+        importer_options = {'data_path': os.path.join(root_dir, 'data'),
+                            'verbosity': int(options['verbosity']),
+                            'cached': options['cached'],
+                            'single': None,
+                            'remap': False,
+                            'force': options['force'],
+                            'processes': 1}
+
+        pending = {node: set(deps) for node, deps in graph.items()}
+        results = {}
+        running = {}
+        started = time.monotonic()
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['processes']) as executor:
+            while pending or running:
+                for node in sorted(pending):
+                    deps = pending[node]
+                    failed = [dep for dep in deps if results.get(dep, {}).get('status') in ('failed', 'skipped')]
+                    if failed:
+                        results[node] = {'node': node, 'status': 'skipped', 'reason': 'failed: %s' % ', '.join(failed)}
+                        del pending[node]
+                    elif not deps - set(results):
+                        module, imp_type = node.split(':')
+                        self.stdout.write("Starting %s" % node)
+                        running[executor.submit(run_import_node, module, imp_type, importer_options)] = node
+                        del pending[node]
+                if not running:
+                    continue
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    results[node] = future.result()
+                    self.stdout.write("Finished %s: %s in %ss" % (node, results[node]['status'],
+                                                                  results[node]['seconds']))
+
+        summary = {
+            'seconds': round(time.monotonic() - started, 3),
+            'graph': {node: sorted(deps) for node, deps in graph.items()},
+            'importers': [results[node] for node in sorted(results)],
+        }
+        self.print_summary(summary)
+        if options['summary']:
+            with open(options['summary'], 'w') as f:
+                json.dump(summary, f, indent=2)
+
+        failed = [r['node'] for r in summary['importers'] if r['status'] != 'ok']
+        if failed:
+            for result in summary['importers']:
+                if result.get('error'):
+                    self.stderr.write("%s failed:\n%s" % (result['node'], result['error']))
+            raise CommandError("Importers not completed: %s" % ', '.join(failed))
+
+    def print_summary(self, summary):
+        self.stdout.write("Import run finished in %ss" % summary['seconds'])
+        for result in summary['importers']:
+            line = "%-28s %-8s" % (result['node'], result['status'])
+            if 'seconds' in result:
+                line += " %9.1fs" % result['seconds']
+            for model, counts in sorted(result.get('rows', {}).items()):
+                line += " %s +%d ~%d" % (model, counts['created'], counts['changed'])
+            if 'reason' in result:
+                line += " (%s)" % result['reason']
+            self.stdout.write(line)
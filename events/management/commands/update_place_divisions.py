@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+
+from events.models import Place
+
+
+class Command(BaseCommand):
+    help = "Update the administrative divisions of places, needed after importing new divisions with munigeo"
+
+    def handle(self, **kwargs):
+        places = Place.objects.filter(deleted=False).prefetch_related('divisions')
+        count = 0
+        for place in places:
+            place.update_divisions()
+            count += 1
+        print("A total of %s places updated." % count)
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0064_lengthen_id_foreign_keys'),
+    ]
+
+    # The indexed expression must match events.sql.EVENT_TIME_RANGE
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX events_event_time_range_idx ON events_event USING gist "
+            "(tstzrange(start_time, GREATEST(start_time, COALESCE(end_time, start_time)), '[]'));",
+            reverse_sql="DROP INDEX events_event_time_range_idx;"
+        ),
+    ]
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0065_add_event_time_range_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='duration',
+            field=models.DurationField(blank=True, db_index=True, editable=False, null=True, verbose_name='Duration'),
+        ),
+        migrations.RunSQL(
+            'UPDATE events_event SET duration = end_time - start_time '
+            'WHERE start_time IS NOT NULL AND end_time IS NOT NULL;',
+            reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
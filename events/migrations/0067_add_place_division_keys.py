@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+def forwards(apps, schema_editor):
+    Place = apps.get_model('events', 'Place')
+    for place in Place.objects.exclude(divisions=None).distinct().prefetch_related('divisions'):
+        keys = set()
+        for division in place.divisions.all():
+            keys.add(division.ocd_id)
+            for lang in [lang[0] for lang in settings.LANGUAGES]:
+                name = getattr(division, 'name_%s' % lang.replace('-', '_'), None)
+                if name:
+                    keys.add(name.lower())
+        Place.objects.filter(pk=place.pk).update(division_keys=sorted(key for key in keys if key))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0066_add_event_duration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='place',
+            name='division_keys',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddIndex(
+            model_name='place',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['division_keys'], name='events_place_division_keys_gin'),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
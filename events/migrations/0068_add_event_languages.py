@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import django.contrib.postgres.fields
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+def forwards(apps, schema_editor):
+    languages = [lang[0].replace('-', '_') for lang in settings.LANGUAGES]
+    translated = ', '.join(
+        "CASE WHEN name_{0} IS NOT NULL OR description_{0} IS NOT NULL OR short_description_{0} IS NOT NULL "
+        "THEN '{0}' END".format(lang) for lang in languages)
+    schema_editor.execute(
+        'UPDATE events_event SET translation_languages = '
+        'array_remove(ARRAY[%s]::varchar(10)[], NULL);' % translated)
+    schema_editor.execute(
+        'UPDATE events_event SET in_language_ids = languages.ids FROM ('
+        '  SELECT event_id, array_agg(language_id ORDER BY language_id) AS ids'
+        '  FROM events_event_in_language GROUP BY event_id'
+        ') AS languages WHERE languages.event_id = events_event.id;')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0067_add_place_division_keys'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='in_language_ids',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=10), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='translation_languages',
+            field=django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=10), blank=True, default=list, editable=False, size=None),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['in_language_ids'], name='events_event_in_language_gin'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['translation_languages'], name='events_event_translations_gin'),
+        ),
+        migrations.RunPython(forwards, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+# The conditions must match EventQuerySet.public()
+PUBLIC_EVENTS = "deleted = false AND publication_status = 1"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0068_add_event_languages'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            "CREATE INDEX events_event_public_end_time_idx ON events_event (end_time) WHERE %s;" % PUBLIC_EVENTS,
+            reverse_sql="DROP INDEX events_event_public_end_time_idx;"
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX events_event_public_start_time_idx ON events_event (start_time) WHERE %s;" % PUBLIC_EVENTS,
+            reverse_sql="DROP INDEX events_event_public_start_time_idx;"
+        ),
+        migrations.RunSQL(
+            "CREATE INDEX events_event_public_last_modified_idx ON events_event (last_modified_time) "
+            "WHERE %s;" % PUBLIC_EVENTS,
+            reverse_sql="DROP INDEX events_event_public_last_modified_idx;"
+        ),
+    ]
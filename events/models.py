@@ -17,11 +17,13 @@ documentation is suggesting: http://schema.org/docs/extension.html. Override
 schema_org_type can be used to define custom types. Override jsonld_context
 attribute to change @context when need to define schemas for custom fields.
 """
+import copy
 import datetime
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 import pytz
 from django.contrib.gis.db import models
+from django.contrib.gis.geos import GEOSGeometry
 from rest_framework.exceptions import ValidationError
 from reversion import revisions as reversion
 from django.utils.translation import ugettext_lazy as _
@@ -30,9 +32,10 @@ from mptt.querysets import TreeQuerySet
 from django.contrib.contenttypes.models import ContentType
 from events import translation_utils
 from django.utils.encoding import python_2_unicode_compatible
-from django.contrib.postgres.fields import HStoreField
+from django.contrib.postgres.fields import ArrayField, HStoreField
+from django.contrib.postgres.indexes import GinIndex
 from django.db import transaction
-from django.db.models.signals import m2m_changed
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from image_cropping import ImageRatioField
 from munigeo.models import AdministrativeDivision
@@ -89,6 +92,85 @@ class SimpleValueMixin(object):
         return self.simple_value() == other.simple_value()
 
 
+class DirtyFieldsMixin(object):
+    """
+    Used for models whose saves should only write the fields that changed.
+    Records the field values an instance is loaded from the database with,
+    so that save_changed() can limit the save to the changed columns.
+    """
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._store_loaded_values()
+        return instance
+
+    def _store_loaded_values(self, field_names=None):
+        if field_names is None or not hasattr(self, '_loaded_values'):
+            self._loaded_values = {}
+        for field in self._meta.concrete_fields:
+            if field_names is not None and field.name not in field_names and field.attname not in field_names:
+                continue
+            # deferred fields are not known
+            if field.attname not in self.__dict__:
+                continue
+            value = getattr(self, field.attname)
+            if isinstance(value, GEOSGeometry):
+                value = value.clone()
+            elif isinstance(value, (dict, list)):
+                value = copy.deepcopy(value)
+            self._loaded_values[field.attname] = value
+
+    def get_loaded_value(self, attname):
+        """
+        Return the value the field had in the database. Fetches it if the instance was not loaded from
+        the database, or None if there is no such row.
+        """
+        if attname in getattr(self, '_loaded_values', {}):
+            return self._loaded_values[attname]
+        if self._state.adding or self.pk is None:
+            return None
+        return type(self)._base_manager.filter(pk=self.pk).values_list(attname, flat=True).first()
+
+    def get_dirty_fields(self):
+        """
+        Return the names of the fields changed since the instance was loaded or saved,
+        or None if the instance was not loaded from the database.
+        """
+        if not hasattr(self, '_loaded_values'):
+            return None
+        dirty = []
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            if field.attname not in self._loaded_values or \
+                    getattr(self, field.attname) != self._loaded_values[field.attname]:
+                dirty.append(field.name)
+        return dirty
+
+    def save_changed(self, touch=False, **kwargs):
+        """
+        Save only the changed fields and last_modified_time. Returns False without saving if nothing changed,
+        unless touch is set, which updates last_modified_time anyway (e.g. when related objects changed).
+        """
+        dirty = None if self._state.adding else self.get_dirty_fields()
+        if dirty is None:
+            self.save(**kwargs)
+            return True
+        if not dirty and not touch:
+            return False
+        mptt_meta = getattr(self, '_mptt_meta', None)
+        if mptt_meta is not None and mptt_meta.parent_attr in dirty:
+            # moving the node in the tree needs a full save
+            self.save(**kwargs)
+            return True
+        self.save(update_fields=dirty + ['last_modified_time'], **kwargs)
+        return True
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._store_loaded_values(kwargs.get('update_fields'))
+
+
 class BaseQuerySet(models.QuerySet):
     def is_user_editable(self):
         return not bool(self.filter(data_source__isnull=True) and
@@ -121,7 +203,7 @@ class License(models.Model):
         return self.name
 
 
-class Image(models.Model):
+class Image(DirtyFieldsMixin, models.Model):
     jsonld_type = 'ImageObject'
     objects = BaseQuerySet.as_manager()
 
@@ -242,7 +324,7 @@ class KeywordLabel(models.Model):
         unique_together = (('name', 'language'),)
 
 
-class Keyword(BaseModel, ImageMixin):
+class Keyword(DirtyFieldsMixin, BaseModel, ImageMixin):
     publisher = models.ForeignKey(
         'django_orghierarchy.Organization', verbose_name=_('Publisher'), db_index=True, null=True, blank=True,
         related_name='Published_keywords')
@@ -294,7 +376,7 @@ class KeywordSet(BaseModel, ImageMixin):
     keywords = models.ManyToManyField(Keyword, blank=False, related_name='sets')
 
 
-class Place(MPTTModel, BaseModel, SchemalessFieldMixin, ImageMixin):
+class Place(DirtyFieldsMixin, MPTTModel, BaseModel, SchemalessFieldMixin, ImageMixin):
     objects = BaseTreeQuerySet.as_manager()
     geo_objects = objects
 
@@ -330,11 +412,14 @@ class Place(MPTTModel, BaseModel, SchemalessFieldMixin, ImageMixin):
         db_index=True
     )
     n_events_changed = models.BooleanField(default=False, db_index=True)
+    # ocd ids and lowercase names of the divisions, for filtering by division without joining them
+    division_keys = ArrayField(models.CharField(max_length=255), default=list, blank=True, editable=False)
 
     class Meta:
         verbose_name = _('place')
         verbose_name_plural = _('places')
         unique_together = (('data_source', 'origin_id'),)
+        indexes = [GinIndex(fields=['division_keys'], name='events_place_division_keys_gin')]
 
     def __unicode__(self):
         values = filter(lambda x: x, [
@@ -350,30 +435,123 @@ class Place(MPTTModel, BaseModel, SchemalessFieldMixin, ImageMixin):
                             "remove either one of the replacements."
                             "We don't want homeless events.")
 
+        update_fields = kwargs.get('update_fields')
+        dirty = None if self._state.adding else self.get_dirty_fields()
+
         # needed to remap events to replaced location
-        old_replaced_by = None
-        if self.id:
-            try:
-                old_replaced_by = Place.objects.get(id=self.id).replaced_by
-            except Place.DoesNotExist:
-                pass
+        old_replaced_by_id = None
+        if update_fields is not None and not {'replaced_by', 'replaced_by_id'} & set(update_fields):
+            old_replaced_by_id = self.replaced_by_id
+        elif self.id:
+            old_replaced_by_id = self.get_loaded_value('replaced_by_id')
+
+        # divisions only change with the position
+        position_changed = ((update_fields is None or 'position' in update_fields) and
+                            (dirty is None or 'position' in dirty))
+        if position_changed:
+            divisions = self.get_containing_divisions()
+            self.division_keys = get_division_keys(divisions)
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | {'division_keys'}
 
         super().save(*args, **kwargs)
 
         # needed to remap events to replaced location
-        if not old_replaced_by == self.replaced_by:
+        if not old_replaced_by_id == self.replaced_by_id:
             Event.objects.filter(location=self).update(location=self.replaced_by)
             # Update doesn't call save so we update event numbers manually.
             # Not all of the below are necessarily present.
-            ids_to_update = [event.id for event in (self, self.replaced_by, old_replaced_by) if event]
+            ids_to_update = [place_id for place_id in (self.id, self.replaced_by_id, old_replaced_by_id) if place_id]
             Place.objects.filter(id__in=ids_to_update).update(n_events_changed=True)
 
-        if self.position:
-            self.divisions.set(AdministrativeDivision.objects.filter(
-                type__type__in=('district', 'sub_district', 'neighborhood', 'muni'),
-                geometry__boundary__contains=self.position))
-        else:
-            self.divisions.clear()
+        if position_changed:
+            self.divisions.set(divisions)
+
+    def get_containing_divisions(self):
+        if not self.position:
+            return []
+        return list(AdministrativeDivision.objects.filter(
+            type__type__in=('district', 'sub_district', 'neighborhood', 'muni'),
+            geometry__boundary__contains=self.position))
+
+    def update_divisions(self):
+        """
+        Recompute the divisions of the place, e.g. after the divisions have been reimported.
+        """
+        self.divisions.set(self.get_containing_divisions())
+
+    def update_division_keys(self):
+        keys = get_division_keys(self.divisions.all())
+        if keys != self.division_keys:
+            self.division_keys = keys
+            Place.objects.filter(pk=self.pk).update(division_keys=keys)
+
+
+def get_division_keys(divisions):
+    """
+    Return the ocd ids and lowercase names in all languages of the given divisions.
+    """
+    keys = set()
+    for division in divisions:
+        keys.add(division.ocd_id)
+        for lang in [lang[0] for lang in settings.LANGUAGES]:
+            name = getattr(division, 'name_%s' % lang.replace('-', '_'), None)
+            if name:
+                keys.add(name.lower())
+    return sorted(key for key in keys if key)
+
+
+@receiver(m2m_changed, sender=Place.divisions.through)
+def place_divisions_changed(sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs):
+    """
+    Keeps the division keys of places up to date
+    """
+    if reverse and action == 'pre_clear':
+        # the places of a cleared division are not known afterwards
+        instance._cleared_place_ids = list(Place.objects.filter(divisions=instance).values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # places were added to or removed from a division
+        if pk_set is None:
+            pk_set = getattr(instance, '_cleared_place_ids', ())
+        for place in Place.objects.filter(pk__in=pk_set):
+            place.update_division_keys()
+    else:
+        instance.update_division_keys()
+
+
+@receiver(post_save, sender=AdministrativeDivision)
+def division_saved(sender, instance=None, created=False, **kwargs):
+    """
+    Updates the division keys of the places in a reimported division, in case its names changed. Places are
+    only added to new divisions by the update_place_divisions command, which must run after importing new
+    divisions.
+    """
+    if created:
+        return
+    for place in Place.objects.filter(divisions=instance).prefetch_related('divisions'):
+        place.update_division_keys()
+
+
+@receiver(pre_delete, sender=AdministrativeDivision)
+def division_deleting(sender, instance=None, **kwargs):
+    """
+    Remembers the places of a division being deleted, as deleting it removes them from the division
+    without m2m_changed
+    """
+    instance._deleted_place_ids = list(Place.objects.filter(divisions=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=AdministrativeDivision)
+def division_deleted(sender, instance=None, **kwargs):
+    """
+    Removes the division keys of a deleted division from its places
+    """
+    places = Place.objects.filter(pk__in=getattr(instance, '_deleted_place_ids', ())).prefetch_related('divisions')
+    for place in places:
+        place.update_division_keys()
 
 
 reversion.register(Place)
@@ -400,9 +578,28 @@ class OpeningHoursSpecification(models.Model):
         verbose_name_plural = _('opening hour specifications')
 
 
-class Event(MPTTModel, BaseModel, SchemalessFieldMixin):
+class EventQuerySet(BaseTreeQuerySet):
+    def public(self):
+        """
+        Public, non-deleted events. The conditions match the partial indexes of public events
+        (see migration 0069), so filters and orderings on their columns can use them.
+        """
+        return self.filter(deleted=False, publication_status=PublicationStatus.PUBLIC)
+
+    def upcoming(self, since=None):
+        """
+        Public events that have not ended by the given time (default now). Equivalent to the time window
+        filter without an end, but served by the partial indexes of public events instead of the
+        time range index, which also covers drafts and deleted events.
+        """
+        if since is None:
+            since = BaseModel.now()
+        return self.public().filter(models.Q(end_time__gt=since) | models.Q(start_time__gte=since))
+
+
+class Event(DirtyFieldsMixin, MPTTModel, BaseModel, SchemalessFieldMixin):
     jsonld_type = "Event/LinkedEvent"
-    objects = BaseTreeQuerySet.as_manager()
+    objects = EventQuerySet.as_manager()
 
     """
     eventStatus enumeration is based on http://schema.org/EventStatusType
@@ -472,6 +669,8 @@ class Event(MPTTModel, BaseModel, SchemalessFieldMixin):
     end_time = models.DateTimeField(verbose_name=_('End time'), null=True, db_index=True, blank=True)
     has_start_time = models.BooleanField(default=True)
     has_end_time = models.BooleanField(default=True)
+    # end_time - start_time, stored for filtering and sorting by duration
+    duration = models.DurationField(verbose_name=_('Duration'), null=True, blank=True, editable=False, db_index=True)
 
     audience_min_age = models.SmallIntegerField(verbose_name=_('Minimum recommended age'),
                                                 blank=True, null=True, db_index=True)
@@ -484,7 +683,13 @@ class Event(MPTTModel, BaseModel, SchemalessFieldMixin):
     super_event_type = models.CharField(max_length=255, blank=True, null=True, db_index=True,
                                         default=None, choices=SUPER_EVENT_TYPES)
 
+    # translated fields that make the event available in a language
+    TRANSLATED_CONTENT_FIELDS = ('name', 'description', 'short_description')
+
     in_language = models.ManyToManyField(Language, verbose_name=_('In language'), related_name='events', blank=True)
+    # denormalized languages of the event, for filtering by language without joins
+    in_language_ids = ArrayField(models.CharField(max_length=10), default=list, blank=True, editable=False)
+    translation_languages = ArrayField(models.CharField(max_length=10), default=list, blank=True, editable=False)
 
     images = models.ManyToManyField(Image, related_name='events', blank=True)
 
@@ -497,18 +702,22 @@ class Event(MPTTModel, BaseModel, SchemalessFieldMixin):
     class Meta:
         verbose_name = _('event')
         verbose_name_plural = _('events')
+        indexes = [
+            GinIndex(fields=['in_language_ids'], name='events_event_in_language_gin'),
+            GinIndex(fields=['translation_languages'], name='events_event_translations_gin'),
+        ]
 
     class MPTTMeta:
         parent_attr = 'super_event'
 
     def save(self, *args, **kwargs):
         # needed to cache location event numbers
-        old_location = None
-        if self.id:
-            try:
-                old_location = Event.objects.get(id=self.id).location
-            except Event.DoesNotExist:
-                pass
+        update_fields = kwargs.get('update_fields')
+        old_location_id = None
+        if update_fields is not None and not {'location', 'location_id'} & set(update_fields):
+            old_location_id = self.location_id
+        elif self.id:
+            old_location_id = self.get_loaded_value('location_id')
 
         # drafts may not have times set, so check that first
         start = getattr(self, 'start_time', None)
@@ -516,17 +725,33 @@ class Event(MPTTModel, BaseModel, SchemalessFieldMixin):
         if start and end:
             if start > end:
                 raise ValidationError({'end_time': _('The event end time cannot be earlier than the start time.')})
+        self.duration = end - start if start and end else None
+        if update_fields is not None and {'start_time', 'end_time'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'duration'}
+
+        if update_fields is None or any(field.startswith(self.TRANSLATED_CONTENT_FIELDS) for field in update_fields):
+            self.translation_languages = self.get_translation_languages()
+            if update_fields is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'translation_languages'}
 
         super(Event, self).save(*args, **kwargs)
 
         # needed to cache location event numbers
-        if not old_location and self.location:
-            Place.objects.filter(id=self.location.id).update(n_events_changed=True)
-        if old_location and not self.location:
+        if not old_location_id and self.location_id:
+            Place.objects.filter(id=self.location_id).update(n_events_changed=True)
+        if old_location_id and not self.location_id:
             # drafts (or imported events) may not always have location set
-            Place.objects.filter(id=old_location.id).update(n_events_changed=True)
-        if old_location and self.location and old_location != self.location:
-            Place.objects.filter(id__in=(old_location.id, self.location.id)).update(n_events_changed=True)
+            Place.objects.filter(id=old_location_id).update(n_events_changed=True)
+        if old_location_id and self.location_id and old_location_id != self.location_id:
+            Place.objects.filter(id__in=(old_location_id, self.location_id)).update(n_events_changed=True)
+
+    def get_translation_languages(self):
+        """
+        Return the languages the name or a description of the event has been translated to.
+        """
+        return [lang for lang in [lang[0].replace('-', '_') for lang in settings.LANGUAGES]
+                if any(getattr(self, '%s_%s' % (field, lang), None) is not None
+                       for field in self.TRANSLATED_CONTENT_FIELDS)]
 
     def __str__(self):
         name = ''
@@ -584,6 +809,31 @@ def keyword_added_or_removed(sender, model=None,
             instance.save(update_fields=("n_events_changed",))
 
 
+@receiver(m2m_changed, sender=Event.in_language.through)
+def in_language_changed(sender, instance=None, action=None, reverse=False, pk_set=None, **kwargs):
+    """
+    Keeps the in_language ids of events up to date
+    """
+    if reverse and action == 'pre_clear':
+        # the events of a cleared language are not known afterwards
+        instance._cleared_event_ids = list(Event.objects.filter(in_language=instance).values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # events were added to or removed from a language
+        if pk_set is None:
+            pk_set = getattr(instance, '_cleared_event_ids', ())
+        events = Event.objects.filter(pk__in=pk_set)
+    else:
+        events = [instance]
+    for event in events:
+        ids = sorted(event.in_language.values_list('id', flat=True))
+        if ids != event.in_language_ids:
+            event.in_language_ids = ids
+            Event.objects.filter(pk=event.pk).update(in_language_ids=ids)
+
+
 class Offer(models.Model, SimpleValueMixin):
     event = models.ForeignKey(Event, db_index=True, related_name='offers')
     price = models.CharField(verbose_name=_('Price'), blank=True, max_length=1000)
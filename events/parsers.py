@@ -1,6 +1,10 @@
 import json
+
+import cbor2
+import msgpack
 from events import renderers
-from rest_framework.parsers import JSONParser, ParseError, six
+from events.renderers.binary import expand_links
+from rest_framework.parsers import BaseParser, JSONParser, ParseError, six
 from events import utils
 from django.conf import settings
 
@@ -25,17 +29,26 @@ def rename_fields(dataz):
         return new_data
 
 
+def renamed_object(pairs):
+    """
+    json object_pairs_hook renaming the keys of each object as it is decoded, equivalent to rename_fields
+    """
+    return {utils.convert_from_camelcase(key): value for key, value in pairs}
+
+
 class CamelCaseJSONParser(JSONParser):
     def parse(self, stream, media_type=None, parser_context=None):
         parser_context = parser_context or {}
         if 'disable_camelcase' in parser_context['request'].query_params:
-            return super(CamelCaseJSONParser, self).parse(media_type,
-                                                          parser_context)
+            return super(CamelCaseJSONParser, self).parse(stream, media_type, parser_context)
         else:
             encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
             try:
-                data = stream.read().decode(encoding)
-                return rename_fields(json.loads(data))
+                data = stream.read()
+                # json decodes UTF-8 bytes directly
+                if encoding.lower().replace('-', '') != 'utf8':
+                    data = data.decode(encoding)
+                return json.loads(data, object_pairs_hook=renamed_object)
             except ValueError as exc:
                 raise ParseError('JSON parse error - %s' % six.text_type(exc))
 
@@ -43,3 +56,37 @@ class CamelCaseJSONParser(JSONParser):
 class JSONLDParser(CamelCaseJSONParser):
     media_type = 'application/ld+json'
     renderer_class = renderers.JSONLDRenderer
+
+
+class BinaryParser(BaseParser):
+    """
+    Base class of the parsers of the binary formats, which are handled like CamelCaseJSONParser handles JSON.
+    """
+    def decode(self, data):
+        raise NotImplementedError()
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        try:
+            data = expand_links(self.decode(stream.read()))
+        except Exception as exc:
+            raise ParseError('%s parse error - %s' % (self.renderer_class.format, six.text_type(exc)))
+        if 'request' in parser_context and 'disable_camelcase' in parser_context['request'].query_params:
+            return data
+        return rename_fields(data)
+
+
+class MessagePackParser(BinaryParser):
+    media_type = 'application/msgpack'
+    renderer_class = renderers.MessagePackRenderer
+
+    def decode(self, data):
+        return msgpack.unpackb(data, raw=False)
+
+
+class CBORParser(BinaryParser):
+    media_type = 'application/cbor'
+    renderer_class = renderers.CBORRenderer
+
+    def decode(self, data):
+        return cbor2.loads(data)
@@ -1,4 +1,5 @@
 from functools import reduce
+from django.db.models import Q
 from .models import PublicationStatus
 from django_orghierarchy.models import Organization
 
@@ -34,15 +35,52 @@ class UserModelPermissionMixin:
             return True
         return False
 
-    def get_editable_events(self, queryset):
-        """Get editable events queryset from given queryset for current user"""
-        # distinct is not needed here, as admin_orgs and memberships should not overlap
+    def get_editable_events(self, queryset, organization_ids=None):
+        """Get editable events queryset from given queryset for current user
+
+        :param organization_ids: the result of get_organization_ids(), if already computed
+        """
+        admin_ids, member_ids = organization_ids or self.get_organization_ids()
+        # the organization ids are literals, so the publisher index can be used for both conditions
+        return queryset.filter(
+            Q(publisher_id__in=admin_ids) |
+            Q(publication_status=PublicationStatus.DRAFT, publisher_id__in=member_ids)
+        )
+
+    def get_visible_events(self, queryset, organization_ids=None):
+        """Get public events and the events the current user can edit from given queryset
+
+        Same as get_editable_events(queryset) | queryset.filter(publication_status=PublicationStatus.PUBLIC),
+        but as a union of drafts and public events, which have separate indexes.
+
+        :param organization_ids: the result of get_organization_ids(), if already computed
+        """
+        admin_ids, member_ids = organization_ids or self.get_organization_ids()
+        # admins and members only differ in public events, which are visible to everyone
         return queryset.filter(
-            publisher__in=self.get_admin_organizations_and_descendants()
-        ) | queryset.filter(
-            publication_status=PublicationStatus.DRAFT, publisher__in=self.organization_memberships.all()
+            Q(publication_status=PublicationStatus.PUBLIC) |
+            Q(publication_status=PublicationStatus.DRAFT, publisher_id__in=admin_ids | member_ids)
         )
 
+    def get_organization_ids(self):
+        """Get the ids of the organizations whose events the current user can edit
+
+        :return: tuple of the ids of admin organizations and their descendants, and the ids of
+                 the organizations the user is a member of, whose drafts the user can edit
+        """
+        admin_ids = set()
+        admin_orgs = list(self.admin_organizations.select_related('replaced_by'))
+        if admin_orgs:
+            # descendants in a single query instead of a subquery per admin organization
+            descendants = Q()
+            for admin_org in admin_orgs:
+                for org in (admin_org, admin_org.replaced_by):
+                    if org is not None:
+                        descendants |= Q(tree_id=org.tree_id, lft__gte=org.lft, rght__lte=org.rght)
+            admin_ids = set(Organization.objects.filter(descendants).values_list('id', flat=True))
+        member_ids = set(self.organization_memberships.values_list('id', flat=True))
+        return admin_ids, member_ids
+
     def get_admin_tree_ids(self):
         # returns tree ids for all normal admin organizations and their replacements
         admin_queryset = self.admin_organizations.filter(internal_type='normal').select_related('replaced_by')
@@ -1,3 +1,5 @@
 # These are imported for package level imports elsewhere
 from events.renderers.json import JSONRenderer, JSONLDRenderer  # noqa
 from events.renderers.docx import DOCXRenderer  # noqa
+from events.renderers.binary import CBORRenderer, MessagePackRenderer  # noqa
+from events.renderers.ical import ICalendarRenderer  # noqa
@@ -0,0 +1,114 @@
+"""
+Binary renderers for service-to-service consumers. They carry the same data as the JSON-LD output.
+
+With the compact_links query parameter, @id links under the API root are made relative to it, and
+the root is given as the JSON-LD @base of the response, from which the parsers also resolve them.
+"""
+from collections import OrderedDict
+
+import cbor2
+import msgpack
+from rest_framework import renderers
+from rest_framework.reverse import reverse
+from rest_framework.utils.encoders import JSONEncoder
+
+COMPACT_LINKS_PARAM = 'compact_links'
+
+# same conversions as in the JSON output, e.g. for lazy translations and decimals
+_json_encoder = JSONEncoder()
+
+
+def compact_links(data, base):
+    """
+    Return the data with the @id links starting with base made relative to it.
+    """
+    if isinstance(data, dict):
+        compacted = OrderedDict()
+        for key, value in data.items():
+            if key == '@id' and isinstance(value, str) and value.startswith(base):
+                value = value[len(base):]
+            else:
+                value = compact_links(value, base)
+            compacted[key] = value
+        return compacted
+    if isinstance(data, (list, tuple)):
+        return [compact_links(value, base) for value in data]
+    return data
+
+
+def add_base(data, base):
+    """
+    Add the JSON-LD @base of compacted links to the top level context of the data.
+    """
+    context = data.get('@context')
+    if context is None:
+        data['@context'] = {'@base': base}
+    elif isinstance(context, list):
+        data['@context'] = context + [{'@base': base}]
+    else:
+        data['@context'] = [context, {'@base': base}]
+    return data
+
+
+def expand_links(data, base=None):
+    """
+    Return the data with relative @id links resolved against the @base of the top level context.
+    """
+    if base is None:
+        if not isinstance(data, dict):
+            return data
+        context = data.get('@context')
+        contexts = context if isinstance(context, list) else [context]
+        bases = [c['@base'] for c in contexts if isinstance(c, dict) and '@base' in c]
+        if not bases:
+            return data
+        base = bases[-1]
+    if isinstance(data, dict):
+        expanded = {}
+        for key, value in data.items():
+            if key == '@id' and isinstance(value, str) and '://' not in value and not value.startswith('/'):
+                value = base + value
+            else:
+                value = expand_links(value, base)
+            expanded[key] = value
+        return expanded
+    if isinstance(data, list):
+        return [expand_links(value, base) for value in data]
+    return data
+
+
+class BinaryRenderer(renderers.BaseRenderer):
+    charset = None
+    render_style = 'binary'
+
+    def encode(self, data):
+        raise NotImplementedError()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        request = (renderer_context or {}).get('request')
+        if request is not None and COMPACT_LINKS_PARAM in request.query_params and isinstance(data, dict):
+            base = reverse('api-root', request=request)
+            data = add_base(compact_links(data, base), base)
+        return self.encode(data)
+
+
+class MessagePackRenderer(BinaryRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+
+    def encode(self, data):
+        return msgpack.packb(data, use_bin_type=True, default=_json_encoder.default)
+
+
+class CBORRenderer(BinaryRenderer):
+    media_type = 'application/cbor'
+    format = 'cbor'
+
+    def encode(self, data):
+        return cbor2.dumps(data, default=self.encode_default)
+
+    @staticmethod
+    def encode_default(encoder, value):
+        encoder.encode(_json_encoder.default(value))
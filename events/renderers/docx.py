@@ -12,6 +12,8 @@ from events.utils import parse_time
 
 
 def get_any_language(dictionary, default='fi', language_codes=None):
+    if not dictionary:
+        return ''
     if not language_codes:
         # Default order for when a language isn't found.
         language_codes = [default, 'fi', 'sv', 'en']
@@ -75,16 +77,6 @@ class EventParser:
         }
 
 
-def group_by_location(events):
-    # We want to put events in the same location under the same headline,
-    # so we create a dictionary where the places are the keys and the events
-    # are the values.
-    events_by_location = collections.defaultdict(list)
-    for event in events:
-        events_by_location[event['location']].append(event)
-    return events_by_location
-
-
 class DateRange:
     # Getting these by changing localization doesn't seem to work,
     # ideally you would use start.strftime(short_date + ' %A') instead.
@@ -141,27 +133,106 @@ class DateRange:
         return hash(str(self.start) + str(self.end))
 
 
-def group_by_date(events):
-    # We want events on the same date to be under the same day headline,
-    # and events that span multiple dates to be under their own headlines.
-    events = sorted(events, key=lambda e: e['start_time'])
-
-    dates = collections.defaultdict(list)
+class DocumentBuilder:
+    """
+    Builds the document of the events of a location incrementally. The events must be added in start time
+    order, so only the events starting on the current date are kept for grouping them by their date ranges.
+    """
+    midnight = datetime.time(0, 0)
 
-    previous_daterange = None
-    for event in events:
+    def __init__(self, document, location, start=None, end=None):
+        self.document = document
+        self.location = location
+        self.start = start
+        self.end = end
+        self.event_parser = EventParser()
+        self.current_date = None
+        self.previous_daterange = None
+        self.dateranges = collections.OrderedDict()
+        self.start_date = None
+        self.end_date = None
+
+        document.add_heading(str(location), 0)
+        # The daterange of the entire document is known only after all the events have been added.
+        self.total_date_range_paragraph = document.add_paragraph()
+
+    def add_event(self, raw_event):
+        event = self.event_parser.parse_event(raw_event)
+        start_date = event['start_time'].date()
+        if start_date != self.current_date:
+            self.write_dateranges()
+            self.current_date = start_date
+
+        # We want events on the same date to be under the same day headline,
+        # and events that span multiple dates to be under their own headlines.
         date_range = DateRange(
-            event['start_time'].date(),
+            start_date,
             event['end_time'].date(),
-            previous=previous_daterange,
+            previous=self.previous_daterange,
         )
-        previous_daterange = date_range
+        self.previous_daterange = date_range
+        self.dateranges.setdefault(date_range, []).append(event)
+
+    def write_dateranges(self):
+        for daterange, events in self.dateranges.items():
+            self.document.add_heading(str(daterange), 1)
+
+            for event in events:
+                # This is here to prevent 00:00-00:00 from being shown.
+                start_time = event['start_time']
+                end_time = event['end_time']
+
+                if start_time.time() == end_time.time() == self.midnight:
+                    self.document.add_heading(event['name'], 2)
+                else:
+                    self.document.add_heading(
+                        '%s-%s %s' % (
+                            event['start_time'].strftime('%H:%M'),
+                            event['end_time'].strftime('%H:%M'),
+                            event['name'],
+                        ),
+                        2,
+                    )
+
+                self.document.add_paragraph(event['description'])
+                if event['price']:
+                    self.document.add_paragraph(event['price'])
+        self.dateranges.clear()
+
+    def finish(self):
+        self.write_dateranges()
 
-        dates[date_range].append(event)
+        # We need to get the daterange for the entire document, which is
+        # determined by either the query or the actual events.
+        if self.start is None:
+            self.start_date = self.event_parser.earliest_date
+        else:
+            self.start_date = parse_time(self.start, True)[0]
 
-    dates = collections.OrderedDict(sorted(dates.items()))
+        if self.end is None:
+            self.end_date = self.event_parser.latest_date
+        else:
+            self.end_date = parse_time(self.end, False)[0]
 
-    return dates
+        self.total_date_range_paragraph.text = str(DateRange(self.start_date, self.end_date))
+
+    def get_filename(self):
+        return '%s-%s-%s.docx' % (
+            slugify(self.location.name),
+            self.start_date.strftime('%Y%m%d'),
+            self.end_date.strftime('%Y%m%d'),
+        )
+
+
+def build_document(document, location, raw_events, start=None, end=None):
+    """
+    Add the raw events, in start time order, to the document and return the filename of the document.
+    """
+    builder = DocumentBuilder(document, location, start, end)
+    for raw_event in raw_events:
+        builder.add_event(raw_event)
+    builder.finish()
+    return builder.get_filename()
 
 
 class DOCXRenderer(renderers.BaseRenderer):
@@ -181,78 +252,23 @@ class DOCXRenderer(renderers.BaseRenderer):
 
     def render(self, data, media_type=None, renderer_context=None):
         document = self.get_document()
-        parsed_events = []
 
         query_params = renderer_context['request'].query_params
 
-        event_parser = EventParser()
         if type(data) is ReturnDict:
             # Support the single event endpoint just because we can
             data = [data]
 
-        first_location = data[0]['location']
-        for raw_event in data:
-            parsed_events.append(event_parser.parse_event(raw_event))
-
-        # This is here to allow for this to be expanded to include multiple
-        # locations in the future.
-        locations = group_by_location(parsed_events)
-
-        for location in locations:
-            locations[location] = group_by_date(locations[location])
-
-        # We need to get the daterange for the entire document, which is
-        # determined by either the query or the actual events.
-        start = query_params.get('start')
-        end = query_params.get('end')
-
-        if start is None:
-            query_start_date = event_parser.earliest_date
+        if isinstance(data, list):
+            location = data[0]['location']
+            raw_events = sorted(data, key=lambda raw_event: raw_event['start_time_obj'])
         else:
-            query_start_date = parse_time(start, True)[0]
+            # An export of the events of a location, fetched in start time order
+            location = data.location
+            raw_events = data
 
-        if end is None:
-            query_end_date = event_parser.latest_date
-        else:
-            query_end_date = parse_time(end, False)[0]
-
-        total_date_range = DateRange(query_start_date, query_end_date)
-
-        midnight = datetime.time(0, 0)
-        for location, dateranges in locations.items():
-            document.add_heading(str(location), 0)
-            document.add_paragraph(str(total_date_range))
-
-            for daterange, events in dateranges.items():
-                document.add_heading(str(daterange), 1)
-
-                for event in events:
-
-                    # This is here to prevent 00:00-00:00 from being shown.
-                    start_time = event['start_time']
-                    end_time = event['end_time']
-
-                    if start_time.time() == end_time.time() == midnight:
-                        document.add_heading(event['name'], 2)
-                    else:
-                        document.add_heading(
-                            '%s-%s %s' % (
-                                event['start_time'].strftime('%H:%M'),
-                                event['end_time'].strftime('%H:%M'),
-                                event['name'],
-                            ),
-                            2,
-                        )
-
-                    document.add_paragraph(event['description'])
-                    if event['price']:
-                        document.add_paragraph(event['price'])
-
-        filename = '%s-%s-%s.docx' % (
-            slugify(first_location.name),
-            query_start_date.strftime('%Y%m%d'),
-            query_end_date.strftime('%Y%m%d'),
-        )
+        filename = build_document(document, location, raw_events, query_params.get('start'),
+                                  query_params.get('end'))
 
         renderer_context['response']['Content-Disposition'] = (
             'attachment; filename=%s' % filename
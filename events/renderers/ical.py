@@ -0,0 +1,35 @@
+from icalendar import Calendar
+from rest_framework import renderers
+
+PRODID = '-//events.hel.fi//NONSGML Feeder//EN'
+
+
+def get_calendar():
+    cal = Calendar()
+    cal.add('version', '2.0')
+    cal.add('prodid', PRODID)
+    return cal
+
+
+def iter_calendar(vevents):
+    """
+    Yield the calendar containing the serialized VEVENTs in parts, for streaming.
+    """
+    header, footer = get_calendar().to_ical().split(b'END:VCALENDAR')
+    yield header
+    yield from vevents
+    yield b'END:VCALENDAR' + footer
+
+
+class ICalendarRenderer(renderers.BaseRenderer):
+    """
+    Renders an iterable of serialized VEVENTs as a calendar. Large event listings are instead streamed
+    with iter_calendar.
+    """
+    media_type = 'text/calendar'
+    format = 'ics'
+    charset = 'utf-8'
+    render_style = 'binary'
+
+    def render(self, data, media_type=None, renderer_context=None):
+        return b''.join(iter_calendar(data))
@@ -0,0 +1,92 @@
+"""
+HTML sanitization of event text fields, shared by the API and the importers.
+
+A Sanitizer keeps a configured bleach cleaner per thread instead of parsing the configuration on every call,
+returns text without markup characters as is, and memoizes the results for texts with markup, which repeat
+e.g. in the sub-events of recurring events.
+"""
+import threading
+from functools import lru_cache
+
+import bleach
+from django.conf import settings
+
+# text without these cannot contain markup, and bleach returns it unchanged
+MARKUP_CHARACTERS = ('<', '>', '&')
+
+
+class Sanitizer(object):
+    def __init__(self, tags=bleach.ALLOWED_TAGS, attributes=bleach.ALLOWED_ATTRIBUTES, strip=False,
+                 bare_ampersands=False, cache_size=1024):
+        """
+        :param tags: Allowed tags, other tags are escaped or stripped
+        :param attributes: Allowed attributes, as for bleach.clean
+        :param strip: Strip disallowed tags instead of escaping them
+        :param bare_ampersands: Unescape ampersands in the result, for plain text fields
+        :param cache_size: Maximum number of memoized results
+        """
+        self.tags = tags
+        self.attributes = attributes
+        self.strip = strip
+        self.bare_ampersands = bare_ampersands
+        # bleach cleaners are not thread-safe
+        self._local = threading.local()
+        self._clean_markup = lru_cache(maxsize=cache_size)(self._clean)
+
+    @property
+    def cleaner(self):
+        cleaner = getattr(self._local, 'cleaner', None)
+        if cleaner is None:
+            cleaner = self._local.cleaner = bleach.Cleaner(tags=self.tags, attributes=self.attributes,
+                                                           strip=self.strip)
+        return cleaner
+
+    def _clean(self, text):
+        text = self.cleaner.clean(text)
+        if self.bare_ampersands:
+            text = text.replace('&amp;', '&')
+        return text
+
+    def __call__(self, text):
+        if not text or not any(c in text for c in MARKUP_CHARACTERS):
+            return text
+        return self._clean_markup(text)
+
+    def cache_info(self):
+        return self._clean_markup.cache_info()
+
+
+@lru_cache(maxsize=None)
+def get_sanitizer(tags=tuple(bleach.ALLOWED_TAGS), strip=False, bare_ampersands=False):
+    """
+    Return the shared sanitizer with the given configuration, e.g. for the allowed tags of an importer.
+    """
+    return Sanitizer(tags=list(tags), strip=strip, bare_ampersands=bare_ampersands)
+
+
+def get_html_sanitizer():
+    """
+    Sanitizer of the fields that may contain HTML, e.g. event descriptions
+    """
+    return get_sanitizer(tuple(settings.BLEACH_ALLOWED_TAGS))
+
+
+def get_text_sanitizer():
+    """
+    Sanitizer of plain text fields, in which all tags are escaped but ampersands should be bare
+    """
+    return get_sanitizer(tuple(bleach.ALLOWED_TAGS), bare_ampersands=True)
+
+
+def clean_text_fields(data, allowed_html_fields=[]):
+    html_sanitizer = get_html_sanitizer()
+    text_sanitizer = get_text_sanitizer()
+    for k, v in data.items():
+        if isinstance(v, str):
+            # only specified fields may contain allowed tags
+            # check all languages and the default translation field too
+            if any(k.startswith(field_name) for field_name in allowed_html_fields):
+                data[k] = html_sanitizer(v)
+            else:
+                data[k] = text_sanitizer(v)
+    return data
@@ -7,6 +7,7 @@ class EventIndex(indexes.SearchIndex, indexes.Indexable):
     autosuggest = indexes.EdgeNgramField(model_attr='name')
     start_time = indexes.DateTimeField(model_attr='start_time', null=True)
     end_time = indexes.DateTimeField(model_attr='end_time', null=True)
+    divisions = indexes.MultiValueField(null=True)
 
     def get_updated_field(self):
         return 'last_modified_time'
@@ -14,6 +15,9 @@ class EventIndex(indexes.SearchIndex, indexes.Indexable):
     def get_model(self):
         return Event
 
+    def prepare_divisions(self, obj):
+        return obj.location.division_keys if obj.location else []
+
     def index_queryset(self, using=None):
         return super().index_queryset(using).filter(publication_status=PublicationStatus.PUBLIC, deleted=False)
 
@@ -28,6 +32,7 @@ class EventIndex(indexes.SearchIndex, indexes.Indexable):
 class PlaceIndex(indexes.SearchIndex, indexes.Indexable):
     text = indexes.CharField(document=True, use_template=True)
     autosuggest = indexes.EdgeNgramField(model_attr='name')
+    divisions = indexes.MultiValueField(model_attr='division_keys', null=True)
 
     def get_updated_field(self):
         return 'last_modified_time'
@@ -1,3 +1,28 @@
+from django.conf import settings
+from haystack.signals import RealtimeSignalProcessor
+
+from .api_key_cache import invalidate_api_keys
+from .api_pagination import invalidate_cached_counts_on_commit
+from .db_router import stick_to_primary
+
+# Fields that are not indexed, saving only these does not reindex the object
+UNINDEXED_FIELDS = {'n_events', 'n_events_changed'}
+
+# Models whose changes do not affect list counts
+UNCOUNTED_MODELS = {'exportinfo'}
+
+
+class UpdateFieldsSignalProcessor(RealtimeSignalProcessor):
+    """
+    Reindexes objects when they are saved, unless the save only updated unindexed fields.
+    """
+    def handle_save(self, sender, instance, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and not set(update_fields) - UNINDEXED_FIELDS:
+            return
+        super().handle_save(sender, instance, **kwargs)
+
+
 def organization_post_save(sender, instance, created, **kwargs):
     if not created and instance.replaced_by:
         new_org = instance.replaced_by
@@ -8,3 +33,34 @@ def organization_post_save(sender, instance, created, **kwargs):
 
         # update owned systems to new owner
         instance.owned_systems.update(owner=new_org)
+
+
+def invalidate_counts_on_write(sender, action=None, update_fields=None, **kwargs):
+    """
+    Invalidates the cached list counts when event data is saved, deleted or related, if counts are cached
+    """
+    if settings.PAGINATION_COUNT_STRATEGY != 'cached':
+        return
+    if sender._meta.app_label != 'events' or sender._meta.model_name in UNCOUNTED_MODELS:
+        return
+    if update_fields is not None and not set(update_fields) - UNINDEXED_FIELDS:
+        return
+    if action is not None and not action.startswith('post_'):
+        # pre_add etc. of m2m_changed
+        return
+    invalidate_cached_counts_on_commit()
+
+
+def invalidate_api_keys_on_write(sender, **kwargs):
+    """
+    Invalidates the cached API key credentials when a data source, e.g. its key or owner, an API key user or
+    an organization, e.g. the owner being replaced, changes
+    """
+    invalidate_api_keys()
+
+
+def stick_to_primary_on_write(sender, **kwargs):
+    """
+    Sends the rest of the reads of a request to the primary database after anything is written
+    """
+    stick_to_primary()
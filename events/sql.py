@@ -1,5 +1,43 @@
 from django.db import connection
 
+# The time range of an event, as indexed by events_event_time_range_idx (see migration 0065).
+# Queries must use this exact expression for the index to be used. Events without an end time
+# are instants at their start time.
+EVENT_TIME_RANGE = (
+    "tstzrange(events_event.start_time, "
+    "GREATEST(events_event.start_time, COALESCE(events_event.end_time, events_event.start_time)), '[]')"
+)
+
+
+def event_time_window_where(start=None, end=None):
+    """
+    Build a WHERE clause selecting the events within a time window. Equivalent to
+    (end_time > start OR start_time >= start) AND (end_time < end OR start_time <= end)
+    when start < end, but served by the GiST index of the event time range. When start == end, the window
+    range is empty, so the times must be compared separately instead.
+
+    :param start: window start, or None for no lower limit
+    :param end: window end, or None for no upper limit
+    :return: tuple of SQL clause and params, for QuerySet.extra()
+    """
+    # events ending exactly at the window start are not included, but events consisting of an instant there are
+    in_range = "(events_event.start_time IS NOT NULL AND %s && tstzrange(%%s, %%s, '(]'))" % EVENT_TIME_RANGE
+    clauses = [in_range]
+    params = [start, end]
+    if start:
+        clauses.append("events_event.start_time = %s")
+        params.append(start)
+    # drafts may not have a start time
+    no_start = ["events_event.start_time IS NULL"]
+    if start:
+        no_start.append("events_event.end_time > %s")
+        params.append(start)
+    if end:
+        no_start.append("events_event.end_time < %s")
+        params.append(end)
+    clauses.append("(%s)" % " AND ".join(no_start))
+    return "(%s)" % " OR ".join(clauses), params
+
 
 def count_events_for_keywords(keyword_ids=(), all=False):
     """
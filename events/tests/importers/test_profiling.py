@@ -0,0 +1,62 @@
+from django.test import SimpleTestCase
+
+from events.importer.profiling import get_profiler, ImportProfiler, profile_import, timed
+
+
+class Importer(object):
+    def _import_event(self, record):
+        return self.save(record)
+
+    @timed('save')
+    def save(self, record):
+        return record
+
+
+class TestProfiling(SimpleTestCase):
+
+    def test_nested_phases_are_timed_exclusively(self):
+        profiler = ImportProfiler()
+        with profiler.phase('parse'):
+            with profiler.phase('save'):
+                pass
+            with profiler.phase('save'):
+                pass
+        data = profiler.as_dict()
+        self.assertEqual(data['phases']['parse']['calls'], 1)
+        self.assertEqual(data['phases']['save']['calls'], 2)
+        self.assertLessEqual(data['phases']['parse']['seconds'] + data['phases']['save']['seconds'],
+                             data['seconds'])
+
+    def test_profiling_is_inactive_by_default(self):
+        self.assertFalse(get_profiler().active)
+        self.assertEqual(Importer().save(1), 1)
+
+    def test_profile_import_instruments_importer(self):
+        importer = Importer()
+        with profile_import() as profiler:
+            profiler.instrument_importer(importer)
+            self.assertIs(get_profiler(), profiler)
+            importer._import_event(1)
+            importer._import_event(2)
+        self.assertFalse(get_profiler().active)
+        # the instance is restored
+        self.assertNotIn('_import_event', importer.__dict__)
+        data = profiler.as_dict()
+        self.assertEqual(data['phases']['parse']['calls'], 2)
+        self.assertEqual(data['phases']['save']['calls'], 2)
+        self.assertIn('parse', profiler.format_text())
+
+    def test_merge_worker_profiles(self):
+        worker = ImportProfiler()
+        worker.count('deleted event', 2)
+        worker.queries['event'].update(count=2, total=10, max=7)
+        with worker.phase('save'):
+            pass
+        profiler = ImportProfiler()
+        profiler.queries['event'].update(count=1, total=3, max=3)
+        profiler.merge(worker.as_dict())
+        profiler.merge(worker.as_dict())
+        data = profiler.as_dict()
+        self.assertEqual(data['phases']['save']['calls'], 2)
+        self.assertEqual(data['counters'], {'deleted event': 4})
+        self.assertEqual(data['queries']['event'], {'count': 5, 'total': 23, 'max': 7, 'mean': 4.6})
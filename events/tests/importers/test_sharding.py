@@ -0,0 +1,71 @@
+from django.test import SimpleTestCase, TransactionTestCase
+
+from events.importer.sharding import partition, process_sharded, stable_shard, SyncherShard
+from events.importer.sync import ModelSyncher
+
+
+class Obj(object):
+    def __init__(self, origin_id):
+        self.origin_id = origin_id
+
+    def __str__(self):
+        return self.origin_id
+
+
+class TestSharding(SimpleTestCase):
+
+    def test_partition_is_stable(self):
+        records = [{'origin_id': str(i), 'super_event': str(i % 7)} for i in range(100)]
+        shards = partition(records, lambda r: r['super_event'], 4)
+        self.assertEqual(sum(len(shard) for shard in shards), 100)
+        for shard in shards:
+            self.assertEqual(len({stable_shard(r['super_event'], 4) for r in shard}), 1)
+            # the order of records within a shard is preserved
+            self.assertEqual(shard, sorted(shard, key=lambda r: int(r['origin_id'])))
+        self.assertEqual(shards, partition(records, lambda r: r['super_event'], 4))
+
+    def test_shard_marks_are_applied_to_syncher(self):
+        deleted = []
+        objs = [Obj(str(i)) for i in range(4)]
+        syncher = ModelSyncher(objs, lambda obj: obj.origin_id, delete_func=deleted.append)
+        shard = SyncherShard(syncher)
+        for obj in objs[:3]:
+            shard.mark(obj)
+        shard.mark(Obj('new'))
+        for obj_id in shard.marked:
+            syncher.mark_id(obj_id)
+        syncher.finish()
+        self.assertEqual(deleted, [objs[3]])
+
+    def test_small_runs_are_processed_in_process(self):
+        processed = []
+
+        class Importer(object):
+            pass
+
+        process_sharded(Importer(), range(10), processed.append, str, processes=4)
+        self.assertEqual(processed, list(range(10)))
+
+
+class ShardImporter(object):
+    organization = None
+    data_source = None
+
+    def __init__(self, objs, deleted):
+        self.syncher = ModelSyncher(objs, lambda obj: obj.origin_id, delete_func=deleted.append)
+
+    def process(self, obj):
+        self.syncher.mark(obj)
+
+
+class TestShardWorkers(TransactionTestCase):
+
+    def test_workers_process_several_shards(self):
+        deleted = []
+        objs = [Obj(str(i)) for i in range(200)]
+        importer = ShardImporter(objs, deleted)
+        # 2 processes get 8 shards between them
+        process_sharded(importer, objs[:190], importer.process, str, syncher_attr='syncher', processes=2)
+        self.assertIsInstance(importer.syncher, ModelSyncher)
+        importer.syncher.finish()
+        self.assertEqual(deleted, objs[190:])
@@ -1,7 +1,12 @@
+import multiprocessing
 from unittest.mock import MagicMock
 
+import cbor2
+import msgpack
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections, DatabaseError, transaction
 from django.test import TestCase
 from django_orghierarchy.models import Organization
 from rest_framework import status
@@ -9,8 +14,10 @@ from rest_framework.test import APITestCase
 
 from .utils import versioned_reverse as reverse
 from ..api import get_authenticated_data_source_and_publisher, EventSerializer, OrganizationSerializer
+from ..api_pagination import COUNT_GENERATION_KEY, invalidate_cached_counts
 from ..auth import ApiKeyAuth
-from ..models import DataSource, Image
+from ..models import DataSource, Event, Image
+from ..renderers.binary import expand_links
 
 
 @pytest.mark.django_db
@@ -32,6 +39,87 @@ def test_api_page_size(api_client, event):
     assert len(resp.data['data']) <= 100
 
 
+# counts are invalidated when the writing transaction commits
+@pytest.mark.django_db(transaction=True)
+def test_api_count_strategies(api_client, event, event2, settings):
+    url = reverse('event-list')
+    settings.PAGINATION_COUNT_STRATEGY = 'cached'
+    assert api_client.get(url + '?count=cached').data['meta']['count'] == 2
+
+    # updates do not send signals, so the cached count is used until the next save
+    Event.objects.filter(pk=event2.pk).update(deleted=True)
+    assert api_client.get(url + '?count=cached').data['meta']['count'] == 2
+    event.save()
+    assert api_client.get(url + '?count=cached').data['meta']['count'] == 1
+
+    settings.PAGINATION_COUNT_ESTIMATE_THRESHOLD = 0
+    meta = api_client.get(url + '?count=estimate').data['meta']
+    assert meta['count_approximate'] is True
+    assert 'count_approximate' not in api_client.get(url).data['meta']
+
+    # counts are not cached, as writes do not invalidate them, unless cached counts are configured
+    settings.PAGINATION_COUNT_STRATEGY = 'exact'
+    Event.objects.filter(pk=event2.pk).update(deleted=False)
+    assert api_client.get(url + '?count=cached').data['meta']['count'] == 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_cached_counts_are_invalidated_once_per_transaction(event, event2, settings):
+    settings.PAGINATION_COUNT_STRATEGY = 'cached'
+    cache.set(COUNT_GENERATION_KEY, 1, None)
+    with transaction.atomic():
+        event.save()
+        event2.save()
+        assert cache.get(COUNT_GENERATION_KEY) == 1
+    assert cache.get(COUNT_GENERATION_KEY) == 2
+
+    # a rolled back transaction does not invalidate them, and does not keep later ones from doing so
+    with pytest.raises(DatabaseError):
+        with transaction.atomic():
+            event.save()
+            raise DatabaseError()
+    assert cache.get(COUNT_GENERATION_KEY) == 2
+    event.save()
+    assert cache.get(COUNT_GENERATION_KEY) == 3
+
+
+@pytest.mark.django_db(transaction=True)
+def test_api_cached_counts_are_invalidated_by_other_processes(api_client, event, event2, settings, tmpdir):
+    # a cache shared by the processes
+    settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                   'LOCATION': str(tmpdir)}}
+    settings.PAGINATION_COUNT_STRATEGY = 'cached'
+    url = reverse('event-list')
+    assert api_client.get(url + '?count=cached').data['meta']['count'] == 2
+    Event.objects.filter(pk=event2.pk).update(deleted=True)
+    assert api_client.get(url + '?count=cached').data['meta']['count'] == 2
+
+    # e.g. an importer writing events, the forked process must not share the connection of the test
+    connections.close_all()
+    process = multiprocessing.get_context('fork').Process(target=invalidate_cached_counts)
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert api_client.get(url + '?count=cached').data['meta']['count'] == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('fmt, decode', [
+    ('msgpack', lambda content: msgpack.unpackb(content, raw=False)),
+    ('cbor', cbor2.loads),
+])
+def test_api_binary_formats(api_client, event, fmt, decode):
+    url = reverse('event-detail', kwargs={'pk': event.id})
+    json_data = api_client.get(url, {'format': 'json'}).json()
+    assert decode(api_client.get(url, {'format': fmt}).content) == json_data
+
+    data = decode(api_client.get(url, {'format': fmt, 'compact_links': 1}).content)
+    assert not data['@id'].startswith('http')
+    expanded = expand_links(data)
+    assert expanded['@id'] == json_data['@id']
+    assert expanded['location'] == json_data['location']
+
+
 @pytest.mark.django_db
 def test_get_authenticated_data_source_and_publisher(data_source):
     org = Organization.objects.create(
@@ -1,8 +1,12 @@
-from django.test import TestCase
+from django.db import connection
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
 from django_orghierarchy.models import Organization
+from rest_framework.exceptions import AuthenticationFailed
 
+from events.api_key_cache import invalidate_api_keys
 from events.models import DataSource
-from ..auth import ApiKeyUser
+from ..auth import ApiKeyAuthentication, ApiKeyUser
 
 
 class TestApiKeyUser(TestCase):
@@ -42,3 +46,62 @@ class TestApiKeyUser(TestCase):
 
         is_regular_user = self.user.is_regular_user(self.org_2)
         self.assertFalse(is_regular_user)
+
+
+class TestApiKeyAuthentication(TestCase):
+
+    def setUp(self):
+        invalidate_api_keys()
+        self.data_source = DataSource.objects.create(
+            id='ds',
+            name='data-source',
+            api_key='test_api_key',
+        )
+        self.organization = Organization.objects.create(
+            data_source=self.data_source,
+            origin_id='org-1',
+        )
+
+    def authenticate(self, api_key='test_api_key'):
+        request = RequestFactory().get('/', HTTP_APIKEY=api_key)
+        return ApiKeyAuthentication().authenticate(request)
+
+    def test_credentials_are_cached(self):
+        self.authenticate()
+        user, auth = self.authenticate()
+        with CaptureQueriesContext(connection) as queries:
+            cached_user, cached_auth = self.authenticate()
+        # only the generation is read from the shared cache, which may be in the database
+        self.assertFalse([query for query in queries
+                          if 'events_datasource' in query['sql'] or 'events_apikeyuser' in query['sql']])
+        self.assertEqual(cached_user, user)
+        self.assertEqual(cached_auth.get_authenticated_data_source(), self.data_source)
+
+    def test_owner_change_invalidates_cache(self):
+        self.authenticate()
+        self.data_source.owner = self.organization
+        self.data_source.save()
+        user, auth = self.authenticate()
+        self.assertTrue(user.is_admin(self.organization))
+
+    def test_owner_replacement_invalidates_cache(self):
+        self.data_source.owner = self.organization
+        self.data_source.save()
+        self.authenticate()
+        new_organization = Organization.objects.create(
+            data_source=self.data_source,
+            origin_id='org-2',
+        )
+        self.organization.replaced_by = new_organization
+        self.organization.save()
+        user, auth = self.authenticate()
+        self.assertEqual(user.get_default_organization().replaced_by, new_organization)
+
+    def test_key_change_invalidates_cache(self):
+        self.authenticate()
+        self.data_source.api_key = 'new_api_key'
+        self.data_source.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+        user, auth = self.authenticate('new_api_key')
+        self.assertEqual(auth.get_authenticated_data_source(), self.data_source)
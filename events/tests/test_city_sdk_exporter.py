@@ -0,0 +1,39 @@
+import pytest
+from django.contrib.contenttypes.models import ContentType
+
+from events.exporter import city_sdk
+from events.exporter.city_sdk import CitySDKExporter
+from events.models import Event, ExportInfo, Place
+
+
+@pytest.mark.django_db
+def test_city_sdk_dry_run_export(event, place, monkeypatch):
+    monkeypatch.setattr(city_sdk, 'DRY_RUN_MODE', True)
+    exporter = CitySDKExporter()
+    event_type = ContentType.objects.get_for_model(Event)
+
+    exporter.export_events()
+    assert ExportInfo.objects.filter(content_type=ContentType.objects.get_for_model(Place),
+                                     object_id=place.id).exists()
+    export_info = ExportInfo.objects.get(content_type=event_type, object_id=event.id)
+    assert export_info.target_id == 'foo'
+
+    # unmodified events are not sent again
+    exported_time = export_info.last_exported_time
+    exporter.export_events()
+    assert ExportInfo.objects.get(pk=export_info.pk).last_exported_time == exported_time
+
+    event.save()
+    exporter.export_events()
+    assert ExportInfo.objects.get(pk=export_info.pk).last_exported_time > exported_time
+
+    Event.objects.filter(pk=event.pk).delete()
+    exporter.export_events()
+    assert not ExportInfo.objects.filter(content_type=event_type).exists()
+
+
+def test_city_sdk_creating_requests_are_not_retried():
+    retry = CitySDKExporter.max_retries
+    assert retry.is_retry('POST', 502)
+    assert retry.is_retry('DELETE', 503)
+    assert not retry.is_retry('PUT', 502)
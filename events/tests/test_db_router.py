@@ -0,0 +1,114 @@
+import pytest
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.http import HttpResponse
+from django.test import RequestFactory
+
+from rest_framework.views import APIView
+
+from events import db_router
+from events.db_router import ReplicaMiddleware, ReplicaRouter, stick_to_primary, use_primary, use_replicas
+from events.models import Event
+
+
+def api_view(request):
+    return HttpResponse()
+
+
+api_view.cls = APIView
+
+
+@pytest.fixture
+def replicas(settings, monkeypatch):
+    settings.READ_REPLICAS = ['replica_1', 'replica_2']
+    lags = {'replica_1': 0.5, 'replica_2': 60.0}
+    monkeypatch.setattr(db_router, '_replica_lags', {})
+    monkeypatch.setattr(db_router, 'get_replica_lag', lambda alias: lags[alias])
+    cache.clear()
+    return lags
+
+
+@pytest.mark.django_db
+def test_safe_requests_read_from_available_replica(replicas):
+    router = ReplicaRouter()
+    middleware = ReplicaMiddleware()
+    request = RequestFactory().get('/v1/event/', HTTP_APIKEY='secret')
+    middleware.process_request(request)
+    middleware.process_view(request, api_view, (), {})
+    # the lagging replica is skipped
+    assert router.db_for_read(Event) == 'replica_1'
+    assert router.db_for_write(Event) == 'default'
+    middleware.process_response(request, HttpResponse())
+    assert router.db_for_read(Event) == 'default'
+
+
+@pytest.mark.django_db
+def test_unavailable_replicas_are_skipped(replicas, monkeypatch):
+    def fail(alias):
+        raise DatabaseError('connection refused')
+    monkeypatch.setattr(db_router, 'get_replica_lag', fail)
+    with use_replicas():
+        assert ReplicaRouter().db_for_read(Event) == 'default'
+
+
+@pytest.mark.django_db
+def test_writing_client_sticks_to_primary(replicas):
+    router = ReplicaRouter()
+    middleware = ReplicaMiddleware()
+    factory = RequestFactory()
+
+    request = factory.post('/v1/event/', HTTP_APIKEY='secret')
+    middleware.process_request(request)
+    middleware.process_view(request, api_view, (), {})
+    assert router.db_for_read(Event) == 'default'
+    middleware.process_response(request, HttpResponse(status=201))
+
+    request = factory.get('/v1/event/', HTTP_APIKEY='secret')
+    middleware.process_request(request)
+    middleware.process_view(request, api_view, (), {})
+    assert router.db_for_read(Event) == 'default'
+    middleware.process_response(request, HttpResponse())
+
+    # other clients are not affected
+    request = factory.get('/v1/event/')
+    middleware.process_request(request)
+    middleware.process_view(request, api_view, (), {})
+    assert router.db_for_read(Event) == 'replica_1'
+    middleware.process_response(request, HttpResponse())
+
+
+@pytest.mark.django_db
+def test_writes_of_safe_requests_stick_to_primary(replicas):
+    router = ReplicaRouter()
+    middleware = ReplicaMiddleware()
+    factory = RequestFactory()
+
+    request = factory.get('/v1/event/', HTTP_APIKEY='secret')
+    middleware.process_request(request)
+    middleware.process_view(request, api_view, (), {})
+    assert router.db_for_read(Event) == 'replica_1'
+    stick_to_primary()
+    assert router.db_for_read(Event) == 'default'
+    middleware.process_response(request, HttpResponse())
+
+    request = factory.get('/v1/event/', HTTP_APIKEY='secret')
+    middleware.process_request(request)
+    middleware.process_view(request, api_view, (), {})
+    assert router.db_for_read(Event) == 'default'
+    middleware.process_response(request, HttpResponse())
+
+
+@pytest.mark.django_db
+def test_other_views_and_authentication_read_from_primary(replicas):
+    router = ReplicaRouter()
+    middleware = ReplicaMiddleware()
+    request = RequestFactory().get('/admin/')
+    middleware.process_request(request)
+    middleware.process_view(request, lambda request: HttpResponse(), (), {})
+    assert router.db_for_read(Event) == 'default'
+    middleware.process_response(request, HttpResponse())
+
+    with use_replicas():
+        with use_primary():
+            assert router.db_for_read(Event) == 'default'
+        assert router.db_for_read(Event) == 'replica_1'
@@ -1,6 +1,15 @@
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
 import pytest
+from django.core.cache import cache
 from .utils import versioned_reverse as reverse
 
+from events import docx_export
+from events.docx_export import EventExport
+from events.models import Event, Offer
+
 
 @pytest.mark.django_db
 def test_docx_renderer(api_client, event, place):
@@ -15,3 +24,90 @@ def test_docx_renderer(api_client, event, place):
         )
     )
     assert response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_docx_renderer_multiple_locations(api_client, event, event2, place, place2):
+    response = api_client.get(
+        reverse('event-list') + '?format=docx&location=%s,%s' % (place.id, place2.id)
+    )
+    assert response.status_code == 400
+    assert 'Only one location allowed' in str(response.data)
+
+
+@pytest.mark.django_db
+def test_docx_export_chunks(event, place):
+    other_event = Event.objects.create(
+        id=event.id + '_2', location=place, data_source=event.data_source, publisher=event.publisher,
+        start_time=event.start_time - timedelta(days=1), end_time=event.end_time - timedelta(days=1),
+        name='toinen tapahtuma'
+    )
+    Offer.objects.create(event=event, price_fi='5 e')
+    Offer.objects.create(event=event, price_fi='10 e')
+
+    export = EventExport(Event.objects.all(), place, chunk_size=1)
+    raw_events = list(export)
+    assert [raw_event['start_time_obj'] for raw_event in raw_events] == [other_event.start_time, event.start_time]
+    assert raw_events[0]['offers'] == []
+    assert raw_events[1]['offers'] == [{'price': {'fi': '5 e'}}]
+    assert raw_events[1]['location'] == place
+
+
+class SynchronousThread:
+    def __init__(self, target, args, **kwargs):
+        self.target = target
+        self.args = args
+
+    def start(self):
+        self.target(*self.args)
+
+
+@pytest.mark.django_db
+def test_docx_background_export(api_client, user_api_client, user2, event, place, monkeypatch, settings, tmpdir):
+    settings.DOCX_EXPORT_ROOT = str(tmpdir)
+    monkeypatch.setattr(docx_export, 'threading', SimpleNamespace(Thread=SynchronousThread))
+    monkeypatch.setattr(docx_export, '_run_export_thread', docx_export.run_export_job)
+    url = reverse('event-list') + '?format=docx&background=1&location=%s' % place.id.replace(' ', '%20')
+
+    # anonymous users cannot read the results of background exports
+    assert api_client.get(url).status_code == 401
+
+    response = user_api_client.get(url)
+    assert response.status_code == 202
+    status_url = response.data['url']
+
+    response = user_api_client.get(status_url)
+    assert response.status_code == 200
+    assert response.data['status'] == 'done'
+    response = user_api_client.get(response.data['url'])
+    assert response.status_code == 200
+    assert response['Content-Disposition'].endswith('.docx')
+    assert b''.join(response.streaming_content).startswith(b'PK')
+
+    # other users cannot read the job
+    api_client.force_authenticate(user=user2)
+    assert api_client.get(status_url).status_code == 404
+
+
+def test_docx_expired_exports_are_deleted(settings, tmpdir):
+    settings.DOCX_EXPORT_ROOT = str(tmpdir)
+    expired = tmpdir.mkdir('expired')
+    expired.join('events.docx').write('')
+    expired.setmtime(time.time() - docx_export.EXPORT_JOB_TIMEOUT - 1)
+    tmpdir.mkdir('current').join('events.docx').write('')
+    docx_export.delete_expired_exports()
+    assert [path.basename for path in tmpdir.listdir()] == ['current']
+
+
+@pytest.mark.django_db
+def test_docx_stale_export_job_fails(user_api_client, user, monkeypatch):
+    # the thread of the job never runs, as if its worker had been killed
+    monkeypatch.setattr(docx_export, 'threading', SimpleNamespace(Thread=lambda **kwargs: SimpleNamespace(
+        start=lambda: None)))
+    job_id = docx_export.start_export_job(user.pk, None)
+    url = reverse('event-docx-export', kwargs={'job_id': job_id})
+    assert user_api_client.get(url).data['status'] == 'pending'
+
+    started = time.time() - docx_export.EXPORT_JOB_MAX_DURATION - 1
+    cache.set(docx_export.get_job_key(job_id), {'status': 'pending', 'owner': user.pk, 'started': started})
+    assert user_api_client.get(url).data['status'] == 'failed'
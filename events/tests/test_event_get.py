@@ -1,4 +1,8 @@
 # -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import pytz
 from .utils import versioned_reverse as reverse
 import pytest
 from .utils import get, assert_fields_exist
@@ -128,6 +132,24 @@ def test_get_event_list_verify_location_filter(api_client, place, event, event2)
     assert event2.id not in [entry['id'] for entry in response.data['data']]
 
 
+@pytest.mark.django_db
+def test_get_event_list_verify_dwithin_filter(api_client, place, event, event2, event3):
+    origin = place.position.transform(4326, clone=True)
+    origin_param = '%f,%f' % (origin.x, origin.y)
+
+    response = get_list(api_client, data={'dwithin_origin': origin_param, 'dwithin_metres': 10})
+    assert [entry['id'] for entry in response.data['data']] == [event.id]
+
+    # all events are listed, events without position last
+    response = get_list(api_client, data={'dwithin_origin': origin_param, 'sort': 'distance'})
+    ids = [entry['id'] for entry in response.data['data']]
+    assert ids[0] == event.id
+    assert set(ids) == {event.id, event2.id, event3.id}
+
+    response = api_client.get(reverse('event-list'), data={'dwithin_metres': 10}, format='json')
+    assert response.status_code == 400
+
+
 @pytest.mark.django_db
 def test_get_event_list_verify_keyword_filter(api_client, keyword, event):
     event.keywords.add(keyword)
@@ -137,6 +159,23 @@ def test_get_event_list_verify_keyword_filter(api_client, keyword, event):
     assert event.id not in [entry['id'] for entry in response.data['data']]
 
 
+@pytest.mark.django_db
+def test_get_event_list_verify_keyword_and_and_negative_filters(api_client, keyword, keyword2, event, event2):
+    event.keywords.add(keyword)
+    event.audience.add(keyword2)
+    event2.keywords.add(keyword2)
+
+    def get_ids(**params):
+        response = get_list(api_client, data=params)
+        return [entry['id'] for entry in response.data['data']]
+
+    # an event matching both keyword and audience is listed once
+    assert sorted(get_ids(keyword='%s,%s' % (keyword.id, keyword2.id))) == sorted([event.id, event2.id])
+    assert get_ids(keyword_AND='%s,%s' % (keyword.id, keyword2.id)) == [event.id]
+    assert get_ids(**{'keyword!': keyword.id}) == [event2.id]
+    assert get_ids(**{'keyword!': keyword2.id}) == []
+
+
 @pytest.mark.django_db
 def test_get_event_list_verify_division_filter(api_client, event, event2, event3, administrative_division,
                                                administrative_division2):
@@ -284,6 +323,48 @@ def test_language_filter(api_client, event, event2, event3):
     assert ids == {event3.id}
 
 
+@pytest.mark.django_db
+def test_event_list_time_window_filters(api_client, event, event2, event3):
+    day = datetime(2020, 2, 1, tzinfo=pytz.utc)
+    # an event ending at the window start, an instant at the window start and an event inside the window
+    for obj, start, end in ((event, day - timedelta(hours=2), day),
+                            (event2, day, day),
+                            (event3, day + timedelta(hours=1), day + timedelta(hours=3))):
+        obj.start_time = start
+        obj.end_time = end
+        obj.save()
+
+    def get_ids(**params):
+        response = get_list(api_client, data=params)
+        return {e['id'] for e in response.data['data']}
+
+    assert get_ids(start=day.isoformat()) == {event2.id, event3.id}
+    assert get_ids(end=day.isoformat()) == {event.id, event2.id}
+    assert get_ids(start=day.isoformat(), end=(day + timedelta(hours=1)).isoformat()) == {event2.id, event3.id}
+    assert get_ids(start=(day + timedelta(hours=4)).isoformat()) == set()
+    # events happening at an instant
+    now = day + timedelta(hours=2)
+    assert get_ids(start=now.isoformat(), end=now.isoformat()) == {event3.id}
+    assert get_ids(start=day.isoformat(), end=day.isoformat()) == {event2.id}
+
+
+@pytest.mark.django_db
+def test_event_list_duration_filters(api_client, event, event2, event3):
+    event2.end_time = event2.start_time + timedelta(hours=3)
+    event2.save()
+    event3.end_time = event3.start_time + timedelta(days=2)
+    event3.save(update_fields=['end_time'])
+    assert Event.objects.get(id=event3.id).duration == timedelta(days=2)
+
+    def get_ids(**params):
+        response = get_list(api_client, data=params)
+        return [e['id'] for e in response.data['data']]
+
+    assert set(get_ids(max_duration='1h')) == {event.id}
+    assert set(get_ids(min_duration='2h', max_duration='1d')) == {event2.id}
+    assert get_ids(sort='-duration') == [event3.id, event2.id, event.id]
+
+
 @pytest.mark.django_db
 def test_event_list_filters(api_client, event, event2):
     filters = (
@@ -340,3 +421,50 @@ def test_admin_user_filter(api_client, event, event2, user):
     ids = {e['id'] for e in response.data['data']}
     assert event.id in ids
     assert event2.id not in ids
+
+
+@pytest.mark.django_db
+def test_event_list_sparse_fieldsets(api_client, event):
+    response = get_list(api_client, data={'fields': 'name,start_time,keywords'})
+    entry = response.data['data'][0]
+    assert set(entry) == {'id', 'name', 'start_time', 'keywords', '@id', '@type'}
+    assert entry['id'] == event.id
+
+    response = get_list(api_client, data={'omit': 'description,short_description,offers'})
+    entry = response.data['data'][0]
+    assert 'name' in entry and 'location' in entry
+    assert not {'description', 'short_description', 'offers'} & set(entry)
+
+
+@pytest.mark.django_db
+def test_get_event_list_calendar(api_client, event, place):
+    url = reverse('event-list') + '?format=ics&location=%s' % place.id
+    response = api_client.get(url)
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/calendar')
+    body = b''.join(response.streaming_content)
+    assert body.startswith(b'BEGIN:VCALENDAR')
+    assert body.endswith(b'END:VCALENDAR\r\n')
+    assert b'UID:%s' % event.id.encode() in body
+    assert b'SUMMARY:tapahtuma' in body
+
+    # the serialized event is cached until the event is modified
+    with patch('events.ical.generate_vevent') as generate_vevent:
+        assert b''.join(api_client.get(url).streaming_content) == body
+        assert not generate_vevent.called
+    event.name = 'muutettu'
+    event.save()
+    assert b'SUMMARY:muutettu' in b''.join(api_client.get(url).streaming_content)
+    # the location name is included too
+    place.name_fi = 'Uusi paikka'
+    place.save()
+    assert b'LOCATION:Uusi paikka' in b''.join(api_client.get(url).streaming_content)
+
+
+@pytest.mark.django_db
+def test_get_event_list_calendar_requires_filter(api_client, event):
+    # a calendar of all the events in the database is not a feed anyone should poll
+    response = api_client.get(reverse('event-list') + '?format=ics')
+    assert response.status_code == 400
+    response = api_client.get(reverse('event-list') + '?format=ics&publisher=%s' % event.publisher_id)
+    assert response.status_code == 200
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from datetime import timedelta
 from copy import deepcopy
+from unittest.mock import patch
 
 import pytz
 from django.utils import timezone
@@ -8,6 +9,7 @@ from django.core.management import call_command
 
 import pytest
 
+from events.api import get_authenticated_data_source_and_publisher
 from events.auth import ApiKeyUser
 from .utils import versioned_reverse as reverse
 
@@ -586,6 +588,26 @@ def test_multiple_event_update(api_client, minimal_event_dict, user):
     assert event_names == {'updated_name', 'updated_name_2'}
 
 
+@pytest.mark.django_db
+def test_multiple_event_update_resolves_publisher_once(api_client, minimal_event_dict, user):
+    api_client.force_authenticate(user)
+    event_dicts = []
+    for i in range(3):
+        event_dict = deepcopy(minimal_event_dict)
+        event_dict['name']['fi'] = 'testing_%d' % i
+        event_dict['id'] = create_with_post(api_client, event_dict).data['id']
+        event_dict['name']['fi'] = 'updated_name_%d' % i
+        event_dicts.append(event_dict)
+
+    with patch('events.api.get_authenticated_data_source_and_publisher',
+               wraps=get_authenticated_data_source_and_publisher) as get_data_source_and_publisher:
+        response = api_client.put(reverse('event-list'), event_dicts, format='json')
+    assert response.status_code == 200
+    assert get_data_source_and_publisher.call_count == 1
+    assert set(Event.objects.values_list('name_fi', flat=True)) == {'updated_name_0', 'updated_name_1',
+                                                                     'updated_name_2'}
+
+
 @pytest.mark.django_db
 def test_multiple_event_update_with_incorrect_json(api_client, minimal_event_dict, organization, data_source):
     data_source.owner = organization
@@ -1,7 +1,15 @@
+from types import SimpleNamespace
+
 import pytest
+from django.db.models import Max
+from langdetect import DetectorFactory, detect
+from langdetect.lang_detect_exception import LangDetectException
 
-from events.importer.util import replace_location
-from events.models import Event
+from events.importer.language_detection import LanguageDetector
+from events.importer.profiling import profile_import
+from events.importer.sharding import merge_new_images
+from events.importer.util import detect_paragraph_languages, replace_location, separate_scripts
+from events.models import Event, Image, Place
 
 
 @pytest.mark.django_db
@@ -12,3 +20,81 @@ def test_replace_location_by_different_source(place, place2, other_data_source,
     replace_location(replace=place, by_source=other_data_source.id)
     updated_event = Event.objects.get(id=event.id)
     assert updated_event.location == place2
+
+
+def test_language_detector_matches_langdetect():
+    DetectorFactory.seed = 0
+    paragraphs = ['Tämä on suomenkielinen kappale tapahtumasta.',
+                  'This is an English paragraph about the event.',
+                  'Detta är ett svenskt stycke om evenemanget.',
+                  '',
+                  'Tämä on suomenkielinen kappale tapahtumasta.']
+    expected = []
+    for paragraph in paragraphs:
+        try:
+            expected.append(detect(paragraph))
+        except LangDetectException:
+            expected.append(None)
+    detector = LanguageDetector()
+    assert detector.detect_many(paragraphs) == expected
+    assert detector.misses == 4
+    assert [detector.detect(paragraph) for paragraph in paragraphs] == expected
+    assert detector.misses == 4
+
+
+def test_separate_scripts():
+    DetectorFactory.seed = 0
+    text = ('<p>Tämä on suomenkielinen kappale tapahtumasta.</p>'
+            '<p>This is an English paragraph about the event.</p>')
+    separated = separate_scripts(text, ['fi', 'en'], detector=LanguageDetector())
+    assert 'Tämä on suomenkielinen kappale tapahtumasta.' in separated['fi']
+    assert 'This is an English paragraph about the event.' in separated['en']
+    assert 'English' not in separated['fi']
+
+
+def test_detect_paragraph_languages_before_separating():
+    DetectorFactory.seed = 0
+    texts = ['<p>Tämä on suomenkielinen kappale tapahtumasta.</p>'
+             '<p>This is an English paragraph about the event.</p>',
+             'Detta är ett svenskt stycke om evenemanget.']
+    detector = LanguageDetector()
+    detect_paragraph_languages(texts, detector=detector)
+    misses = detector.misses
+    assert misses
+    separate_scripts(texts[0], ['fi', 'en'], detector=detector)
+    separate_scripts(texts[1], ['fi', 'sv'], detector=detector)
+    assert detector.misses == misses
+
+
+@pytest.mark.django_db
+def test_merge_new_images(event, event2, place, data_source, organization):
+    last_image_id = Image.objects.aggregate(Max('id'))['id__max'] or 0
+    url = 'http://example.com/image.jpg'
+    # two workers created the same image
+    first, second = [Image.objects.create(url=url, publisher=organization, data_source=data_source)
+                     for i in range(2)]
+    event.images.add(second)
+    event2.images.add(first, second)
+    place.image = second
+    place.save()
+
+    importer = SimpleNamespace(organization=organization, data_source=data_source, _images={})
+    merge_new_images(importer, last_image_id)
+    assert not Image.objects.filter(pk=second.pk).exists()
+    assert list(event.images.all()) == [first]
+    assert list(event2.images.all()) == [first]
+    assert Place.objects.get(pk=place.pk).image == first
+    assert importer._images == {url: first}
+
+
+def test_profile_language_detection():
+    DetectorFactory.seed = 0
+    text = ('<p>Tämä on suomenkielinen kappale tapahtumasta.</p>'
+            '<p>This is an English paragraph about the event.</p>')
+    with profile_import() as profiler:
+        separate_scripts(text, ['fi', 'en'])
+        separate_scripts(text, ['fi', 'en'])
+    data = profiler.as_dict()
+    assert data['phases']['detect']['calls'] == 2
+    # the second call only hits the cache of the shared detector
+    assert data['counters']['detect hits'] >= 2
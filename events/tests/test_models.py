@@ -1,8 +1,10 @@
+from datetime import timedelta
+
 from django.contrib.auth import get_user_model
 from django.test import TestCase
 from django_orghierarchy.models import Organization
 
-from ..models import DataSource, Event, Image, PublicationStatus
+from ..models import DataSource, Event, Image, Language, PublicationStatus
 
 
 class TestImage(TestCase):
@@ -119,3 +121,57 @@ class TestEvent(TestCase):
 
         can_be_edited = self.event_2.can_be_edited_by(self.user)
         self.assertTrue(can_be_edited)
+
+    def test_dirty_fields(self):
+        event = Event.objects.get(id='ds:event-1')
+        self.assertEqual(event.get_dirty_fields(), [])
+
+        event.publication_status = PublicationStatus.PUBLIC
+        self.assertEqual(event.get_dirty_fields(), ['publication_status'])
+
+        self.assertTrue(event.save_changed())
+        self.assertEqual(event.get_dirty_fields(), [])
+        event = Event.objects.get(id='ds:event-1')
+        self.assertEqual(event.publication_status, PublicationStatus.PUBLIC)
+
+    def test_save_changed_skips_unchanged(self):
+        event = Event.objects.get(id='ds:event-2')
+        last_modified_time = event.last_modified_time
+
+        with self.assertNumQueries(0):
+            self.assertFalse(event.save_changed())
+
+        self.assertTrue(event.save_changed(touch=True))
+        self.assertGreater(Event.objects.get(id='ds:event-2').last_modified_time, last_modified_time)
+
+    def test_languages_are_kept_up_to_date(self):
+        event = Event.objects.get(id='ds:event-1')
+        self.assertEqual(event.translation_languages, ['fi'])
+        self.assertEqual(event.in_language_ids, [])
+
+        event.short_description_sv = 'kort'
+        event.save_changed()
+        event.in_language.add(Language.objects.create(id='et'))
+        event = Event.objects.get(id='ds:event-1')
+        self.assertEqual(event.translation_languages, ['fi', 'sv'])
+        self.assertEqual(event.in_language_ids, ['et'])
+
+        event.in_language.clear()
+        self.assertEqual(Event.objects.get(id='ds:event-1').in_language_ids, [])
+
+        # clearing the events of a language
+        language = Language.objects.get(id='et')
+        event.in_language.add(language)
+        language.events.clear()
+        self.assertEqual(Event.objects.get(id='ds:event-1').in_language_ids, [])
+
+    def test_upcoming(self):
+        now = Event.now()
+        Event.objects.filter(id='ds:event-1').update(start_time=now - timedelta(days=1), end_time=now)
+        Event.objects.filter(id='ds:event-2').update(start_time=now + timedelta(days=1), end_time=None)
+        self.assertEqual(list(Event.objects.upcoming(now).values_list('id', flat=True)), ['ds:event-2'])
+        self.assertEqual(list(Event.objects.upcoming(now - timedelta(hours=1)).values_list('id', flat=True)),
+                         ['ds:event-2'])
+        Event.objects.filter(id='ds:event-1').update(publication_status=PublicationStatus.PUBLIC)
+        self.assertEqual(set(Event.objects.upcoming(now - timedelta(hours=1)).values_list('id', flat=True)),
+                         {'ds:event-1', 'ds:event-2'})
@@ -0,0 +1,35 @@
+import io
+import json
+from unittest.mock import MagicMock
+
+from django.test import SimpleTestCase
+
+from ..parsers import CamelCaseJSONParser, rename_fields
+
+
+class TestCamelCaseJSONParser(SimpleTestCase):
+
+    def parse(self, body, encoding='utf-8', query_params=None):
+        request = MagicMock(query_params=query_params or {})
+        context = {'request': request, 'encoding': encoding}
+        return CamelCaseJSONParser().parse(io.BytesIO(body), parser_context=context)
+
+    def test_keys_are_renamed_while_decoding(self):
+        data = [{
+            'startTime': '2020-01-01',
+            'offers': [{'isFree': True, 'infoUrl': {'fi': 'http://example.com'}}],
+            'superEvent': {'@id': 'http://example.com/event/1/'},
+            'name': {'fi': 'tapahtuma'},
+        }]
+        body = json.dumps(data).encode('utf-8')
+        parsed = self.parse(body)
+        self.assertEqual(parsed, rename_fields(data))
+        self.assertEqual(parsed[0]['offers'][0]['info_url'], {'fi': 'http://example.com'})
+
+    def test_other_encodings(self):
+        body = json.dumps({'locationExtraInfo': 'ä'}, ensure_ascii=False).encode('latin-1')
+        self.assertEqual(self.parse(body, encoding='latin-1'), {'location_extra_info': 'ä'})
+
+    def test_disable_camelcase(self):
+        body = json.dumps({'startTime': None}).encode('utf-8')
+        self.assertEqual(self.parse(body, query_params={'disable_camelcase': ''}), {'startTime': None})
@@ -133,3 +133,43 @@ class TestUserModelPermissions(TestCase):
         self.instance.organization_memberships.remove(self.org)
         qs = self.instance.get_editable_events(total_qs)
         self.assertQuerysetEqual(qs, [])
+
+    def test_get_visible_events(self):
+        other_org = Organization.objects.create(
+            name='other-org',
+            origin_id='other-org',
+            data_source=self.data_source,
+        )
+        public_event = Event.objects.create(
+            id='event-1',
+            name='event-1',
+            data_source=self.data_source,
+            publisher=other_org,
+            publication_status=PublicationStatus.PUBLIC,
+        )
+        suborg_draft = Event.objects.create(
+            id='event-2',
+            name='event-2',
+            data_source=self.data_source,
+            publisher=self.org2,
+            publication_status=PublicationStatus.DRAFT,
+        )
+        Event.objects.create(
+            id='event-3',
+            name='event-3',
+            data_source=self.data_source,
+            publisher=other_org,
+            publication_status=PublicationStatus.DRAFT,
+        )
+
+        total_qs = Event.objects.all()
+        self.instance.admin_organizations.add(self.org)
+        self.assertEqual(self.instance.get_organization_ids(), ({self.org.id, self.org2.id}, set()))
+        qs = self.instance.get_visible_events(total_qs)
+        self.assertQuerysetEqual(qs, [repr(public_event), repr(suborg_draft)], ordered=False)
+
+        # regular users only see the drafts of their own organizations
+        self.instance.admin_organizations.remove(self.org)
+        self.instance.organization_memberships.add(self.org)
+        qs = self.instance.get_visible_events(total_qs)
+        self.assertQuerysetEqual(qs, [repr(public_event)])
@@ -38,3 +38,21 @@ def test_place_divisions_by_division_type(place, division_type, is_division_expe
         assert place.divisions.first() == administrative_division
     else:
         assert place.divisions.count() == 0
+
+
+@pytest.mark.django_db
+def test_place_division_keys_follow_deleted_and_cleared_divisions(place, administrative_division,
+                                                                  administrative_division2):
+    place.position = Point(150, 150)
+    place.save()
+    assert 'ocd-division/test:1' in place.division_keys
+    assert 'ocd-division/test:2' in place.division_keys
+
+    administrative_division.delete()
+    place.refresh_from_db()
+    assert 'ocd-division/test:1' not in place.division_keys
+    assert 'ocd-division/test:2' in place.division_keys
+
+    administrative_division2.places.clear()
+    place.refresh_from_db()
+    assert place.division_keys == []
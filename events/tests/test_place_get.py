@@ -85,6 +85,16 @@ def test_get_place_list_verify_division_filter(api_client, place, place2, place3
     assert place.id in ids
     assert place2.id in ids
 
+    # filter using a name, in any case
+    response = get_list(api_client, data={'show_all_places': 1, 'division': 'Test Division 2'})
+    assert [entry['id'] for entry in response.data['data']] == [place2.id]
+
+    # renaming the division updates the places
+    administrative_division2.name_en = 'renamed division'
+    administrative_division2.save()
+    response = get_list(api_client, data={'show_all_places': 1, 'division': 'renamed division'})
+    assert [entry['id'] for entry in response.data['data']] == [place2.id]
+
 
 @pytest.mark.django_db
 def test_get_place_list_check_division(api_client, place, administrative_division, municipality):
@@ -0,0 +1,30 @@
+from django.test import SimpleTestCase
+
+from ..sanitization import Sanitizer, clean_text_fields, get_sanitizer
+
+
+class TestSanitization(SimpleTestCase):
+
+    def test_clean_text_fields(self):
+        data = {
+            'description_fi': '<p>Kuvaus <script>alert(1)</script></p>',
+            'name_fi': 'Rock & <b>roll</b>',
+            'info_url': 'http://example.com/?a=1&b=2',
+            'audience_min_age': 7,
+        }
+        cleaned = clean_text_fields(dict(data), allowed_html_fields=['description'])
+        self.assertEqual(cleaned['description_fi'], '<p>Kuvaus &lt;script&gt;alert(1)&lt;/script&gt;</p>')
+        self.assertEqual(cleaned['name_fi'], 'Rock & <b>roll</b>')
+        self.assertEqual(cleaned['info_url'], 'http://example.com/?a=1&b=2')
+        self.assertEqual(cleaned['audience_min_age'], 7)
+
+    def test_results_are_memoized(self):
+        sanitizer = Sanitizer(tags=['p'], strip=True)
+        self.assertEqual(sanitizer('plain text'), 'plain text')
+        self.assertEqual(sanitizer.cache_info().currsize, 0)
+        for i in range(3):
+            self.assertEqual(sanitizer('<p><em>text</em></p>'), '<p>text</p>')
+        self.assertEqual(sanitizer.cache_info().hits, 2)
+
+    def test_shared_sanitizers(self):
+        self.assertIs(get_sanitizer(('p', 'br'), strip=True), get_sanitizer(('p', 'br'), strip=True))
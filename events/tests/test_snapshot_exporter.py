@@ -0,0 +1,40 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from events.exporter.snapshot import SnapshotExporter, get_checksum
+
+
+def read_ndjson(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.django_db
+def test_snapshot_export(event, event2, place, keyword, tmpdir):
+    output = str(tmpdir)
+    options = {'output': output, 'base_url': 'http://localhost', 'chunk_size': 1}
+    SnapshotExporter(options).export_events()
+
+    with open(os.path.join(output, 'manifest.json')) as f:
+        manifest = json.load(f)
+    assert manifest['counts']['event'] == 2
+    assert len(manifest['ranges']['event']) == 2
+    events = []
+    for name, entry in manifest['files'].items():
+        path = os.path.join(output, name)
+        assert entry['sha256'] == get_checksum(path)
+        if entry['resource'] == 'event':
+            events.extend(read_ndjson(path))
+    assert sorted(e['id'] for e in events) == sorted([event.id, event2.id])
+    assert events[0]['@id'].startswith('http://localhost/v1/event/')
+
+    # resuming exports only the missing files
+    missing = sorted(manifest['files'])[0]
+    os.remove(os.path.join(output, missing))
+    SnapshotExporter(dict(options, resume=True)).export_events()
+    with open(os.path.join(output, 'manifest.json')) as f:
+        resumed = json.load(f)
+    assert resumed['files'] == manifest['files']
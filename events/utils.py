@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 import re
 import collections
+import functools
 
 import pytz
 from django.db import transaction
@@ -17,9 +18,17 @@ def convert_to_camelcase(s):
         s.split('_')))
 
 
+CAMELCASE_RE = re.compile(r'(^|[a-z])([A-Z])')
+
+
+def _camelcase_replacement(m):
+    return '_'.join([i.lower() for i in m.groups() if i])
+
+
+# API payloads use a small set of keys over and over, so their conversions are cached
+@functools.lru_cache(maxsize=4096)
 def convert_from_camelcase(s):
-    return re.sub(r'(^|[a-z])([A-Z])',
-                  lambda m: '_'.join([i.lower() for i in m.groups() if i]), s)
+    return CAMELCASE_RE.sub(_camelcase_replacement, s)
 
 
 def get_value_from_tuple_list(list_of_tuples, search_key, value_index):
@@ -48,6 +48,7 @@ env = environ.Env(
     ADMINS=(list, []),
     SECURE_PROXY_SSL_HEADER=(tuple, None),
     MEDIA_ROOT=(environ.Path(), root('media')),
+    DOCX_EXPORT_ROOT=(environ.Path(), root('docx_exports')),
     STATIC_ROOT=(environ.Path(), root('static')),
     MEDIA_URL=(str, '/media/'),
     STATIC_URL=(str, '/static/'),
@@ -58,6 +59,10 @@ env = environ.Env(
     INSTANCE_NAME=(str, 'Linked Events'),
     EXTRA_INSTALLED_APPS=(list, []),
     AUTO_ENABLED_EXTENSIONS=(list, []),
+    PAGINATION_COUNT_STRATEGY=(str, 'exact'),
+    CACHE_URL=(str, 'locmemcache://'),
+    ICAL_CACHE_URL=(str, 'locmemcache://'),
+    READ_REPLICA_URLS=(list, []),
 )
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
@@ -82,6 +87,35 @@ DATABASES = {
     'default': env.db()
 }
 
+# read replicas of the default database, used by safe API requests and exports (see events.db_router)
+READ_REPLICAS = []
+for i, url in enumerate(env('READ_REPLICA_URLS')):
+    alias = 'replica_%d' % (i + 1)
+    DATABASES[alias] = env.db_url_config(url)
+    # tests run against the default database only
+    DATABASES[alias]['TEST'] = {'MIRROR': 'default'}
+    READ_REPLICAS.append(alias)
+if READ_REPLICAS:
+    DATABASE_ROUTERS = ['events.db_router.ReplicaRouter']
+
+# Several processes must share the cache, as writes invalidate cached API keys and counts etc. through it,
+# e.g. memcached (memcache://127.0.0.1:11211) or a database cache (dbcache://linkedevents_cache, which needs
+# "manage.py createcachetable"). The default local memory cache is only suitable for a single process.
+CACHES = {
+    'default': env.cache('CACHE_URL'),
+    # serialized iCalendar events, an entry for each version of each event in each language (see events.ical)
+    'ical': env.cache('ICAL_CACHE_URL'),
+}
+# database and file caches count their entries on every write, which would make serving feeds expensive
+if CACHES['ical']['BACKEND'].rsplit('.', 1)[-1] in ('DatabaseCache', 'FileBasedCache'):
+    raise ImproperlyConfigured("ICAL_CACHE_URL must be a memory cache, e.g. memcache://127.0.0.1:11211")
+# the process local default would otherwise keep only 300 events
+if CACHES['ical']['BACKEND'].endswith('LocMemCache'):
+    CACHES['ical'].setdefault('OPTIONS', {}).setdefault('MAX_ENTRIES', 10000)
+# clients that wrote are pinned to the primary through the cache, so every process must see the pins
+if READ_REPLICAS and CACHES['default']['BACKEND'].endswith('LocMemCache'):
+    raise ImproperlyConfigured("READ_REPLICA_URLS requires a CACHE_URL shared by all processes")
+
 SYSTEM_DATA_SOURCE_ID = env('SYSTEM_DATA_SOURCE_ID')
 
 SITE_ID = 1
@@ -162,6 +196,7 @@ if env('SENTRY_DSN'):
 
 MIDDLEWARE_CLASSES = [
     'corsheaders.middleware.CorsMiddleware',
+    'events.db_router.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -209,6 +244,8 @@ STATIC_URL = env('STATIC_URL')
 MEDIA_URL = env('MEDIA_URL')
 STATIC_ROOT = env('STATIC_ROOT')
 MEDIA_ROOT = env('MEDIA_ROOT')
+# results of background DOCX exports, shared by the web servers but not served publicly (see events.docx_export)
+DOCX_EXPORT_ROOT = env('DOCX_EXPORT_ROOT')
 
 #
 # Authentication
@@ -236,11 +273,15 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'events.renderers.JSONRenderer',
         'events.renderers.JSONLDRenderer',
+        'events.renderers.MessagePackRenderer',
+        'events.renderers.CBORRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'DEFAULT_PARSER_CLASSES': (
         'events.parsers.CamelCaseJSONParser',
         'events.parsers.JSONLDParser',
+        'events.parsers.MessagePackParser',
+        'events.parsers.CBORParser',
         'rest_framework.parsers.FormParser',
         'rest_framework.parsers.MultiPartParser',
     ),
@@ -253,11 +294,25 @@ REST_FRAMEWORK = {
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'events.auth.ApiKeyAuthentication',
-        'helusers.jwt.JWTAuthentication',
+        'events.auth.JWTAuthentication',
     ),
     'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
     'VIEW_NAME_FUNCTION': 'events.api.get_view_name',
 }
+# How list responses count their results by default: exact, cached or estimate (see events.api_pagination)
+PAGINATION_COUNT_STRATEGY = env('PAGINATION_COUNT_STRATEGY')
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+# estimated counts are only reported for results larger than this
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = 10000
+# seconds the data sources and users of API keys are cached in each process (see events.api_key_cache)
+API_KEY_CACHE_TIMEOUT = 60
+# replicas lagging more seconds behind the primary are not read from, and their lag is checked at most
+# every READ_REPLICA_LAG_CHECK_INTERVAL seconds in each process
+READ_REPLICA_MAX_LAG = 5
+READ_REPLICA_LAG_CHECK_INTERVAL = 5
+# seconds the requests of a client read from the primary after it has made an unsafe request
+READ_REPLICA_PRIMARY_PIN_TIMEOUT = 10
+
 JWT_AUTH = {
     'JWT_PAYLOAD_GET_USER_ID_HANDLER': 'helusers.jwt.get_user_id_from_payload_handler',
     'JWT_AUDIENCE': env('TOKEN_AUTH_ACCEPTED_AUDIENCE'),
@@ -350,7 +405,7 @@ def dummy_haystack_connection_for_lang(language_code):
             }
 
 
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+HAYSTACK_SIGNAL_PROCESSOR = 'events.signals.UpdateFieldsSignalProcessor'
 
 CUSTOM_MAPPINGS = {
     'autosuggest': {
@@ -360,7 +415,11 @@ CUSTOM_MAPPINGS = {
     },
     'text': {
         'analyzer': 'default'
-    }
+    },
+    # division ocd ids and names are matched exactly
+    'divisions': {
+        'index': 'not_analyzed'
+    },
 }
 
 HAYSTACK_CONNECTIONS = {